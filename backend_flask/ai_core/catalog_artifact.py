@@ -0,0 +1,217 @@
+# backend_flask/ai_core/catalog_artifact.py
+import hashlib
+import json
+import os
+import shutil
+import struct
+from collections.abc import Sequence
+from functools import lru_cache
+import numpy as np
+
+from .keyword_index import KeywordIndex
+from .catalog_snapshot import catalog_file_stamp
+
+# A catalog artifact is built offline (build_catalog_artifact.py) and loaded at startup in place of the catalog JSON,
+# so workers neither parse JSON nor embed images. It is a directory next to the catalog JSON:
+#   meta.json        format version, ViT model, source catalog and product image stamps and digests, catalog version,
+#                    column schema
+#   columns.npz      one column per product field (strings as a UTF-8 blob plus offsets, lists of strings with a
+#                    second level of offsets, anything else as JSON text), plus product_ids and embedding_positions
+#   embeddings.f32   a 64-byte header (magic, format version, rows, dim) followed by L2-normalized little-endian
+#                    float32 rows, one per embedded product, memory-mapped at load time
+#   keywords/        keyword index
+CATALOG_ARTIFACT_FORMAT_VERSION = 1
+EMBEDDING_BLOCK_MAGIC = b"SSEMBF32"
+EMBEDDING_BLOCK_HEADER = struct.Struct("<8sIIQQ") # magic, format version, reserved, rows, dim
+EMBEDDING_BLOCK_HEADER_SIZE = 64
+# Decoded products kept per process; recommendations only touch a few hundred products per request
+ARTIFACT_PRODUCT_CACHE_SIZE = 4096
+
+_MISSING = object()
+
+def get_artifact_dir(catalog_file_path):
+    base_path, _ = os.path.splitext(catalog_file_path)
+    return f"{base_path}.columnar"
+
+def compute_source_digest(catalog_bytes):
+    return hashlib.blake2b(catalog_bytes, digest_size=16).hexdigest()
+
+def artifact_matches_source(meta, catalog_file_path):
+    """
+    True if the artifact was built from the catalog JSON currently on disk (same size and modification time, or
+    failing that the same contents), or if there is no catalog JSON and the artifact is deployed on its own.
+    """
+    source = meta.get("source", {})
+    try:
+        stamp = catalog_file_stamp(catalog_file_path)
+    except FileNotFoundError:
+        return True
+    if stamp["size"] != source.get("size"):
+        return False
+    if stamp["mtime_ns"] == source.get("mtime_ns"):
+        return True
+    # Same size but touched (e.g. a fresh checkout): compare contents, which still skips parsing
+    with open(catalog_file_path, "rb") as f:
+        return compute_source_digest(f.read()) == source.get("digest")
+
+# --- Columns ---
+def _encode_strings(values):
+    """UTF-8 blob and (n + 1,) offsets for a list of strings."""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _column_kind(values):
+    present = [value for value in values if value is not _MISSING]
+    if all(isinstance(value, str) for value in present):
+        return "str"
+    if all(isinstance(value, list) and all(isinstance(item, str) for item in value) for value in present):
+        return "str_list"
+    return "json"
+
+def _encode_columns(products):
+    """Column schema and arrays for a list of product dicts (field order follows first appearance)."""
+    names = list(dict.fromkeys(name for product in products for name in product))
+    schema, arrays = [], {}
+    for number, name in enumerate(names):
+        prefix = f"c{number}"
+        values = [product.get(name, _MISSING) for product in products]
+        kind = _column_kind(values)
+        present = np.array([value is not _MISSING for value in values], dtype=bool)
+        if kind == "str":
+            arrays[f"{prefix}_data"], arrays[f"{prefix}_offsets"] = _encode_strings([value if value is not _MISSING else "" for value in values])
+        elif kind == "str_list":
+            lists = [value if value is not _MISSING else [] for value in values]
+            arrays[f"{prefix}_data"], arrays[f"{prefix}_offsets"] = _encode_strings([item for value in lists for item in value])
+            arrays[f"{prefix}_lists"] = np.zeros(len(lists) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in lists], out=arrays[f"{prefix}_lists"][1:])
+        else:
+            arrays[f"{prefix}_data"], arrays[f"{prefix}_offsets"] = _encode_strings(
+                [json.dumps(value, ensure_ascii=False) if value is not _MISSING else "" for value in values])
+        optional = not present.all()
+        if optional:
+            arrays[f"{prefix}_present"] = present
+        schema.append({"name": name, "kind": kind, "key": prefix, "optional": bool(optional)})
+    return schema, arrays
+
+class _Column:
+    """One decoded-on-demand product field."""
+
+    def __init__(self, spec, arrays):
+        self.name = spec["name"]
+        self.kind = spec["kind"]
+        key = spec["key"]
+        self.data = arrays[f"{key}_data"].tobytes()
+        self.offsets = arrays[f"{key}_offsets"].tolist()
+        self.lists = arrays[f"{key}_lists"].tolist() if self.kind == "str_list" else None
+        self.present = arrays[f"{key}_present"] if spec.get("optional") else None
+
+    def _string(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].decode("utf-8")
+
+    def value(self, position):
+        if self.kind == "str":
+            return self._string(position)
+        if self.kind == "str_list":
+            return [self._string(index) for index in range(self.lists[position], self.lists[position + 1])]
+        return json.loads(self._string(position))
+
+class ColumnarProductList(Sequence):
+    """
+    Read-only list of product dicts backed by the artifact's columns.
+    Products are assembled on access, and every access returns a fresh dict that callers may modify.
+    """
+
+    def __init__(self, schema, arrays, count):
+        self.columns = [_Column(spec, arrays) for spec in schema]
+        self.count = count
+        self._decode = lru_cache(maxsize=ARTIFACT_PRODUCT_CACHE_SIZE)(self._decode_product)
+
+    def __len__(self):
+        return self.count
+
+    def _decode_product(self, position):
+        return {column.name: column.value(position) for column in self.columns
+                if column.present is None or column.present[position]}
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("product position out of range")
+        return dict(self._decode(int(position)))
+
+# --- Embedding block ---
+def write_embedding_block(path, matrix):
+    matrix = np.ascontiguousarray(matrix, dtype="<f4")
+    rows, dim = matrix.shape
+    header = EMBEDDING_BLOCK_HEADER.pack(EMBEDDING_BLOCK_MAGIC, CATALOG_ARTIFACT_FORMAT_VERSION, 0, rows, dim)
+    with open(path, "wb") as f:
+        f.write(header.ljust(EMBEDDING_BLOCK_HEADER_SIZE, b"\0"))
+        f.write(matrix.tobytes())
+
+def read_embedding_block(path, mmap_mode=None):
+    """Returns the (rows, dim) float32 matrix of an embedding block, memory-mapped if `mmap_mode` is given."""
+    with open(path, "rb") as f:
+        header = f.read(EMBEDDING_BLOCK_HEADER_SIZE)
+    if len(header) != EMBEDDING_BLOCK_HEADER_SIZE:
+        raise ValueError(f"{path} is too short for an embedding block header")
+    magic, version, _, rows, dim = EMBEDDING_BLOCK_HEADER.unpack_from(header)
+    if magic != EMBEDDING_BLOCK_MAGIC or version != CATALOG_ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {CATALOG_ARTIFACT_FORMAT_VERSION} embedding block")
+    if os.path.getsize(path) != EMBEDDING_BLOCK_HEADER_SIZE + rows * dim * 4:
+        raise ValueError(f"{path} is truncated")
+    if rows == 0 or dim == 0:
+        return np.empty((rows, dim), dtype=np.float32)
+    if mmap_mode:
+        return np.memmap(path, dtype="<f4", mode=mmap_mode, offset=EMBEDDING_BLOCK_HEADER_SIZE, shape=(rows, dim))
+    return np.fromfile(path, dtype="<f4", offset=EMBEDDING_BLOCK_HEADER_SIZE).reshape(rows, dim)
+
+# --- Artifact ---
+def read_artifact_meta(artifact_dir):
+    """Returns the artifact's meta.json contents, or None if there is no complete artifact of this format."""
+    try:
+        with open(os.path.join(artifact_dir, "meta.json"), "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("format_version") == CATALOG_ARTIFACT_FORMAT_VERSION else None
+
+def write_catalog_artifact(artifact_dir, meta, products, embedding_positions, embedding_matrix, keyword_index):
+    """Writes a complete artifact into a temporary directory and then swaps it into place."""
+    tmp_dir = f"{artifact_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    schema, arrays = _encode_columns(products)
+    arrays["product_ids"] = np.array([str(product.get("id")) for product in products], dtype=str)
+    arrays["embedding_positions"] = np.asarray(embedding_positions, dtype=np.int64)
+    np.savez(os.path.join(tmp_dir, "columns.npz"), **arrays)
+    write_embedding_block(os.path.join(tmp_dir, "embeddings.f32"), embedding_matrix)
+    keyword_index.save(os.path.join(tmp_dir, "keywords"))
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(dict(meta, format_version=CATALOG_ARTIFACT_FORMAT_VERSION, product_count=len(products),
+                       embedding_dim=int(embedding_matrix.shape[1]), columns=schema), f)
+
+    old_dir = f"{artifact_dir}.old-{os.getpid()}"
+    if os.path.exists(artifact_dir):
+        os.replace(artifact_dir, old_dir)
+    os.replace(tmp_dir, artifact_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def load_catalog_artifact(artifact_dir, meta):
+    """
+    Loads an artifact whose meta.json is `meta`; the embedding block is memory-mapped.
+    Returns (products, product ids, embedding positions, embedding matrix, keyword index).
+    """
+    with np.load(os.path.join(artifact_dir, "columns.npz"), allow_pickle=False) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+    products = ColumnarProductList(meta["columns"], arrays, meta["product_count"])
+    matrix = read_embedding_block(os.path.join(artifact_dir, "embeddings.f32"), mmap_mode="r")
+    if matrix.shape[0] != arrays["embedding_positions"].shape[0]:
+        raise ValueError("embedding block does not match the embedding positions")
+    keyword_index = KeywordIndex.load(os.path.join(artifact_dir, "keywords"), products, mmap_mode="r")
+    return products, arrays["product_ids"], arrays["embedding_positions"], matrix, keyword_index
@@ -0,0 +1,130 @@
+# backend_flask/ai_core/catalog_snapshot.py
+import json
+import os
+import shutil
+from collections.abc import Sequence
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process lock, fine for the single-process dev server
+    fcntl = None
+
+from .vector_index import load_vector_index
+from .keyword_index import KeywordIndex
+
+# A catalog snapshot is a directory of read-only files holding everything load_and_preprocess_catalog builds:
+#   meta.json                 format version, source catalog and product image stamps, catalog version, index settings
+#   products.bin + products_offsets.npy   each processed product as UTF-8 JSON, back to back
+#   product_ids.npy           each product's id as a string, for building the id lookup without decoding products
+#   embedding_positions.npy, embedding_ids.npy, index/ (vector index), keywords/ (keyword index)
+# Arrays are memory-mapped, so every gunicorn worker on the host shares one copy through the page cache.
+CATALOG_SNAPSHOT_FORMAT_VERSION = 2
+# Decoded products kept per process; recommendations only touch a few hundred products per request
+SNAPSHOT_PRODUCT_CACHE_SIZE = 4096
+
+def get_snapshot_dir(catalog_file_path):
+    base_path, _ = os.path.splitext(catalog_file_path)
+    return f"{base_path}.snapshot"
+
+def catalog_file_stamp(catalog_file_path):
+    """Cheap identity of the catalog JSON (size and modification time), checked without reading the file."""
+    stat = os.stat(catalog_file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+@contextmanager
+def snapshot_lock(catalog_file_path):
+    """Exclusive lock across worker processes, so only the first one builds the snapshot and the rest wait for it."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{get_snapshot_dir(catalog_file_path)}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class MappedProductList(Sequence):
+    """
+    Read-only list of product dicts backed by a memory-mapped JSON blob.
+    Products are decoded on access, and every access returns a fresh dict that callers may modify.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob        # uint8 memmap of concatenated product JSON
+        self.offsets = offsets  # (n + 1,) byte offset of each product in `blob`
+        self._decode = lru_cache(maxsize=SNAPSHOT_PRODUCT_CACHE_SIZE)(self._decode_product)
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def _decode_product(self, position):
+        return json.loads(self.blob[self.offsets[position]:self.offsets[position + 1]].tobytes())
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("product position out of range")
+        return dict(self._decode(int(position)))
+
+def read_snapshot_meta(snapshot_dir):
+    """Returns the snapshot's meta.json contents, or None if there is no complete snapshot of this format."""
+    try:
+        with open(os.path.join(snapshot_dir, "meta.json"), "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("format_version") == CATALOG_SNAPSHOT_FORMAT_VERSION else None
+
+def write_catalog_snapshot(snapshot_dir, meta, products, embedding_positions, embedding_ids, vector_index, keyword_index):
+    """
+    Writes a complete snapshot into a temporary directory and then swaps it into place.
+    Processes still mapping an older snapshot keep reading its (unlinked) files safely.
+    """
+    tmp_dir = f"{snapshot_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    offsets = np.zeros(len(products) + 1, dtype=np.int64)
+    with open(os.path.join(tmp_dir, "products.bin"), "wb") as f:
+        for position, product in enumerate(products):
+            encoded = json.dumps(product, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            f.write(encoded)
+            offsets[position + 1] = offsets[position] + len(encoded)
+    np.save(os.path.join(tmp_dir, "products_offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "product_ids.npy"), np.array([str(product.get("id")) for product in products]))
+    np.save(os.path.join(tmp_dir, "embedding_positions.npy"), embedding_positions)
+    np.save(os.path.join(tmp_dir, "embedding_ids.npy"), embedding_ids)
+    vector_index.save(os.path.join(tmp_dir, "index"))
+    keyword_index.save(os.path.join(tmp_dir, "keywords"))
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(dict(meta, format_version=CATALOG_SNAPSHOT_FORMAT_VERSION, product_count=len(products)), f)
+
+    old_dir = f"{snapshot_dir}.old-{os.getpid()}"
+    if os.path.exists(snapshot_dir):
+        os.replace(snapshot_dir, old_dir)
+    os.replace(tmp_dir, snapshot_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def load_catalog_snapshot(snapshot_dir):
+    """
+    Maps a snapshot read-only.
+    Returns (products, product ids, embedding positions, embedding ids, vector index, keyword index).
+    """
+    offsets = np.load(os.path.join(snapshot_dir, "products_offsets.npy"))
+    blob_path = os.path.join(snapshot_dir, "products.bin")
+    # np.memmap cannot map an empty file
+    blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if offsets[-1] > 0 else np.empty(0, dtype=np.uint8)
+    products = MappedProductList(blob, offsets)
+    product_ids = np.load(os.path.join(snapshot_dir, "product_ids.npy"))
+    embedding_positions = np.load(os.path.join(snapshot_dir, "embedding_positions.npy"), mmap_mode="r")
+    embedding_ids = np.load(os.path.join(snapshot_dir, "embedding_ids.npy"), mmap_mode="r")
+    vector_index = load_vector_index(os.path.join(snapshot_dir, "index"), mmap_mode="r")
+    keyword_index = KeywordIndex.load(os.path.join(snapshot_dir, "keywords"), products, mmap_mode="r")
+    return products, product_ids, embedding_positions, embedding_ids, vector_index, keyword_index
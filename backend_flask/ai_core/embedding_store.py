@@ -0,0 +1,97 @@
+# backend_flask/ai_core/embedding_store.py
+import hashlib
+import json
+import os
+import numpy as np
+from flask import current_app
+
+# Bump this whenever the on-disk layout changes so old stores are ignored.
+EMBEDDING_STORE_FORMAT_VERSION = 1
+
+def get_embedding_store_paths(catalog_file_path):
+    """Returns the (matrix, manifest) paths stored next to the catalog JSON file."""
+    base_path, _ = os.path.splitext(catalog_file_path)
+    return f"{base_path}.embeddings.npy", f"{base_path}.embeddings.json"
+
+def compute_image_content_hash(image_path):
+    """Returns the SHA-256 hex digest of an image file's bytes."""
+    hasher = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def load_embedding_store(catalog_file_path, model_name):
+    """
+    Loads cached embeddings as a {content_hash: vector} dict.
+    Returns an empty dict if the store is missing, unreadable or was built with a different model.
+    """
+    matrix_path, manifest_path = get_embedding_store_paths(catalog_file_path)
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != EMBEDDING_STORE_FORMAT_VERSION:
+            current_app.logger.info("Embedding store has an outdated format. Rebuilding embeddings.")
+            return {}
+        if manifest.get("model_name") != model_name:
+            current_app.logger.info(f"Embedding store was built with '{manifest.get('model_name')}', not '{model_name}'. Rebuilding embeddings.")
+            return {}
+
+        matrix = np.load(matrix_path)
+        entries = manifest.get("entries", [])
+        if matrix.ndim != 2 or matrix.shape[0] != len(entries) or matrix.shape[1] != manifest.get("dim"):
+            current_app.logger.warning("Embedding store matrix does not match its manifest. Ignoring cached embeddings.")
+            return {}
+    except FileNotFoundError:
+        current_app.logger.info("No embedding store found. All catalog embeddings will be computed.")
+        return {}
+    except (OSError, ValueError) as e:
+        current_app.logger.warning(f"Could not read embedding store: {e}. Ignoring cached embeddings.")
+        return {}
+
+    current_app.logger.info(f"Loaded {len(entries)} cached embeddings from {os.path.basename(matrix_path)}")
+    return {entry["content_hash"]: matrix[entry["row"]] for entry in entries}
+
+def save_embedding_store(catalog_file_path, model_name, entries):
+    """
+    Writes the embedding store. `entries` is a list of (product_id, content_hash, embedding) tuples.
+    Files are written to temporary paths first and then renamed so readers never see partial data.
+    """
+    matrix_path, manifest_path = get_embedding_store_paths(catalog_file_path)
+
+    manifest_entries = []
+    vectors = []
+    seen_hashes = set()
+    for product_id, content_hash, embedding in entries:
+        # Identical images share a single row
+        if content_hash in seen_hashes:
+            continue
+        seen_hashes.add(content_hash)
+        manifest_entries.append({"id": str(product_id), "content_hash": content_hash, "row": len(vectors)})
+        vectors.append(np.asarray(embedding, dtype=np.float32))
+
+    if not vectors:
+        return
+
+    matrix = np.vstack(vectors)
+    manifest = {
+        "format_version": EMBEDDING_STORE_FORMAT_VERSION,
+        "model_name": model_name,
+        "dim": int(matrix.shape[1]),
+        "dtype": "float32",
+        "entries": manifest_entries,
+    }
+
+    try:
+        tmp_matrix_path = f"{matrix_path}.{os.getpid()}.tmp"
+        with open(tmp_matrix_path, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp_matrix_path, matrix_path)
+
+        tmp_manifest_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_manifest_path, manifest_path)
+        current_app.logger.info(f"Saved {len(manifest_entries)} embeddings to {os.path.basename(matrix_path)}")
+    except OSError as e:
+        current_app.logger.error(f"Failed to write embedding store: {e}")
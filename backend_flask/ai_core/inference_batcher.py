@@ -0,0 +1,116 @@
+# backend_flask/ai_core/inference_batcher.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from flask import current_app
+from .vision_models import extract_vit_features, extract_vit_features_batch
+
+# Query-time ViT requests from concurrent threads are collected for up to VIT_MICROBATCH_MAX_WAIT_MS
+# (or until VIT_MICROBATCH_MAX_SIZE images are waiting) and run as one batched forward pass.
+VIT_MICROBATCH_ENABLED = os.getenv("VIT_MICROBATCH_ENABLED", "1").lower() in ("1", "true", "yes")
+VIT_MICROBATCH_MAX_SIZE = int(os.getenv("VIT_MICROBATCH_MAX_SIZE", "16"))
+VIT_MICROBATCH_MAX_WAIT_MS = float(os.getenv("VIT_MICROBATCH_MAX_WAIT_MS", "5"))
+
+vit_batcher = None
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching queue. Callers submit single items from any thread and get a Future back;
+    a background thread groups waiting items and calls `batch_fn(items)`, which must return one result per item.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=5.0, app=None, name="micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_seconds = max(0.0, max_wait_ms) / 1000.0
+        self.app = app
+        self.name = name
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+        self.batches_run = 0
+        self.items_processed = 0
+
+    def _ensure_worker(self):
+        # Started lazily, and restarted after a fork (gunicorn workers do not inherit threads)
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def submit(self, item):
+        """Queues one item and returns a Future for its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            items = [item for item, _ in batch]
+            try:
+                if self.app is not None:
+                    with self.app.app_context():
+                        results = self.batch_fn(items)
+                else:
+                    results = self.batch_fn(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches_run += 1
+            self.items_processed += len(items)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches_run": self.batches_run,
+            "items_processed": self.items_processed,
+            "mean_batch_size": round(self.items_processed / self.batches_run, 2) if self.batches_run else 0.0,
+            "queue_depth": self._queue.qsize(),
+        }
+
+def _embed_image_batch(images):
+    # A lone image skips the thread pool used for batch preprocessing
+    if len(images) == 1:
+        return [extract_vit_features(images[0])]
+    return extract_vit_features_batch(images, batch_size=len(images))
+
+def get_vit_batcher():
+    """Returns the process-wide ViT micro-batcher, creating it on first use."""
+    global vit_batcher
+    if vit_batcher is None:
+        vit_batcher = MicroBatcher(_embed_image_batch, max_batch_size=VIT_MICROBATCH_MAX_SIZE,
+                                   max_wait_ms=VIT_MICROBATCH_MAX_WAIT_MS,
+                                   app=current_app._get_current_object(), name="vit-micro-batcher")
+    return vit_batcher
+
+def extract_vit_features_microbatched(image_source):
+    """Query-time ViT embedding that shares forward passes with concurrent requests when micro-batching is enabled."""
+    if not VIT_MICROBATCH_ENABLED:
+        return extract_vit_features(image_source)
+    try:
+        return get_vit_batcher().submit(image_source).result()
+    except Exception as e:
+        current_app.logger.error(f"Micro-batched ViT extraction failed: {e}")
+        return None
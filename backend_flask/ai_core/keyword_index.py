@@ -0,0 +1,117 @@
+# backend_flask/ai_core/keyword_index.py
+import bisect
+import os
+from functools import lru_cache
+import numpy as np
+
+def product_text_corpus(product):
+    """Combines a product's searchable metadata into one lowercase text block."""
+    return (f"{product.get('name','')} {product.get('description','')} {product.get('type','')} "
+            f"{product.get('category','')} {' '.join(product.get('color_tags',[]))}").lower()
+
+class KeywordIndex:
+    """
+    Inverted index from whitespace-separated corpus tokens to the catalog positions containing them.
+    A keyword matches a product exactly when `keyword in product_text_corpus(product)` would be True,
+    but only the products sharing the keyword's tokens are ever looked at.
+    """
+
+    def __init__(self, products, vocabulary, postings_indptr, postings_indices):
+        self.products = products
+        self.vocabulary = vocabulary              # sorted list of distinct tokens
+        self.postings_indptr = postings_indptr    # CSR row pointers, one row per vocabulary token
+        self.postings_indices = postings_indices  # catalog positions, sorted within each row
+        # All tokens joined by newlines: a substring search over this finds every token containing a keyword
+        self._vocabulary_blob = "\n".join(vocabulary)
+        self._token_starts = []
+        offset = 0
+        for token in vocabulary:
+            self._token_starts.append(offset)
+            offset += len(token) + 1
+        # Keyword lookups repeat across requests, so memoize them per index
+        self.match_positions = lru_cache(maxsize=4096)(self._match_positions)
+
+    @classmethod
+    def build(cls, products):
+        token_postings = {}
+        for position, product in enumerate(products):
+            for token in set(product_text_corpus(product).split()):
+                token_postings.setdefault(token, []).append(position)
+
+        vocabulary = sorted(token_postings)
+        postings_indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum([len(token_postings[token]) for token in vocabulary], out=postings_indptr[1:])
+        postings_indices = np.fromiter((position for token in vocabulary for position in token_postings[token]),
+                                       dtype=np.int64, count=int(postings_indptr[-1]))
+        return cls(products, vocabulary, postings_indptr, postings_indices)
+
+    def save(self, directory):
+        """Writes the vocabulary and postings to `directory` (the products are stored by the caller)."""
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "vocabulary.txt"), "w", encoding="utf-8") as f:
+            f.write(self._vocabulary_blob)
+        np.save(os.path.join(directory, "postings_indptr.npy"), self.postings_indptr)
+        np.save(os.path.join(directory, "postings_indices.npy"), self.postings_indices)
+
+    @classmethod
+    def load(cls, directory, products, mmap_mode=None):
+        with open(os.path.join(directory, "vocabulary.txt"), "r", encoding="utf-8") as f:
+            blob = f.read()
+        vocabulary = blob.split("\n") if blob else []
+        return cls(products, vocabulary,
+                   np.load(os.path.join(directory, "postings_indptr.npy"), mmap_mode=mmap_mode),
+                   np.load(os.path.join(directory, "postings_indices.npy"), mmap_mode=mmap_mode))
+
+    def _postings(self, token_id):
+        return self.postings_indices[self.postings_indptr[token_id]:self.postings_indptr[token_id + 1]]
+
+    def _positions_with_token_containing(self, fragment):
+        """Positions of products that have a token containing `fragment` (which has no whitespace)."""
+        token_ids = set()
+        found = self._vocabulary_blob.find(fragment)
+        while found != -1:
+            token_id = bisect.bisect_right(self._token_starts, found) - 1
+            token_ids.add(token_id)
+            # Skip to the next token; further hits in this one add nothing
+            next_start = token_id + 1
+            if next_start >= len(self._token_starts):
+                break
+            found = self._vocabulary_blob.find(fragment, self._token_starts[next_start])
+        if not token_ids:
+            return np.empty(0, dtype=np.int64)
+        if len(token_ids) == 1:
+            return self._postings(token_ids.pop())
+        return np.unique(np.concatenate([self._postings(token_id) for token_id in token_ids]))
+
+    def _match_positions(self, keyword):
+        """Sorted catalog positions whose text corpus contains `keyword` as a substring."""
+        if not keyword:
+            # The empty string is contained in every corpus
+            return np.arange(len(self.products), dtype=np.int64)
+        fragments = keyword.split()
+        if not fragments:
+            # Whitespace-only keywords have no token to look up; like phrases, they are checked against each corpus
+            candidates = np.arange(len(self.products), dtype=np.int64)
+        else:
+            candidates = self._positions_with_token_containing(fragments[0])
+        for fragment in fragments[1:]:
+            if candidates.size == 0:
+                break
+            candidates = np.intersect1d(candidates, self._positions_with_token_containing(fragment), assume_unique=True)
+
+        if len(fragments) == 1 and fragments[0] == keyword:
+            return candidates
+        # Multi-word phrases must also appear contiguously, so verify the few remaining candidates
+        return np.array([position for position in candidates
+                         if keyword in product_text_corpus(self.products[position])], dtype=np.int64)
+
+    def match_counts(self, keywords):
+        """
+        Counts how many of `keywords` each product matches.
+        Returns (positions, counts) for products with at least one match, positions sorted ascending.
+        """
+        matches = [self.match_positions(keyword) for keyword in keywords if isinstance(keyword, str)]
+        matches = [positions for positions in matches if positions.size]
+        if not matches:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(matches), return_counts=True)
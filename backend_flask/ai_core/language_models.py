@@ -1,45 +1,156 @@
 # backend_flask/ai_core/language_models.py
 import os
 import json
-import google.generativeai as genai
-import spacy
+import hashlib
 from flask import current_app
+# spaCy and the Gemini SDK are imported on first use so that importing the app stays fast
+from ..caching import TTLCache, SQLiteCache, TieredCache
+from ..metrics import MODEL_LOAD_SECONDS, MODEL_INFERENCE_SECONDS, MODEL_INFERENCE_ITEMS, EXTERNAL_API_SECONDS, EXTERNAL_API_ERRORS
 
 # --- Global variable for spaCy model ---
 nlp_spacy = None
+SPACY_MODEL_NAME = "en_core_web_sm"
+# Keyword extraction only needs POS tags and lemmas (tok2vec, tagger, attribute_ruler, lemmatizer),
+# so the dependency parser, NER and sentence segmenter are never loaded
+SPACY_EXCLUDED_COMPONENTS = ["parser", "ner", "senter"]
+# Keywords per normalized text; they only change with the model, the TTL just lets idle entries go
+SPACY_KEYWORD_CACHE_ENTRIES = int(os.getenv("SPACY_KEYWORD_CACHE_ENTRIES", "4096"))
+spacy_keyword_cache = TTLCache(max_entries=SPACY_KEYWORD_CACHE_ENTRIES, ttl_seconds=24 * 3600)
+# Texts per nlp.pipe batch in extract_keywords_spacy_batch
+SPACY_PIPE_BATCH_SIZE = int(os.getenv("SPACY_PIPE_BATCH_SIZE", "256"))
+
+# --- Gemini settings and response cache ---
+GEMINI_MODEL_NAME = "gemini-1.5-flash-latest"
+# Bump this when the refinement prompt changes so answers to the old prompt are not reused
+GEMINI_PROMPT_VERSION = 1
+# Seconds before the SDK gives up on a refinement request; like the refinement stage timeout (PIPELINE_TIMEOUT_REFINEMENT)
+GEMINI_REQUEST_TIMEOUT_SECONDS = float(os.getenv("GEMINI_REQUEST_TIMEOUT_SECONDS", "20"))
+# SQLite file (in the backend_flask folder) shared by all worker processes
+LLM_CACHE_DB_FILENAME = "llm_cache.sqlite3"
+GEMINI_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+GEMINI_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "20000"))
+GEMINI_MEMORY_CACHE_ENTRIES = int(os.getenv("GEMINI_MEMORY_CACHE_ENTRIES", "1024"))
+gemini_cache = None
+# Answer when no API key is configured; it is the same for every query, so results ranked with it may be reused
+GEMINI_NOT_CONFIGURED = {"error": "Gemini API key not configured."}
+# Refinement used when the Gemini stage times out or raises; results ranked with it are never reused
+REFINEMENT_UNAVAILABLE = {"error": "Gemini refinement timed out or failed."}
 
 def load_spacy_model():
-    """Loads the spaCy NLP model into memory."""
+    """Loads the spaCy NLP model into memory, without the components keyword extraction does not use."""
     global nlp_spacy
     if nlp_spacy is None:
         try:
-            current_app.logger.info("Loading spaCy model (en_core_web_sm)...")
-            nlp_spacy = spacy.load("en_core_web_sm")
-            current_app.logger.info("spaCy model loaded successfully.")
+            import spacy
+            current_app.logger.info(f"Loading spaCy model ({SPACY_MODEL_NAME}) without {', '.join(SPACY_EXCLUDED_COMPONENTS)}...")
+            with MODEL_LOAD_SECONDS.time(model="spacy"):
+                nlp_spacy = spacy.load(SPACY_MODEL_NAME, exclude=SPACY_EXCLUDED_COMPONENTS)
+            spacy_keyword_cache.clear()
+            current_app.logger.info(f"spaCy model loaded successfully (pipeline: {', '.join(nlp_spacy.pipe_names)}).")
         except OSError:
-            current_app.logger.error("spaCy model 'en_core_web_sm' not found. Please run: python -m spacy download en_core_web_sm")
+            current_app.logger.error(f"spaCy model '{SPACY_MODEL_NAME}' not found. Please run: python -m spacy download {SPACY_MODEL_NAME}")
         except Exception as e:
             current_app.logger.error(f"Error loading spaCy model: {e}")
 
+def is_spacy_model_loaded():
+    return nlp_spacy is not None
+
+def _normalize_keyword_text(text):
+    return " ".join(str(text).lower().split())
+
+def _keywords_from_doc(doc):
+    # Extract nouns, proper nouns, and adjectives, avoiding stop words
+    return tuple({token.lemma_ for token in doc if token.pos_ in ["NOUN", "PROPN", "ADJ"] and not token.is_stop})
+
 def extract_keywords_spacy(text):
-    """Extracts relevant keywords from text using spaCy."""
+    """Extracts relevant keywords from text using spaCy. Results are cached per normalized (lowercased, whitespace-collapsed) text."""
     if not nlp_spacy or not text:
         return []
-    
-    doc = nlp_spacy(text.lower())
-    # Extract nouns, proper nouns, and adjectives, avoiding stop words
-    keywords = {token.lemma_ for token in doc if token.pos_ in ["NOUN", "PROPN", "ADJ"] and not token.is_stop}
+
+    normalized_text = _normalize_keyword_text(text)
+    keywords = spacy_keyword_cache.get(normalized_text)
+    if keywords is None:
+        with MODEL_INFERENCE_SECONDS.time(model="spacy", mode="single"):
+            keywords = _keywords_from_doc(nlp_spacy(normalized_text))
+        MODEL_INFERENCE_ITEMS.inc(model="spacy")
+        spacy_keyword_cache.set(normalized_text, keywords)
     return list(keywords)
 
+def extract_keywords_spacy_batch(texts, batch_size=None, n_process=1, cache_results=True):
+    """
+    Extracts keywords for many texts (e.g. catalog descriptions) with nlp.pipe. Returns a list aligned with `texts`.
+    Cached texts are not reprocessed and duplicates are processed once. For large offline jobs use n_process > 1,
+    and cache_results=False so they do not evict the cached prompts of live requests.
+    """
+    if not nlp_spacy:
+        return [[] for _ in texts]
+
+    normalized_texts = [_normalize_keyword_text(text) if text else "" for text in texts]
+    keywords_by_text = {"": ()}
+    for normalized_text in normalized_texts:
+        if normalized_text not in keywords_by_text:
+            keywords = spacy_keyword_cache.get(normalized_text)
+            if keywords is not None:
+                keywords_by_text[normalized_text] = keywords
+
+    pending = list(dict.fromkeys(t for t in normalized_texts if t not in keywords_by_text))
+    if pending:
+        with MODEL_INFERENCE_SECONDS.time(model="spacy", mode="batch"):
+            docs = nlp_spacy.pipe(pending, batch_size=batch_size or SPACY_PIPE_BATCH_SIZE, n_process=n_process)
+            for normalized_text, doc in zip(pending, docs):
+                keywords = _keywords_from_doc(doc)
+                keywords_by_text[normalized_text] = keywords
+                if cache_results:
+                    spacy_keyword_cache.set(normalized_text, keywords)
+        MODEL_INFERENCE_ITEMS.inc(len(pending), model="spacy")
+    return [list(keywords_by_text[normalized_text]) for normalized_text in normalized_texts]
+
+def get_gemini_cache():
+    """Returns the two-tier (in-process LRU + SQLite) cache for Gemini refinements, creating it on first use."""
+    global gemini_cache
+    if gemini_cache is None:
+        db_path = os.path.join(current_app.root_path, LLM_CACHE_DB_FILENAME)
+        gemini_cache = TieredCache(
+            TTLCache(max_entries=GEMINI_MEMORY_CACHE_ENTRIES, ttl_seconds=min(GEMINI_CACHE_TTL_SECONDS, 3600)),
+            SQLiteCache(db_path, namespace="gemini_refinement", ttl_seconds=GEMINI_CACHE_TTL_SECONDS,
+                        max_entries=GEMINI_CACHE_MAX_ENTRIES),
+        )
+    return gemini_cache
+
+def _normalize_llm_input(text):
+    return " ".join(str(text or "").lower().split())
+
+def gemini_cache_key(image_description, user_prompt):
+    """Hashes the normalized prompt inputs together with the model name and prompt version."""
+    payload = json.dumps({
+        "model": GEMINI_MODEL_NAME,
+        "prompt_version": GEMINI_PROMPT_VERSION,
+        "image_description": _normalize_llm_input(image_description),
+        "user_prompt": _normalize_llm_input(user_prompt),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def is_reusable_refinement(refinement):
+    """True for well-formed Gemini answers (and the fixed answer without an API key); False for transient failures."""
+    return isinstance(refinement, dict) and ("error" not in refinement or refinement == GEMINI_NOT_CONFIGURED)
+
 def get_refined_search_gemini(image_description, user_prompt):
-    """Uses Google's Gemini to refine a search query based on image and text inputs."""
+    """Uses Google's Gemini to refine a search query based on image and text inputs. Successful responses are cached."""
     # Check if the Gemini API key was configured on app startup
     if not os.getenv("GOOGLE_API_KEY"):
         current_app.logger.warning("GOOGLE_API_KEY not found. Skipping Gemini API call.")
-        return {"error": "Gemini API key not configured."}
+        return dict(GEMINI_NOT_CONFIGURED)
+
+    cache = get_gemini_cache()
+    cache_key = gemini_cache_key(image_description, user_prompt)
+    cached_output = cache.get(cache_key)
+    if cached_output is not None:
+        current_app.logger.info("Gemini refinement served from cache.")
+        return cached_output
 
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash-latest")
+        import google.generativeai as genai
+        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
         current_app.logger.info(f"Using Gemini model for search refinement.")
         
         prompt_template = f"""
@@ -62,18 +173,24 @@ def get_refined_search_gemini(image_description, user_prompt):
         If the input is vague, make the attributes broader. Output ONLY the JSON object.
         """
         
-        response = model.generate_content(prompt_template)
+        with EXTERNAL_API_SECONDS.time(service="gemini"):
+            response = model.generate_content(prompt_template, request_options={"timeout": GEMINI_REQUEST_TIMEOUT_SECONDS})
         
         # Clean up the response to ensure it's valid JSON
         cleaned_text = response.text.strip().removeprefix("```json").removesuffix("```").strip()
         
         gemini_output = json.loads(cleaned_text)
         current_app.logger.info(f"Gemini Refinement Output (parsed): {gemini_output}")
+        # Only well-formed answers are cached; errors and unparseable text are retried next time
+        if isinstance(gemini_output, dict) and "error" not in gemini_output:
+            cache.set(cache_key, gemini_output)
         return gemini_output
         
     except json.JSONDecodeError:
+        EXTERNAL_API_ERRORS.inc(service="gemini")
         current_app.logger.warning(f"Gemini response was not valid JSON. Raw text: {response.text}")
         return {"raw_text": response.text, "error": "Gemini response was not valid JSON."}
     except Exception as e:
+        EXTERNAL_API_ERRORS.inc(service="gemini")
         current_app.logger.error(f"Error with Gemini API call: {e}")
         return {"error": f"Error interacting with Gemini: {str(e)}"}
\ No newline at end of file
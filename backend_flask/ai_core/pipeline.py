@@ -0,0 +1,107 @@
+# backend_flask/ai_core/pipeline.py
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import current_app
+
+# Pipeline stages run on two pools, so remote API calls that hang (each holds its thread until the SDK's own timeout,
+# even after the stage has timed out) can never starve the local ViT, visual search and spaCy stages of threads.
+PIPELINE_REMOTE_WORKERS = int(os.getenv("PIPELINE_REMOTE_WORKERS", "16"))
+PIPELINE_LOCAL_WORKERS = int(os.getenv("PIPELINE_LOCAL_WORKERS", "8"))
+remote_stage_executor = ThreadPoolExecutor(max_workers=PIPELINE_REMOTE_WORKERS, thread_name_prefix="pipeline-remote")
+local_stage_executor = ThreadPoolExecutor(max_workers=PIPELINE_LOCAL_WORKERS, thread_name_prefix="pipeline-local")
+# How often queued stages are checked for having started, since their timeout only runs from then on
+QUEUED_STAGE_POLL_SECONDS = 0.05
+
+class PipelineStage:
+    """
+    One step of a recommendation pipeline.
+    `func` is called with the results of the stages named in `depends_on` as keyword arguments.
+    If it raises or runs longer than `timeout` seconds (counted from when it starts running, not while it waits for
+    a thread), `default` is used as its result instead. `remote` stages (API calls) run on their own thread pool.
+    """
+
+    def __init__(self, name, func, depends_on=(), timeout=None, default=None, remote=False):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+        self.default = default
+        self.remote = remote
+
+class _StageRun:
+    """A submitted stage, with when it was submitted and when a thread started running it."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+
+    def deadline(self):
+        if self.stage.timeout is None or self.started_at is None:
+            return None
+        return self.started_at + self.stage.timeout
+
+def _run_with_app_context(app, run, kwargs):
+    run.started_at = time.perf_counter()
+    with app.app_context():
+        return run.stage.func(**kwargs)
+
+def run_pipeline(stages, on_stage_complete=None):
+    """
+    Runs stages as a dependency graph on the shared thread pools; independent stages overlap.
+    `on_stage_complete(name, results)` is called on the calling thread as each stage finishes.
+    Returns (results by stage name, timings in ms by stage name, status by stage name).
+    Timings include time spent waiting for a thread. Status is "ok", "error" or "timeout".
+    """
+    app = current_app._get_current_object()
+    pending = {stage.name: stage for stage in stages}
+    running = {} # future -> _StageRun
+    results, timings, statuses = {}, {}, {}
+
+    def finish(run, result, status):
+        results[run.stage.name] = result
+        timings[run.stage.name] = round((time.perf_counter() - run.submitted_at) * 1000, 2)
+        statuses[run.stage.name] = status
+        if on_stage_complete is not None:
+            on_stage_complete(run.stage.name, results)
+
+    while pending or running:
+        # Launch every stage whose dependencies have all finished
+        for name, stage in list(pending.items()):
+            if all(dep in results for dep in stage.depends_on):
+                kwargs = {dep: results[dep] for dep in stage.depends_on}
+                run = _StageRun(stage)
+                executor = remote_stage_executor if stage.remote else local_stage_executor
+                running[executor.submit(_run_with_app_context, app, run, kwargs)] = run
+                del pending[name]
+        if not running:
+            current_app.logger.error(f"Pipeline stages with unsatisfiable dependencies: {', '.join(pending)}")
+            break
+
+        # Wake up when a stage finishes, when the earliest deadline passes, or to see whether queued stages have started
+        now = time.perf_counter()
+        deadlines = [deadline for deadline in (run.deadline() for run in running.values()) if deadline is not None]
+        wait_timeout = max(0.0, min(deadlines) - now) if deadlines else None
+        if any(run.started_at is None and run.stage.timeout is not None for run in running.values()):
+            wait_timeout = QUEUED_STAGE_POLL_SECONDS if wait_timeout is None else min(wait_timeout, QUEUED_STAGE_POLL_SECONDS)
+        done, _ = wait(running, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            run = running.pop(future)
+            try:
+                finish(run, future.result(), "ok")
+            except Exception as e:
+                current_app.logger.error(f"Pipeline stage '{run.stage.name}' failed: {e}")
+                finish(run, run.stage.default, "error")
+
+        now = time.perf_counter()
+        for future, run in list(running.items()):
+            deadline = run.deadline()
+            if deadline is not None and now >= deadline:
+                # The worker thread cannot be interrupted; its eventual result is simply discarded
+                running.pop(future)
+                current_app.logger.warning(f"Pipeline stage '{run.stage.name}' timed out after {run.stage.timeout}s; using its default.")
+                finish(run, run.stage.default, "timeout")
+
+    return results, timings, statuses
@@ -1,32 +1,106 @@
 # backend_flask/ai_core/product_catalog.py
+import hashlib
 import json
 import os
+import numpy as np
 from flask import current_app
-from .vision_models import extract_vit_features
+from .vision_models import extract_vit_features_batch, extract_vit_features_multiprocess, VIT_MODEL_NAME
+from .embedding_store import load_embedding_store, save_embedding_store
+from .vector_index import build_vector_index, load_vector_index, read_vector_index_meta
+from .keyword_index import KeywordIndex
+from ..metrics import CATALOG_OPERATION_SECONDS, CATALOG_PRODUCTS
+from ..image_derivatives import (
+    product_image_derivatives, derivative_settings, source_content_hash, product_images_meta, product_images_match,
+    load_source_widths, save_source_widths
+)
+from .catalog_snapshot import (
+    get_snapshot_dir, catalog_file_stamp, snapshot_lock, read_snapshot_meta, write_catalog_snapshot, load_catalog_snapshot
+)
+from .catalog_artifact import (
+    get_artifact_dir, compute_source_digest, artifact_matches_source, read_artifact_meta, write_catalog_artifact, load_catalog_artifact
+)
 
 # The name of the JSON file located in the backend_flask directory
 DB_METADATA_FILE = "curated_product_catalog.json"
 # This will be our in-memory "database" holding products with their embeddings
 AI_PRODUCT_CATALOG = []
+# Contiguous, L2-normalized float32 matrix of catalog embeddings, built once at load time.
+# Row i belongs to AI_PRODUCT_CATALOG[CATALOG_EMBEDDING_POSITIONS[i]] whose id is CATALOG_EMBEDDING_IDS[i].
+CATALOG_EMBEDDING_MATRIX = None
+CATALOG_EMBEDDING_POSITIONS = None
+CATALOG_EMBEDDING_IDS = None
+# Index used for visual search: "exact" (brute force over float32), "ivf" (approximate), or a compact storage mode
+# that searches compressed codes directly: "float16", "int8" (per-vector scale) or "pq" (product quantization).
+# Non-exact indexes are saved next to the catalog JSON and reloaded on startup while the embeddings are unchanged;
+# they keep their own copy of the vectors, so CATALOG_EMBEDDING_MATRIX is released once they are built.
+VECTOR_INDEX_KIND = os.getenv("VECTOR_INDEX_KIND", "exact")
+# Default number of IVF lists probed per query; higher values raise recall at the cost of latency
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+# PQ bytes per vector; must divide the embedding dimension (768 / 96 = 8 dims per subspace, 32x smaller than float32)
+VECTOR_INDEX_PQ_SUBSPACES = int(os.getenv("VECTOR_INDEX_PQ_SUBSPACES", "96"))
+CATALOG_VECTOR_INDEX = None
+# Rows hashed at a time when fingerprinting the embeddings for a saved vector index
+EMBEDDING_DIGEST_BLOCK_ROWS = 65536
+# Product id (as a string) -> position in AI_PRODUCT_CATALOG, for lookups by id; the first product wins on duplicate ids
+CATALOG_POSITIONS_BY_ID = {}
+# Identifies the loaded catalog contents (and embedding model), so cached results can be tied to it
+CATALOG_VERSION = None
+# Inverted index over product name, description, type, category and color tags for keyword scoring
+CATALOG_KEYWORD_INDEX = None
+# With SHARED_CATALOG_SNAPSHOT=1 the first process builds the catalog and writes it to a read-only snapshot next to
+# the catalog JSON; every gunicorn worker then memory-maps that snapshot instead of building its own copy.
+SHARED_CATALOG_SNAPSHOT = os.getenv("SHARED_CATALOG_SNAPSHOT", "0").lower() in ("1", "true", "yes")
+# Load the columnar catalog artifact written by build_catalog_artifact.py (precomputed embeddings, no JSON parsing)
+# when it is up to date with the catalog JSON
+USE_CATALOG_ARTIFACT = os.getenv("USE_CATALOG_ARTIFACT", "1").lower() in ("1", "true", "yes")
 
+@CATALOG_OPERATION_SECONDS.timed(operation="load")
 def load_and_preprocess_catalog():
     """
     Loads product data from a JSON file and computes ViT embeddings for their images.
+    Embeddings are cached on disk by image content hash, so only new or changed images are processed.
+    An up-to-date catalog artifact (see precompute_catalog_artifact) is loaded instead of the JSON when present.
+    With SHARED_CATALOG_SNAPSHOT enabled, an up-to-date snapshot is memory-mapped instead of rebuilding.
     This should be called once on app startup within the Flask app context.
     """
-    global AI_PRODUCT_CATALOG
     # Avoid reprocessing if already loaded
     if AI_PRODUCT_CATALOG:
         current_app.logger.info("Product catalog already loaded and preprocessed.")
         return
 
-    # The ViT model must be loaded first (this is handled in app.py)
     catalog_file_path = os.path.join(current_app.root_path, DB_METADATA_FILE)
+    if not SHARED_CATALOG_SNAPSHOT:
+        _load_or_build_catalog(catalog_file_path)
+        return
+
+    # Workers starting together queue on the lock; the first builds and writes the snapshot, the rest just map it
+    try:
+        with snapshot_lock(catalog_file_path):
+            if _map_catalog_snapshot(catalog_file_path):
+                return
+            _load_or_build_catalog(catalog_file_path)
+            _write_catalog_snapshot(catalog_file_path)
+            # Re-map what was just written so this process shares the same pages as the other workers
+            _map_catalog_snapshot(catalog_file_path)
+    except OSError as e:
+        current_app.logger.error(f"Catalog snapshot unavailable ({e}); using this process's own catalog copy.")
+        if not AI_PRODUCT_CATALOG:
+            _load_or_build_catalog(catalog_file_path)
+
+def _load_or_build_catalog(catalog_file_path):
+    if not (USE_CATALOG_ARTIFACT and _load_catalog_artifact(catalog_file_path)):
+        _build_catalog(catalog_file_path)
+
+def _build_catalog(catalog_file_path):
+    """Builds the catalog, its embeddings and its indexes in this process."""
+    global AI_PRODUCT_CATALOG, CATALOG_EMBEDDING_MATRIX, CATALOG_EMBEDDING_POSITIONS, CATALOG_EMBEDDING_IDS, CATALOG_VECTOR_INDEX, CATALOG_KEYWORD_INDEX, CATALOG_VERSION, CATALOG_POSITIONS_BY_ID
+    # The ViT model must be loaded first (this is handled in app.py)
     current_app.logger.info(f"Attempting to load product catalog from: {catalog_file_path}")
 
     try:
-        with open(catalog_file_path, 'r') as f:
-            raw_products = json.load(f)
+        with open(catalog_file_path, 'rb') as f:
+            raw_catalog_bytes = f.read()
+        raw_products = json.loads(raw_catalog_bytes)
         current_app.logger.info(f"Loaded {len(raw_products)} raw products from {DB_METADATA_FILE}")
     except FileNotFoundError:
         current_app.logger.error(f"FATAL: {DB_METADATA_FILE} not found. Cannot populate product catalog.")
@@ -35,11 +109,57 @@ def load_and_preprocess_catalog():
         current_app.logger.error(f"FATAL: Error decoding JSON from {DB_METADATA_FILE}.")
         return
 
-    processed_count = 0
-    # Process each product to generate its embedding
+    # Embeddings from previous runs, keyed by image content hash
+    cached_embeddings = load_embedding_store(catalog_file_path, VIT_MODEL_NAME)
+    products, store_entries, pending_embeddings = _resolve_products(raw_products, cached_embeddings)
+
+    # Second pass: run ViT in batches over the images that were not in the store
+    new_embeddings = []
+    if pending_embeddings:
+        current_app.logger.info(f"Computing ViT embeddings for {len(pending_embeddings)} new or changed images...")
+        new_embeddings = extract_vit_features_batch([image_path for image_path, _ in pending_embeddings.values()])
+    computed_count = _assign_embeddings(pending_embeddings, new_embeddings, store_entries)
+
+    # Move the embeddings out of the product dicts into a single search matrix
+    CATALOG_EMBEDDING_MATRIX, CATALOG_EMBEDDING_POSITIONS, CATALOG_EMBEDDING_IDS = _build_embedding_matrix(products)
+    if CATALOG_EMBEDDING_MATRIX is not None:
+        CATALOG_VECTOR_INDEX = _load_or_build_vector_index(catalog_file_path, CATALOG_EMBEDDING_MATRIX)
+        current_app.logger.info(f"Vector index '{CATALOG_VECTOR_INDEX.kind}' holds {CATALOG_VECTOR_INDEX.memory_bytes() / 2**20:.1f} MiB "
+                                f"(float32 embeddings: {CATALOG_EMBEDDING_MATRIX.nbytes / 2**20:.1f} MiB)")
+        if CATALOG_VECTOR_INDEX.kind != "exact":
+            CATALOG_EMBEDDING_MATRIX = None
+    CATALOG_KEYWORD_INDEX = KeywordIndex.build(products)
+    CATALOG_POSITIONS_BY_ID = _index_positions_by_id(str(product.get("id")) for product in products)
+    CATALOG_VERSION = _catalog_version(raw_catalog_bytes, store_entries)
+    AI_PRODUCT_CATALOG.extend(products)
+    CATALOG_PRODUCTS.set(len(AI_PRODUCT_CATALOG))
+    processed_count = len(store_entries)
+    
+    # Rewrite the store only when it no longer matches the catalog (new, changed or removed images)
+    current_hashes = {content_hash for _, content_hash, _ in store_entries}
+    if computed_count > 0 or current_hashes != set(cached_embeddings):
+        save_embedding_store(catalog_file_path, VIT_MODEL_NAME, store_entries)
+
+    current_app.logger.info(f"Finished catalog preprocessing. {processed_count}/{len(AI_PRODUCT_CATALOG)} products now have ViT embeddings ({computed_count} newly computed).")
+    if processed_count == 0 and len(AI_PRODUCT_CATALOG) > 0:
+        current_app.logger.warning("WARNING: No products were successfully embedded with ViT. Check image paths and ViT model loading.")
+
+def _resolve_products(raw_products, cached_embeddings):
+    """
+    First pass over the raw catalog: copies each product, resolves its image and reuses its cached embedding if possible.
+    Returns (products, embedding store entries, pending embeddings), where pending maps content hash ->
+    (absolute image path, products using it) for images without a cached embedding; products that share an image
+    (e.g. colour variants photographed once) are embedded once.
+    """
+    store_entries = []
+    products = []
+    pending_embeddings = {}
+    # Image widths for the derivative URLs, so only images not seen before have their headers read
+    load_source_widths(current_app.root_path)
     for product_data in raw_products:
         # Create a copy to work with
         product = product_data.copy()
+        product["embedding"] = None
         
         # The 'image_path_for_ai' is relative to the backend_flask folder, e.g., "static/product_images_db/1163.jpg"
         rel_image_path = product.get('image_path_for_ai')
@@ -49,30 +169,323 @@ def load_and_preprocess_catalog():
             abs_image_path_for_ai = os.path.join(current_app.root_path, rel_image_path)
             
             if os.path.exists(abs_image_path_for_ai):
-                # This function call does the actual AI processing
-                embedding = extract_vit_features(abs_image_path_for_ai)
+                # Cached by size and modification time, so stamping the images afterwards does not read them again
+                content_hash = source_content_hash(abs_image_path_for_ai)
+                # Resized WebP/JPEG URLs for the frontend, versioned by the image's content hash
+                derivatives = product_image_derivatives(rel_image_path, abs_image_path_for_ai, content_hash)
+                if derivatives:
+                    product["imageDerivatives"] = derivatives
+                embedding = cached_embeddings.get(content_hash)
                 if embedding is not None:
                     product["embedding"] = embedding
-                    processed_count += 1
+                    store_entries.append((product.get("id"), content_hash, embedding))
                 else:
-                    product["embedding"] = None
-                    current_app.logger.warning(f"Failed to get ViT embedding for {product.get('name', 'Unknown')}")
+                    pending_embeddings.setdefault(content_hash, (abs_image_path_for_ai, []))[1].append(product)
             else:
-                product["embedding"] = None
                 current_app.logger.warning(f"Image for ViT not found at path: {abs_image_path_for_ai}")
-        else:
-            product["embedding"] = None
 
         # Standardize the image URL for the frontend
         # The 'images' array should contain web-accessible paths like "/static/product_images_db/1163.jpg"
         product["imageUrl"] = product["images"][0] if product.get("images") else "/static/placeholder.png"
         
-        AI_PRODUCT_CATALOG.append(product)
-    
-    current_app.logger.info(f"Finished catalog preprocessing. {processed_count}/{len(AI_PRODUCT_CATALOG)} products now have ViT embeddings.")
-    if processed_count == 0 and len(AI_PRODUCT_CATALOG) > 0:
-        current_app.logger.warning("WARNING: No products were successfully embedded with ViT. Check image paths and ViT model loading.")
+        products.append(product)
+
+    try:
+        save_source_widths(current_app.root_path)
+    except OSError as e:
+        current_app.logger.warning(f"Could not save product image widths: {e}")
+    return products, store_entries, pending_embeddings
+
+def _catalog_version(raw_catalog_bytes, store_entries):
+    """Digest of the embedding model, catalog JSON and embedded images, so replacing an image also changes the version."""
+    hasher = hashlib.blake2b(VIT_MODEL_NAME.encode() + raw_catalog_bytes, digest_size=8)
+    for content_hash in sorted({content_hash for _, content_hash, _ in store_entries}):
+        hasher.update(content_hash.encode())
+    return hasher.hexdigest()
+
+def _assign_embeddings(pending_embeddings, new_embeddings, store_entries):
+    """Gives the products of each pending image its new embedding (aligned with `pending_embeddings`). Returns how many got one."""
+    computed_count = 0
+    for (content_hash, (_, image_products)), embedding in zip(pending_embeddings.items(), new_embeddings):
+        for product in image_products:
+            if embedding is not None:
+                product["embedding"] = embedding
+                store_entries.append((product.get("id"), content_hash, embedding))
+                computed_count += 1
+            else:
+                current_app.logger.warning(f"Failed to get ViT embedding for {product.get('name', 'Unknown')}")
+    return computed_count
+
+def _load_catalog_artifact(catalog_file_path):
+    """Loads the catalog artifact if it matches the catalog file, product images and ViT model. Returns True on success."""
+    global AI_PRODUCT_CATALOG, CATALOG_EMBEDDING_MATRIX, CATALOG_EMBEDDING_POSITIONS, CATALOG_EMBEDDING_IDS, CATALOG_VECTOR_INDEX, CATALOG_KEYWORD_INDEX, CATALOG_VERSION, CATALOG_POSITIONS_BY_ID
+    artifact_dir = get_artifact_dir(catalog_file_path)
+    meta = read_artifact_meta(artifact_dir)
+    if meta is None:
+        return False
+    if meta.get("vit_model") != VIT_MODEL_NAME:
+        current_app.logger.info(f"Catalog artifact was built with '{meta.get('vit_model')}', not '{VIT_MODEL_NAME}'. Ignoring it.")
+        return False
+    if meta.get("image_derivatives") != derivative_settings():
+        current_app.logger.info("Catalog artifact was built with other image derivative settings. Ignoring it.")
+        return False
+    try:
+        if not artifact_matches_source(meta, catalog_file_path):
+            current_app.logger.info(f"Catalog artifact is older than {DB_METADATA_FILE}. Ignoring it; rerun build_catalog_artifact.py.")
+            return False
+        if not product_images_match(meta.get("images"), current_app.root_path):
+            current_app.logger.info("Product images were added, removed or replaced since the catalog artifact was built. "
+                                    "Ignoring it; rerun build_catalog_artifact.py.")
+            return False
+        products, product_ids, positions, matrix, keyword_index = load_catalog_artifact(artifact_dir, meta)
+    except (OSError, ValueError, KeyError) as e:
+        current_app.logger.warning(f"Could not load catalog artifact {artifact_dir}: {e}")
+        return False
+
+    CATALOG_EMBEDDING_MATRIX, CATALOG_EMBEDDING_POSITIONS, CATALOG_EMBEDDING_IDS = None, None, None
+    CATALOG_VECTOR_INDEX = None
+    if matrix.shape[0]:
+        # Rows are stored L2-normalized, so the memory-mapped block is searched as is
+        CATALOG_EMBEDDING_MATRIX, CATALOG_EMBEDDING_POSITIONS, CATALOG_EMBEDDING_IDS = matrix, positions, product_ids[positions]
+        CATALOG_VECTOR_INDEX = _load_or_build_vector_index(catalog_file_path, matrix, meta.get("embeddings_digest"))
+        if CATALOG_VECTOR_INDEX.kind != "exact":
+            CATALOG_EMBEDDING_MATRIX = None
+    CATALOG_KEYWORD_INDEX = keyword_index
+    CATALOG_POSITIONS_BY_ID = _index_positions_by_id(product_ids.tolist())
+    CATALOG_VERSION = meta["catalog_version"]
+    AI_PRODUCT_CATALOG = products
+    CATALOG_PRODUCTS.set(len(products))
+    current_app.logger.info(f"Loaded catalog artifact with {len(products)} products ({matrix.shape[0]} embedded) from {os.path.basename(artifact_dir)}")
+    return True
+
+def precompute_catalog_artifact(num_processes=None):
+    """
+    Offline build step: embeds the catalog's new or changed images on a pool of processes, updates the embedding
+    store and writes the columnar catalog artifact that load_and_preprocess_catalog then loads directly.
+    Must run inside an app context whose root_path is the backend_flask folder. Returns the artifact directory, or None.
+    """
+    catalog_file_path = os.path.join(current_app.root_path, DB_METADATA_FILE)
+    try:
+        stamp = catalog_file_stamp(catalog_file_path)
+        with open(catalog_file_path, 'rb') as f:
+            raw_catalog_bytes = f.read()
+        raw_products = json.loads(raw_catalog_bytes)
+    except OSError as e:
+        current_app.logger.error(f"Cannot read {DB_METADATA_FILE}: {e}")
+        return None
+    except json.JSONDecodeError:
+        current_app.logger.error(f"Error decoding JSON from {DB_METADATA_FILE}.")
+        return None
+
+    cached_embeddings = load_embedding_store(catalog_file_path, VIT_MODEL_NAME)
+    products, store_entries, pending_embeddings = _resolve_products(raw_products, cached_embeddings)
+    new_embeddings = []
+    if pending_embeddings:
+        current_app.logger.info(f"Computing ViT embeddings for {len(pending_embeddings)} new or changed images...")
+        new_embeddings = extract_vit_features_multiprocess([image_path for image_path, _ in pending_embeddings.values()], num_processes)
+    computed_count = _assign_embeddings(pending_embeddings, new_embeddings, store_entries)
+    current_hashes = {content_hash for _, content_hash, _ in store_entries}
+    if computed_count > 0 or current_hashes != set(cached_embeddings):
+        save_embedding_store(catalog_file_path, VIT_MODEL_NAME, store_entries)
+
+    matrix, positions, _ = _build_embedding_matrix(products)
+    if matrix is None:
+        current_app.logger.warning("WARNING: No products were embedded; the artifact only supports keyword search.")
+        matrix, positions = np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64)
+    meta = {
+        "vit_model": VIT_MODEL_NAME,
+        "image_derivatives": derivative_settings(),
+        "source": dict(stamp, digest=compute_source_digest(raw_catalog_bytes)),
+        "images": product_images_meta(current_app.root_path),
+        # Lets startup match a saved vector index to these embeddings without hashing the memory-mapped block
+        "embeddings_digest": _embeddings_digest(matrix),
+        "catalog_version": _catalog_version(raw_catalog_bytes, store_entries),
+    }
+    artifact_dir = get_artifact_dir(catalog_file_path)
+    write_catalog_artifact(artifact_dir, meta, products, positions, matrix, KeywordIndex.build(products))
+    current_app.logger.info(f"Wrote catalog artifact with {len(products)} products ({matrix.shape[0]} embedded, "
+                            f"{computed_count} newly computed) to {os.path.basename(artifact_dir)}")
+    return artifact_dir
+
+def _snapshot_meta(catalog_file_path):
+    """
+    Settings a snapshot must have been built with to be reused; CATALOG_VERSION and the stamp of the product images
+    it was built from are stored alongside them.
+    """
+    return {
+        "source": catalog_file_stamp(catalog_file_path),
+        "vit_model": VIT_MODEL_NAME,
+        "image_derivatives": derivative_settings(),
+        "index_kind": VECTOR_INDEX_KIND,
+        "index_params": _index_build_params(),
+    }
+
+def _map_catalog_snapshot(catalog_file_path):
+    """Memory-maps the catalog snapshot if it matches the current catalog file and settings. Returns True on success."""
+    global AI_PRODUCT_CATALOG, CATALOG_EMBEDDING_MATRIX, CATALOG_EMBEDDING_POSITIONS, CATALOG_EMBEDDING_IDS, CATALOG_VECTOR_INDEX, CATALOG_KEYWORD_INDEX, CATALOG_VERSION, CATALOG_POSITIONS_BY_ID
+    snapshot_dir = get_snapshot_dir(catalog_file_path)
+    meta = read_snapshot_meta(snapshot_dir)
+    expected = _snapshot_meta(catalog_file_path)
+    if meta is None or any(meta.get(key) != value for key, value in expected.items()):
+        return False
+    if not product_images_match(meta.get("images"), current_app.root_path):
+        current_app.logger.info("Product images changed since the catalog snapshot was built. Rebuilding it.")
+        return False
+    try:
+        products, product_ids, positions, ids, vector_index, keyword_index = load_catalog_snapshot(snapshot_dir)
+    except (OSError, ValueError) as e:
+        current_app.logger.warning(f"Could not map catalog snapshot {snapshot_dir}: {e}")
+        return False
+
+    AI_PRODUCT_CATALOG = products
+    CATALOG_EMBEDDING_POSITIONS, CATALOG_EMBEDDING_IDS = positions, ids
+    CATALOG_VECTOR_INDEX, CATALOG_KEYWORD_INDEX = _apply_search_settings(vector_index), keyword_index
+    CATALOG_EMBEDDING_MATRIX = vector_index.vectors if vector_index.kind == "exact" else None
+    CATALOG_VERSION = meta["catalog_version"]
+    CATALOG_POSITIONS_BY_ID = _index_positions_by_id(product_ids.tolist())
+    CATALOG_PRODUCTS.set(len(products))
+    current_app.logger.info(f"Mapped catalog snapshot with {len(products)} products from {os.path.basename(snapshot_dir)}")
+    return True
+
+def _write_catalog_snapshot(catalog_file_path):
+    if CATALOG_VECTOR_INDEX is None:
+        current_app.logger.warning("No embedded products; skipping the shared catalog snapshot.")
+        return
+    snapshot_dir = get_snapshot_dir(catalog_file_path)
+    meta = dict(_snapshot_meta(catalog_file_path), images=product_images_meta(current_app.root_path), catalog_version=CATALOG_VERSION)
+    write_catalog_snapshot(snapshot_dir, meta,
+                           AI_PRODUCT_CATALOG, CATALOG_EMBEDDING_POSITIONS, CATALOG_EMBEDDING_IDS,
+                           CATALOG_VECTOR_INDEX, CATALOG_KEYWORD_INDEX)
+    current_app.logger.info(f"Wrote catalog snapshot to {os.path.basename(snapshot_dir)}")
+
+def _index_positions_by_id(product_ids):
+    """Maps each product id to the position of its first product."""
+    positions_by_id = {}
+    for position, product_id in enumerate(product_ids):
+        positions_by_id.setdefault(product_id, position)
+    return positions_by_id
+
+def _normalize_rows(matrix):
+    """L2-normalizes each row of a float32 matrix in place and returns it."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    matrix /= norms
+    return matrix
+
+def _build_embedding_matrix(products):
+    """
+    Pops each product's "embedding" into one contiguous, L2-normalized float32 matrix.
+    Returns (matrix, positions into `products`, product ids), or (None, None, None) if nothing is embedded.
+    """
+    positions, vectors = [], []
+    for position, product in enumerate(products):
+        embedding = product.pop("embedding", None)
+        if embedding is not None:
+            positions.append(position)
+            vectors.append(embedding)
+    if not vectors:
+        return None, None, None
+
+    matrix = _normalize_rows(np.ascontiguousarray(np.vstack(vectors), dtype=np.float32))
+    ids = np.array([str(products[position].get("id")) for position in positions])
+    return matrix, np.array(positions, dtype=np.int64), ids
+
+def _index_build_params():
+    """Build parameters of the VECTOR_INDEX_KIND index that change what is stored."""
+    return {"n_subspaces": VECTOR_INDEX_PQ_SUBSPACES} if VECTOR_INDEX_KIND == "pq" else {}
+
+def _apply_search_settings(index):
+    """Applies the current search-only settings to a saved index, which keeps the values it was built with."""
+    if index.kind == "ivf":
+        index.nprobe = VECTOR_INDEX_NPROBE
+    return index
+
+def _embeddings_digest(matrix):
+    """Digest of the embedding matrix, hashed in blocks of rows so it is never copied (or read whole from a memory map)."""
+    hasher = hashlib.blake2b(digest_size=16)
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    hasher.update(str(matrix.shape).encode())
+    for start in range(0, matrix.shape[0], EMBEDDING_DIGEST_BLOCK_ROWS):
+        hasher.update(memoryview(matrix[start:start + EMBEDDING_DIGEST_BLOCK_ROWS]))
+    return hasher.hexdigest()
+
+def _load_or_build_vector_index(catalog_file_path, matrix, embeddings_digest=None):
+    """
+    Loads the saved VECTOR_INDEX_KIND index if it was built from these exact embeddings, otherwise builds (and saves) it.
+    `embeddings_digest` is the matrix's _embeddings_digest when it was recorded ahead of time (catalog artifacts).
+    """
+    if VECTOR_INDEX_KIND == "exact":
+        return build_vector_index("exact", matrix)
+
+    base_path, _ = os.path.splitext(catalog_file_path)
+    index_dir = f"{base_path}.index.{VECTOR_INDEX_KIND}"
+    # Parameters that change the stored index (unlike nprobe, which only affects search) are part of the fingerprint
+    build_params = _index_build_params()
+    fingerprint = hashlib.blake2b(digest_size=16)
+    fingerprint.update(VIT_MODEL_NAME.encode() + json.dumps(build_params, sort_keys=True).encode())
+    fingerprint.update((embeddings_digest or _embeddings_digest(matrix)).encode())
+    fingerprint = fingerprint.hexdigest()
+
+    meta = read_vector_index_meta(index_dir)
+    if meta and meta.get("kind") == VECTOR_INDEX_KIND and meta.get("fingerprint") == fingerprint:
+        try:
+            index = _apply_search_settings(load_vector_index(index_dir))
+            current_app.logger.info(f"Loaded '{VECTOR_INDEX_KIND}' vector index from {os.path.basename(index_dir)}")
+            return index
+        except (OSError, ValueError) as e:
+            current_app.logger.warning(f"Could not load vector index from {index_dir}: {e}. Rebuilding.")
+
+    try:
+        current_app.logger.info(f"Building '{VECTOR_INDEX_KIND}' vector index over {matrix.shape[0]} embeddings...")
+        index = build_vector_index(VECTOR_INDEX_KIND, matrix, nprobe=VECTOR_INDEX_NPROBE, **build_params)
+    except ValueError as e:
+        current_app.logger.error(f"{e}. Falling back to exact search.")
+        return build_vector_index("exact", matrix)
+
+    try:
+        index.save(index_dir, fingerprint=fingerprint)
+    except OSError as e:
+        current_app.logger.error(f"Failed to save vector index to {index_dir}: {e}")
+    return index
+
+def search_similar_products(query_embedding, top_k, **search_params):
+    """
+    Finds the catalog products most similar to a query embedding by cosine similarity.
+    `search_params` are passed to the vector index (e.g. nprobe=32 for the IVF index).
+    Returns (catalog positions, similarity scores), both sorted by descending similarity.
+    """
+    if CATALOG_VECTOR_INDEX is None or query_embedding is None or top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    query = _normalize_rows(np.array(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+    with CATALOG_OPERATION_SECONDS.time(operation="vector_search"):
+        rows, similarities = CATALOG_VECTOR_INDEX.search(query, top_k, **search_params)
+    return CATALOG_EMBEDDING_POSITIONS[rows], similarities
+
+def count_keyword_matches(keywords):
+    """
+    Counts, per product, how many keywords occur in its searchable text (same semantics as a substring test).
+    Returns (catalog positions, match counts) for products with at least one match.
+    """
+    if CATALOG_KEYWORD_INDEX is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    with CATALOG_OPERATION_SECONDS.time(operation="keyword_match"):
+        return CATALOG_KEYWORD_INDEX.match_counts(keywords)
+
+def get_catalog_version():
+    """Returns a short hash identifying the loaded catalog, or None before it is loaded."""
+    return CATALOG_VERSION
 
 def get_catalog_products():
-    """Returns the processed product catalog with embeddings."""
-    return AI_PRODUCT_CATALOG
\ No newline at end of file
+    """Returns the processed product catalog. Embeddings live in the vector index, not in the product dicts."""
+    return AI_PRODUCT_CATALOG
+
+def get_product(product_id):
+    """Returns the catalog product with this id, or None."""
+    position = CATALOG_POSITIONS_BY_ID.get(str(product_id))
+    return AI_PRODUCT_CATALOG[position] if position is not None else None
+
+def get_products(product_ids):
+    """Returns the catalog products for a list of ids, in the same order; unknown ids are skipped."""
+    positions = [CATALOG_POSITIONS_BY_ID.get(str(product_id)) for product_id in product_ids]
+    return [AI_PRODUCT_CATALOG[position] for position in positions if position is not None]
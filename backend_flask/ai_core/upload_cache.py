@@ -0,0 +1,87 @@
+# backend_flask/ai_core/upload_cache.py
+import hashlib
+import os
+import numpy as np
+from PIL import Image
+from flask import current_app
+from ..caching import TTLCache, SQLiteCache, TieredCache
+from .vision_models import (
+    VIT_MODEL_NAME, OPENAI_VISION_MODEL, get_image_description_openai, is_image_description_error
+)
+from .inference_batcher import extract_vit_features_microbatched
+
+# How uploads are fingerprinted: "sha256" (exact bytes) or "phash" (perceptual difference hash,
+# so re-encoded or resized copies of the same photo share cached results)
+UPLOAD_FINGERPRINT_MODE = os.getenv("UPLOAD_FINGERPRINT_MODE", "sha256")
+# SQLite file (in the backend_flask folder) shared by all worker processes
+UPLOAD_CACHE_DB_FILENAME = "upload_cache.sqlite3"
+UPLOAD_CACHE_TTL_SECONDS = int(os.getenv("UPLOAD_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+UPLOAD_CACHE_MAX_ENTRIES = int(os.getenv("UPLOAD_CACHE_MAX_ENTRIES", "50000"))
+UPLOAD_MEMORY_CACHE_ENTRIES = int(os.getenv("UPLOAD_MEMORY_CACHE_ENTRIES", "512"))
+
+description_cache = None
+embedding_cache = None
+
+def compute_sha256(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def compute_perceptual_hash(image, hash_size=8):
+    """64-bit difference hash of a PIL image: compares neighbouring pixels of a small grayscale thumbnail."""
+    pixels = np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes().hex()
+
+def fingerprint_upload(decoded_image, mode=None):
+    """Returns the cache fingerprint for a DecodedImage upload, e.g. "sha256:ab12..." or "phash:f0e1...". """
+    mode = mode or UPLOAD_FINGERPRINT_MODE
+    if mode == "phash":
+        try:
+            return f"phash:{compute_perceptual_hash(decoded_image.pil_image)}"
+        except Exception as e:
+            current_app.logger.warning(f"Perceptual hash failed ({e}); falling back to sha256 fingerprint.")
+    return f"sha256:{compute_sha256(decoded_image.image_bytes)}"
+
+def get_upload_caches():
+    """Returns the (description cache, embedding cache) pair, creating them on first use."""
+    global description_cache, embedding_cache
+    if description_cache is None or embedding_cache is None:
+        db_path = os.path.join(current_app.root_path, UPLOAD_CACHE_DB_FILENAME)
+        memory_ttl = min(UPLOAD_CACHE_TTL_SECONDS, 3600)
+        description_cache = TieredCache(
+            TTLCache(max_entries=UPLOAD_MEMORY_CACHE_ENTRIES, ttl_seconds=memory_ttl),
+            SQLiteCache(db_path, namespace="image_description", ttl_seconds=UPLOAD_CACHE_TTL_SECONDS,
+                        max_entries=UPLOAD_CACHE_MAX_ENTRIES),
+        )
+        embedding_cache = TieredCache(
+            TTLCache(max_entries=UPLOAD_MEMORY_CACHE_ENTRIES, ttl_seconds=memory_ttl),
+            SQLiteCache(db_path, namespace="vit_embedding", ttl_seconds=UPLOAD_CACHE_TTL_SECONDS,
+                        max_entries=UPLOAD_CACHE_MAX_ENTRIES,
+                        serialize=lambda vector: np.asarray(vector, dtype=np.float32).tobytes(),
+                        deserialize=lambda blob: np.frombuffer(blob, dtype=np.float32)),
+        )
+    return description_cache, embedding_cache
+
+def get_image_description_cached(fingerprint, image_source, openai_client):
+    """get_image_description_openai, memoized by upload fingerprint. Failed descriptions are not cached."""
+    cache, _ = get_upload_caches()
+    cache_key = f"{OPENAI_VISION_MODEL}|{fingerprint}"
+    description = cache.get(cache_key)
+    if description is not None:
+        current_app.logger.info("Image description served from upload cache.")
+        return description
+    description = get_image_description_openai(image_source, openai_client)
+    if not is_image_description_error(description):
+        cache.set(cache_key, description)
+    return description
+
+def extract_vit_features_cached(fingerprint, image_source):
+    """Query-time ViT embedding (micro-batched when enabled), memoized by upload fingerprint."""
+    _, cache = get_upload_caches()
+    cache_key = f"{VIT_MODEL_NAME}|{fingerprint}"
+    embedding = cache.get(cache_key)
+    if embedding is not None:
+        current_app.logger.info("Query embedding served from upload cache.")
+        return embedding
+    embedding = extract_vit_features_microbatched(image_source)
+    if embedding is not None:
+        cache.set(cache_key, embedding)
+    return embedding
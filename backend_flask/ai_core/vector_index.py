@@ -0,0 +1,356 @@
+# backend_flask/ai_core/vector_index.py
+import json
+import os
+import numpy as np
+
+# Vector indexes over L2-normalized float32 embeddings (so inner product == cosine similarity).
+# Every index type exposes the same interface:
+#   build(matrix, **params) -> index      search(query, top_k, **params) -> (rows, scores)
+#   save(directory, **extra_meta)         load(directory, mmap_mode=None) -> index
+#   memory_bytes() -> size of the stored vectors/codes
+# Rows returned by search() are row numbers in the matrix the index was built from.
+# The compact kinds (float16, int8, pq) keep only compressed codes and score queries against them directly.
+
+VECTOR_INDEX_FORMAT_VERSION = 1
+# Compressed vectors are widened to float32 this many rows at a time while scoring, bounding temporary memory
+SCORE_CHUNK_ROWS = 8192
+
+def _top_k(scores, top_k):
+    """Returns the positions of the top_k scores, sorted by descending score."""
+    k = min(top_k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+def _save_arrays(directory, meta, arrays):
+    """Writes meta.json plus one .npy per array. meta.json is written last and marks the index as complete."""
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, "meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    tmp_meta_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_meta_path, "w") as f:
+        json.dump(dict(meta, format_version=VECTOR_INDEX_FORMAT_VERSION), f)
+    os.replace(tmp_meta_path, meta_path)
+
+def _load_array(directory, name, mmap_mode=None):
+    return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+def _read_meta(directory):
+    with open(os.path.join(directory, "meta.json"), "r") as f:
+        return json.load(f)
+
+def _chunked_scores(n, score_rows, chunk_rows=SCORE_CHUNK_ROWS):
+    """Fills an (n,) float32 score array with `score_rows(start, end)` one chunk of rows at a time."""
+    scores = np.empty(n, dtype=np.float32)
+    for start in range(0, n, chunk_rows):
+        end = min(n, start + chunk_rows)
+        scores[start:end] = score_rows(start, end)
+    return scores
+
+def _cluster_sums(points, assignments, n_clusters):
+    """Returns (per-cluster sums of `points`, member counts), using one reduceat over the points sorted by cluster."""
+    counts = np.bincount(assignments, minlength=n_clusters)
+    non_empty = counts > 0
+    order = np.argsort(assignments, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sums = np.zeros((n_clusters, points.shape[1]), dtype=np.float32)
+    sums[non_empty] = np.add.reduceat(points[order], starts[non_empty], axis=0)
+    return sums, counts
+
+class ExactIndex:
+    """Brute-force inner-product search: one matrix-vector product plus an argpartition top-k."""
+    kind = "exact"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @classmethod
+    def build(cls, matrix, **params):
+        return cls(np.ascontiguousarray(matrix, dtype=np.float32))
+
+    def search(self, query, top_k, **params):
+        scores = self.vectors @ query
+        rows = _top_k(scores, top_k)
+        return rows, scores[rows]
+
+    def save(self, directory, **extra_meta):
+        _save_arrays(directory, dict(extra_meta, kind=self.kind), {"vectors": self.vectors})
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        return cls(_load_array(directory, "vectors", mmap_mode))
+
+    def memory_bytes(self):
+        return self.vectors.nbytes
+
+class IVFIndex:
+    """
+    Inverted-file index: vectors are clustered with spherical k-means and stored grouped by cluster.
+    A query scores only the vectors in its `nprobe` closest clusters, so nprobe trades recall for speed.
+    """
+    kind = "ivf"
+
+    def __init__(self, centroids, list_offsets, list_rows, vectors, nprobe=16):
+        self.centroids = centroids        # (n_lists, dim)
+        self.list_offsets = list_offsets  # (n_lists + 1,) start of each list in `vectors`
+        self.list_rows = list_rows        # (n,) original row number of each stored vector
+        self.vectors = vectors            # (n, dim) vectors grouped by list
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    @staticmethod
+    def _assign(matrix, centroids, chunk_size=65536):
+        """Returns the index of the closest centroid for every row, processed in chunks to bound memory."""
+        assignments = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], chunk_size):
+            assignments[start:start + chunk_size] = np.argmax(matrix[start:start + chunk_size] @ centroids.T, axis=1)
+        return assignments
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, n_iter=10, sample_size=100000, nprobe=16, seed=0, **params):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        n = matrix.shape[0]
+        n_lists = min(n, n_lists or max(1, int(4 * np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+
+        # Train the centroids on a sample; large catalogs do not need every vector for this
+        sample = matrix[rng.choice(n, size=min(n, max(sample_size, n_lists)), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], size=n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            sums, counts = _cluster_sums(sample, cls._assign(sample, centroids), n_lists)
+            empty = counts == 0
+            # Re-seed empty clusters with random sample points
+            sums[empty] = sample[rng.choice(sample.shape[0], size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+
+        assignments = cls._assign(matrix, centroids)
+        list_rows = np.argsort(assignments, kind="stable")
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_offsets[1:])
+        return cls(centroids.astype(np.float32), list_offsets, list_rows, matrix[list_rows], nprobe=nprobe)
+
+    def search(self, query, top_k, nprobe=None, **params):
+        nprobe = min(self.n_lists, nprobe or self.nprobe)
+        probed_lists = _top_k(self.centroids @ query, nprobe)
+
+        candidate_scores, candidate_rows = [], []
+        for list_id in probed_lists:
+            start, end = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+            if start == end:
+                continue
+            candidate_scores.append(self.vectors[start:end] @ query)
+            candidate_rows.append(self.list_rows[start:end])
+        if not candidate_scores:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.concatenate(candidate_scores)
+        top = _top_k(scores, top_k)
+        return np.concatenate(candidate_rows)[top], scores[top]
+
+    def save(self, directory, **extra_meta):
+        _save_arrays(directory, dict(extra_meta, kind=self.kind, nprobe=self.nprobe), {
+            "centroids": self.centroids, "list_offsets": self.list_offsets,
+            "list_rows": self.list_rows, "vectors": self.vectors,
+        })
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        meta = _read_meta(directory)
+        return cls(_load_array(directory, "centroids"), _load_array(directory, "list_offsets"),
+                   _load_array(directory, "list_rows", mmap_mode), _load_array(directory, "vectors", mmap_mode),
+                   nprobe=meta.get("nprobe", 16))
+
+    def memory_bytes(self):
+        return self.centroids.nbytes + self.list_offsets.nbytes + self.list_rows.nbytes + self.vectors.nbytes
+
+class Float16Index:
+    """Brute-force search over vectors stored as float16: half the memory of float32, near-identical rankings."""
+    kind = "float16"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @classmethod
+    def build(cls, matrix, **params):
+        return cls(np.ascontiguousarray(matrix, dtype=np.float16))
+
+    def search(self, query, top_k, **params):
+        scores = _chunked_scores(len(self), lambda start, end: self.vectors[start:end].astype(np.float32) @ query)
+        rows = _top_k(scores, top_k)
+        return rows, scores[rows]
+
+    def save(self, directory, **extra_meta):
+        _save_arrays(directory, dict(extra_meta, kind=self.kind), {"vectors": self.vectors})
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        return cls(_load_array(directory, "vectors", mmap_mode))
+
+    def memory_bytes(self):
+        return self.vectors.nbytes
+
+class Int8Index:
+    """
+    Brute-force search over int8 codes with one float32 scale per vector (vector ~= scale * codes),
+    about a quarter of the float32 memory. Queries stay in float32 (asymmetric scoring).
+    """
+    kind = "int8"
+
+    def __init__(self, codes, scales):
+        self.codes = codes    # (n, dim) int8
+        self.scales = scales  # (n,) float32, max |component| / 127 of each vector
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @classmethod
+    def build(cls, matrix, **params):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127.0
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        for start in range(0, matrix.shape[0], SCORE_CHUNK_ROWS):
+            end = start + SCORE_CHUNK_ROWS
+            codes[start:end] = np.rint(matrix[start:end] / scales[start:end, None])
+        return cls(codes, scales.astype(np.float32))
+
+    def search(self, query, top_k, **params):
+        scores = _chunked_scores(len(self), lambda start, end:
+                                 (self.codes[start:end].astype(np.float32) @ query) * self.scales[start:end])
+        rows = _top_k(scores, top_k)
+        return rows, scores[rows]
+
+    def save(self, directory, **extra_meta):
+        _save_arrays(directory, dict(extra_meta, kind=self.kind), {"codes": self.codes, "scales": self.scales})
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        return cls(_load_array(directory, "codes", mmap_mode), _load_array(directory, "scales", mmap_mode))
+
+    def memory_bytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+class PQIndex:
+    """
+    Product quantization: each vector is split into `n_subspaces` sub-vectors, and each sub-vector is stored
+    as the uint8 id of its nearest centroid in that subspace's 256-entry codebook (n_subspaces bytes per vector).
+    Search uses asymmetric distance computation: the float32 query is scored against every codebook entry once,
+    and each vector's score is the sum of its codes' table entries. Rankings are approximate.
+    """
+    kind = "pq"
+
+    def __init__(self, codebooks, codes):
+        self.codebooks = codebooks  # (n_subspaces, n_centroids, sub_dim) float32
+        self.codes = codes          # (n_subspaces, n) uint8, stored per subspace so each table lookup is contiguous
+
+    def __len__(self):
+        return self.codes.shape[1]
+
+    @property
+    def n_subspaces(self):
+        return self.codebooks.shape[0]
+
+    @staticmethod
+    def _nearest(points, centroids, chunk_size=65536):
+        """Index of the closest centroid (Euclidean) for every row of `points`."""
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        nearest = np.empty(points.shape[0], dtype=np.int64)
+        for start in range(0, points.shape[0], chunk_size):
+            chunk = points[start:start + chunk_size]
+            nearest[start:start + chunk_size] = np.argmin(centroid_norms - 2.0 * (chunk @ centroids.T), axis=1)
+        return nearest
+
+    @classmethod
+    def _train_codebook(cls, points, n_centroids, n_iter, rng):
+        centroids = points[rng.choice(points.shape[0], size=n_centroids, replace=False)].copy()
+        for _ in range(n_iter):
+            sums, counts = _cluster_sums(points, cls._nearest(points, centroids), n_centroids)
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+            centroids[empty] = points[rng.choice(points.shape[0], size=int(empty.sum()))]
+        return centroids
+
+    @classmethod
+    def build(cls, matrix, n_subspaces=None, n_iter=10, sample_size=20000, seed=0, **params):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        n, dim = matrix.shape
+        n_subspaces = n_subspaces or max(1, dim // 8)
+        if dim % n_subspaces:
+            raise ValueError(f"PQ needs the embedding dimension ({dim}) to be divisible by n_subspaces ({n_subspaces})")
+        sub_dim = dim // n_subspaces
+        n_centroids = min(256, n)
+        rng = np.random.default_rng(seed)
+        sample = matrix[rng.choice(n, size=min(n, sample_size), replace=False)]
+
+        codebooks = np.empty((n_subspaces, n_centroids, sub_dim), dtype=np.float32)
+        codes = np.empty((n_subspaces, n), dtype=np.uint8)
+        for subspace in range(n_subspaces):
+            columns = slice(subspace * sub_dim, (subspace + 1) * sub_dim)
+            codebooks[subspace] = cls._train_codebook(np.ascontiguousarray(sample[:, columns]), n_centroids, n_iter, rng)
+            codes[subspace] = cls._nearest(matrix[:, columns], codebooks[subspace])
+        return cls(codebooks, codes)
+
+    def search(self, query, top_k, **params):
+        # One lookup table per subspace: inner product of the query's sub-vector with every centroid
+        tables = np.einsum("mkd,md->mk", self.codebooks, query.reshape(self.n_subspaces, -1))
+
+        def score_rows(start, end):
+            chunk_scores = np.zeros(end - start, dtype=np.float32)
+            for subspace in range(self.n_subspaces):
+                chunk_scores += tables[subspace].take(self.codes[subspace, start:end])
+            return chunk_scores
+
+        scores = _chunked_scores(len(self), score_rows, chunk_rows=SCORE_CHUNK_ROWS * 8)
+        rows = _top_k(scores, top_k)
+        return rows, scores[rows]
+
+    def save(self, directory, **extra_meta):
+        _save_arrays(directory, dict(extra_meta, kind=self.kind), {"codebooks": self.codebooks, "codes": self.codes})
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        return cls(_load_array(directory, "codebooks"), _load_array(directory, "codes", mmap_mode))
+
+    def memory_bytes(self):
+        return self.codebooks.nbytes + self.codes.nbytes
+
+# Registry of available index types. New backends only need to implement the interface above.
+VECTOR_INDEX_TYPES = {index_type.kind: index_type for index_type in (ExactIndex, IVFIndex, Float16Index, Int8Index, PQIndex)}
+
+def build_vector_index(kind, matrix, **params):
+    """Builds a vector index of the given kind ("exact", "ivf", "float16", "int8" or "pq") over a normalized float32 matrix."""
+    if kind not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"Unknown vector index kind '{kind}'. Available: {', '.join(VECTOR_INDEX_TYPES)}")
+    return VECTOR_INDEX_TYPES[kind].build(matrix, **params)
+
+def read_vector_index_meta(directory):
+    """Returns the saved index's meta.json contents, or None if there is no complete index in `directory`."""
+    try:
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("format_version") == VECTOR_INDEX_FORMAT_VERSION else None
+
+def load_vector_index(directory, mmap_mode=None):
+    """Loads a saved index of whichever kind is recorded in its meta.json."""
+    meta = read_vector_index_meta(directory)
+    if meta is None or meta.get("kind") not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"No usable vector index in {directory}")
+    return VECTOR_INDEX_TYPES[meta["kind"]].load(directory, mmap_mode=mmap_mode)
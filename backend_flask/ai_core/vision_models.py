@@ -1,53 +1,111 @@
 # backend_flask/ai_core/vision_models.py
 import os
+import io
 import base64
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 from PIL import Image
-import torch
-from transformers import ViTImageProcessor, ViTModel
-import openai as openai_sdk
 from flask import current_app
+from ..metrics import MODEL_LOAD_SECONDS, MODEL_INFERENCE_SECONDS, MODEL_INFERENCE_ITEMS, EXTERNAL_API_SECONDS, EXTERNAL_API_ERRORS
+# torch, transformers and the OpenAI SDK are imported inside the functions that use them,
+# so importing this module (and the app) stays fast; they load with the model
 
 # --- Global variables for the ViT Model ---
 # This ensures we only load the model into memory once.
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+DEVICE = None # "cuda" or "cpu", resolved when torch is first needed
 VIT_MODEL_NAME = 'google/vit-base-patch16-224-in21k'
+# Batched extraction settings (images per forward pass / threads used for decoding and preprocessing)
+VIT_BATCH_SIZE = int(os.getenv("VIT_BATCH_SIZE", "32"))
+VIT_PREPROCESS_WORKERS = int(os.getenv("VIT_PREPROCESS_WORKERS", str(min(8, os.cpu_count() or 1))))
+# Images per task handed to each process by extract_vit_features_multiprocess (offline catalog builds)
+VIT_PROCESS_CHUNK_SIZE = int(os.getenv("VIT_PROCESS_CHUNK_SIZE", "256"))
 image_processor_vit = None
 model_vit = None
 
+# OpenAI model used for image descriptions
+OPENAI_VISION_MODEL = "gpt-4o"
+# Seconds before the SDK gives up on a description request, so a pipeline thread is never held much longer than the
+# description stage's own timeout (PIPELINE_TIMEOUT_DESCRIPTION)
+OPENAI_REQUEST_TIMEOUT_SECONDS = float(os.getenv("OPENAI_REQUEST_TIMEOUT_SECONDS", "30"))
+# get_image_description_openai returns messages starting with these instead of a description when it fails
+IMAGE_DESCRIPTION_ERROR_PREFIXES = ("Image description not available", "Error from OpenAI API", "Error getting image description")
+
+def get_device():
+    """Returns the torch device for the ViT model, importing torch on first use."""
+    global DEVICE
+    if DEVICE is None:
+        import torch
+        DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    return DEVICE
+
 def load_vit_model():
     """Loads the Vision Transformer model and processor into memory."""
     global image_processor_vit, model_vit
     if image_processor_vit is None or model_vit is None:
         try:
-            current_app.logger.info(f"Loading ViT model: {VIT_MODEL_NAME} on device: {DEVICE}")
-            image_processor_vit = ViTImageProcessor.from_pretrained(VIT_MODEL_NAME)
-            model_vit = ViTModel.from_pretrained(VIT_MODEL_NAME).to(DEVICE)
-            model_vit.eval() # Set model to evaluation mode
+            from transformers import ViTImageProcessor, ViTModel
+            current_app.logger.info(f"Loading ViT model: {VIT_MODEL_NAME} on device: {get_device()}")
+            with MODEL_LOAD_SECONDS.time(model="vit"):
+                image_processor_vit = ViTImageProcessor.from_pretrained(VIT_MODEL_NAME)
+                model_vit = ViTModel.from_pretrained(VIT_MODEL_NAME).to(get_device())
+                model_vit.eval() # Set model to evaluation mode
             current_app.logger.info(f"Successfully loaded ViT model: {VIT_MODEL_NAME}")
         except Exception as e:
             current_app.logger.error(f"Error loading ViT model ({VIT_MODEL_NAME}): {e}. Visual search will not work.")
             image_processor_vit = None
             model_vit = None
 
+def is_vit_model_loaded():
+    return image_processor_vit is not None and model_vit is not None
+
+class DecodedImage:
+    """
+    An uploaded image decoded once in memory: the raw bytes (for remote APIs) and an RGB PIL image (for ViT).
+    Raises if the bytes are not a readable image.
+    """
+
+    def __init__(self, image_bytes):
+        self.image_bytes = image_bytes
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            self.mime_type = Image.MIME.get(img.format, "image/jpeg")
+            self.pil_image = img.convert("RGB")
+
+def _load_rgb_image(image_source):
+    """Returns an RGB PIL image from a file path, a DecodedImage or a PIL image."""
+    if isinstance(image_source, str):
+        return Image.open(image_source).convert("RGB")
+    if isinstance(image_source, DecodedImage):
+        return image_source.pil_image
+    # Assumes it's a PIL Image; avoid copying images that are already RGB
+    return image_source if image_source.mode == "RGB" else image_source.convert("RGB")
+
+def _preprocess_for_batch(image_path_or_pil):
+    """Decodes and preprocesses one image for a batch. Runs on worker threads, so errors are returned instead of logged."""
+    try:
+        img = _load_rgb_image(image_path_or_pil)
+        return image_processor_vit(images=img, return_tensors="np")["pixel_values"][0], None
+    except Exception as e:
+        return None, e
+
 def extract_vit_features(image_path_or_pil):
-    """Extracts features (embedding) from a given image using the loaded ViT model."""
+    """Extracts features (embedding) from an image path, DecodedImage or PIL image using the loaded ViT model."""
     # Ensure models are loaded
     if image_processor_vit is None or model_vit is None:
         current_app.logger.error("ViT model or processor not available for feature extraction.")
         return None
     try:
+        import torch
         # Open image from file path or use provided PIL image object
-        if isinstance(image_path_or_pil, str):
-            img = Image.open(image_path_or_pil).convert("RGB")
-        else: # Assumes it's a PIL Image
-            img = image_path_or_pil.convert("RGB")
+        img = _load_rgb_image(image_path_or_pil)
 
         # Process the image and move tensors to the correct device (CPU/GPU)
-        inputs = image_processor_vit(images=img, return_tensors="pt").to(DEVICE)
+        inputs = image_processor_vit(images=img, return_tensors="pt").to(get_device())
         
         # Get model output without calculating gradients
-        with torch.no_grad():
+        with torch.no_grad(), MODEL_INFERENCE_SECONDS.time(model="vit", mode="single"):
             outputs = model_vit(**inputs)
+        MODEL_INFERENCE_ITEMS.inc(model="vit")
         
         # The CLS token embedding is a good representation of the entire image
         features = outputs.last_hidden_state[:, 0, :].cpu().numpy()
@@ -56,38 +114,143 @@ def extract_vit_features(image_path_or_pil):
         current_app.logger.error(f"Error extracting ViT features: {e}")
         return None
 
-def get_image_description_openai(image_path, openai_client):
-    """Gets a detailed text description of an image using OpenAI's GPT-4o model."""
+def extract_vit_features_batch(images, batch_size=None, num_workers=None):
+    """
+    Extracts ViT embeddings for a list of image paths, DecodedImages and/or PIL images.
+    Images are decoded and preprocessed on a thread pool while the previous batch runs through the model.
+    Returns a list aligned with `images`; entries that could not be processed are None.
+    """
+    if image_processor_vit is None or model_vit is None:
+        current_app.logger.error("ViT model or processor not available for feature extraction.")
+        return [None] * len(images)
+
+    import torch
+    batch_size = max(1, batch_size or VIT_BATCH_SIZE)
+    num_workers = max(1, num_workers or VIT_PREPROCESS_WORKERS)
+    results = [None] * len(images)
+    batch_starts = range(0, len(images), batch_size)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        def submit_batch(start):
+            return [executor.submit(_preprocess_for_batch, img) for img in images[start:start + batch_size]]
+
+        pending = submit_batch(0) if images else []
+        for batch_number, start in enumerate(batch_starts):
+            futures = pending
+            # Queue up the next batch so decoding overlaps with this forward pass
+            next_start = start + batch_size
+            pending = submit_batch(next_start) if next_start < len(images) else []
+
+            valid_positions, pixel_arrays = [], []
+            for offset, future in enumerate(futures):
+                pixel_values, error = future.result()
+                if error is not None:
+                    current_app.logger.error(f"Error preprocessing image {start + offset} for ViT: {error}")
+                    continue
+                valid_positions.append(start + offset)
+                pixel_arrays.append(pixel_values)
+
+            if not pixel_arrays:
+                continue
+            try:
+                pixel_tensor = torch.from_numpy(np.stack(pixel_arrays)).to(get_device())
+                with torch.inference_mode(), MODEL_INFERENCE_SECONDS.time(model="vit", mode="batch"):
+                    outputs = model_vit(pixel_values=pixel_tensor)
+                features = outputs.last_hidden_state[:, 0, :].cpu().numpy()
+                MODEL_INFERENCE_ITEMS.inc(len(pixel_arrays), model="vit")
+            except Exception as e:
+                current_app.logger.error(f"Error extracting ViT features for batch {batch_number}: {e}")
+                continue
+
+            for position, feature in zip(valid_positions, features):
+                results[position] = feature
+
+    return results
+
+def _init_vit_worker(model_name, torch_threads):
+    """Runs once in each extract_vit_features_multiprocess worker: gives it an app context and its own model copy."""
+    global VIT_MODEL_NAME
+    import torch
+    from flask import Flask
+    torch.set_num_threads(torch_threads)
+    VIT_MODEL_NAME = model_name
+    Flask(__name__).app_context().push()
+    load_vit_model()
+
+def _extract_vit_features_chunk(image_paths):
+    return extract_vit_features_batch(image_paths, num_workers=1)
+
+def extract_vit_features_multiprocess(image_paths, num_processes=None, chunk_size=None):
+    """
+    Extracts ViT embeddings for image files on a pool of processes, each loading its own model and using an equal
+    share of the CPU cores. Meant for offline catalog builds; on a GPU, or with one process, this is
+    extract_vit_features_batch in the calling process. Returns a list aligned with `image_paths` (None for failures).
+    """
+    num_processes = max(1, num_processes or os.cpu_count() or 1)
+    chunk_size = max(1, chunk_size or VIT_PROCESS_CHUNK_SIZE)
+    if num_processes == 1 or len(image_paths) <= chunk_size or get_device() == "cuda":
+        if not is_vit_model_loaded():
+            load_vit_model()
+        return extract_vit_features_batch(image_paths)
+
+    chunks = [image_paths[start:start + chunk_size] for start in range(0, len(image_paths), chunk_size)]
+    num_processes = min(num_processes, len(chunks))
+    torch_threads = max(1, (os.cpu_count() or 1) // num_processes)
+    current_app.logger.info(f"Extracting ViT features for {len(image_paths)} images on {num_processes} processes "
+                            f"({torch_threads} torch threads each)...")
+    results = []
+    # spawn, not fork: forking a process that has already initialized torch's thread pools can deadlock
+    with ProcessPoolExecutor(max_workers=num_processes, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_vit_worker, initargs=(VIT_MODEL_NAME, torch_threads)) as executor:
+        for chunk_results in executor.map(_extract_vit_features_chunk, chunks):
+            results.extend(chunk_results)
+    return results
+
+def get_image_description_openai(image_source, openai_client):
+    """Gets a detailed text description of an image (file path or DecodedImage) using OpenAI's GPT-4o model."""
     if not openai_client:
         current_app.logger.warning("OpenAI client not available. Skipping OpenAI Vision call.")
         return "Image description not available (OpenAI client not configured)."
+    import openai as openai_sdk
     try:
-        # Read the image file and encode it in base64
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Describe this image focusing on apparel, accessories, style, colors, patterns, and material. Provide a concise but detailed summary useful for e-commerce search."},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                        },
-                    ],
-                }
-            ],
-            max_tokens=300
-        )
+        # Encode the image in base64, reading it from disk only if it is not already in memory
+        if isinstance(image_source, DecodedImage):
+            image_bytes, mime_type = image_source.image_bytes, image_source.mime_type
+        else:
+            with open(image_source, "rb") as image_file:
+                image_bytes, mime_type = image_file.read(), "image/jpeg"
+        base64_image = base64.b64encode(image_bytes).decode('utf-8')
+
+        with EXTERNAL_API_SECONDS.time(service="openai"):
+            response = openai_client.chat.completions.create(
+                model=OPENAI_VISION_MODEL,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": "Describe this image focusing on apparel, accessories, style, colors, patterns, and material. Provide a concise but detailed summary useful for e-commerce search."},
+                            {
+                                "type": "image_url",
+                                "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}
+                            },
+                        ],
+                    }
+                ],
+                max_tokens=300,
+                timeout=OPENAI_REQUEST_TIMEOUT_SECONDS,
+            )
         description = response.choices[0].message.content
         current_app.logger.info(f"OpenAI Vision Description generated.")
         return description
     except openai_sdk.APIError as e:
+        EXTERNAL_API_ERRORS.inc(service="openai")
         current_app.logger.error(f"OpenAI API Error in vision_models: {e.message}")
         return f"Error from OpenAI API: {e.message}"
     except Exception as e:
+        EXTERNAL_API_ERRORS.inc(service="openai")
         current_app.logger.error(f"General error with OpenAI Vision API call: {e}")
-        return f"Error getting image description: {str(e)}"
\ No newline at end of file
+        return f"Error getting image description: {str(e)}"
+
+def is_image_description_error(description):
+    """True if `description` is one of the fallback messages returned when the OpenAI call fails."""
+    return not description or description.startswith(IMAGE_DESCRIPTION_ERROR_PREFIXES)
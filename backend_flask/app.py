@@ -1,16 +1,19 @@
 import os
 import uuid
 import json
+import time
 import sqlite3
+import queue
+import threading
+from functools import wraps
 from datetime import datetime
 from flask import (
     Flask, request, jsonify, render_template, url_for,
-    current_app, send_from_directory, session
+    current_app, send_from_directory, send_file, session, Response, g, abort
 )
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
 # Flask extensions
 from flask_bcrypt import Bcrypt
@@ -18,25 +21,42 @@ from flask_login import LoginManager, UserMixin, login_user, logout_user, login_
 
 # Custom Modules
 from . import db
-from .models import User
-from .ai_core.vision_models import load_vit_model, extract_vit_features, get_image_description_openai
-from .ai_core.language_models import load_spacy_model, extract_keywords_spacy, get_refined_search_gemini
-from .ai_core.product_catalog import load_and_preprocess_catalog, get_catalog_products
+from .models import User, user_cache
+from .caching import RefreshingCache
+from .image_derivatives import (
+    IMAGE_DERIVATIVE_URL_PREFIX, IMAGE_IMMUTABLE_MAX_AGE, IMAGE_REVALIDATE_MAX_AGE, URL_VERSION_LENGTH,
+    resolve_derivative_request, source_content_hash, ensure_derivative, derivative_etag, derivative_mimetype, source_hash_cache
+)
+from .metrics import render_metrics, HTTP_REQUEST_SECONDS, PIPELINE_STAGE_SECONDS, PIPELINE_STAGE_OUTCOMES
+from .ai_core.vision_models import load_vit_model, is_vit_model_loaded, get_image_description_openai, DecodedImage, OPENAI_REQUEST_TIMEOUT_SECONDS
+from .ai_core.language_models import (
+    load_spacy_model, is_spacy_model_loaded, extract_keywords_spacy, get_refined_search_gemini, get_gemini_cache, spacy_keyword_cache,
+    is_reusable_refinement, REFINEMENT_UNAVAILABLE
+)
+from .ai_core.upload_cache import fingerprint_upload, compute_sha256, get_image_description_cached, extract_vit_features_cached, get_upload_caches
+from .ai_core.pipeline import PipelineStage, run_pipeline
+from .ai_core.inference_batcher import extract_vit_features_microbatched, get_vit_batcher, VIT_MICROBATCH_ENABLED
+from .ai_core.product_catalog import load_and_preprocess_catalog, get_catalog_products, search_similar_products, count_keyword_matches, get_catalog_version, get_product, get_products
 
 # Load environment variables from .env file
 load_dotenv()
 
 # --- Initialize AI API Clients ---
-# OpenAI SDK
-import openai
 openai_client = None
-if os.getenv("OPENAI_API_KEY"):
-    openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Google Generative AI
-import google.generativeai as genai
-if os.getenv("GOOGLE_API_KEY"):
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+def init_api_clients():
+    """Creates the OpenAI client and configures Gemini. The SDKs are imported here, not at app import."""
+    global openai_client
+    # OpenAI SDK
+    if os.getenv("OPENAI_API_KEY"):
+        import openai
+        # Requests time out with the description stage, and a retry would finish after the stage has given up anyway
+        openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=OPENAI_REQUEST_TIMEOUT_SECONDS, max_retries=0)
+
+    # Google Generative AI
+    if os.getenv("GOOGLE_API_KEY"):
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 # --- Flask App Initialization & Configuration ---
 app = Flask(__name__)
@@ -44,6 +64,26 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev_secret_key_change_this_123!')
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+# Uploads are processed in memory; set to write every upload to UPLOAD_FOLDER for server-side previews
+app.config['PERSIST_UPLOAD_PREVIEWS'] = os.getenv('PERSIST_UPLOAD_PREVIEWS', '').lower() in ('1', 'true', 'yes')
+# Persisted uploads are named by content hash and never change, so browsers may keep them (privately) for this long
+app.config['UPLOAD_PREVIEW_MAX_AGE'] = int(os.getenv('UPLOAD_PREVIEW_MAX_AGE', str(7 * 24 * 3600)))
+# Text-only recommendation results are cached per (normalized prompt, top_k, catalog version)
+app.config['RECOMMENDATION_CACHE_MAX_ENTRIES'] = int(os.getenv('RECOMMENDATION_CACHE_MAX_ENTRIES', '512'))
+app.config['RECOMMENDATION_CACHE_TTL_SECONDS'] = int(os.getenv('RECOMMENDATION_CACHE_TTL_SECONDS', '900'))
+app.config['RECOMMENDATION_CACHE_REFRESH_SECONDS'] = int(os.getenv('RECOMMENDATION_CACHE_REFRESH_SECONDS', '300'))
+# Per-stage timeouts (seconds) for the recommendation pipeline; a stage that times out falls back to an empty result
+app.config['PIPELINE_STAGE_TIMEOUTS'] = {
+    stage: float(os.getenv(f'PIPELINE_TIMEOUT_{stage.upper()}', default))
+    for stage, default in {"description": 30, "embedding": 15, "visual_search": 5, "keywords": 5, "refinement": 20}.items()
+}
+# Return from app import immediately and load the API clients, models and catalog on a background thread.
+# Routes that need them answer 503 until /readyz reports ready. Do not combine with gunicorn --preload.
+app.config['LAZY_MODEL_LOADING'] = os.getenv('LAZY_MODEL_LOADING', '').lower() in ('1', 'true', 'yes')
+# Most products a single cart or wishlist batch request may change
+app.config['USER_DATA_BATCH_MAX_ITEMS'] = int(os.getenv('USER_DATA_BATCH_MAX_ITEMS', '500'))
+HOMEPAGE_PROMPT = "popular trending fashion"
+HOMEPAGE_TOP_K = 8
 
 bcrypt = Bcrypt(app)
 login_manager = LoginManager()
@@ -51,22 +91,85 @@ login_manager.init_app(app)
 
 db.init_app(app)
 
+def is_cacheable_recommendation(result):
+    """
+    Never pin an empty result (e.g. catalog unavailable) or one ranked after the Gemini refinement timed out or failed
+    for the whole TTL. Without an API key every refinement is the same error, so those results are kept.
+    """
+    recommendations, _, gemini_refinement, _ = result
+    return bool(recommendations) and is_reusable_refinement(gemini_refinement)
+
+recommendation_cache = RefreshingCache(
+    max_entries=app.config['RECOMMENDATION_CACHE_MAX_ENTRIES'],
+    ttl_seconds=app.config['RECOMMENDATION_CACHE_TTL_SECONDS'],
+    refresh_after_seconds=app.config['RECOMMENDATION_CACHE_REFRESH_SECONDS'],
+    should_cache=is_cacheable_recommendation,
+)
+
+# --- Request metrics ---
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Labelled by URL rule, not path, to keep the number of series bounded; streamed bodies are timed to their headers
+    started_at = g.pop('request_started_at', None)
+    if started_at is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started_at, method=request.method, route=route, status=response.status_code)
+    return response
+
 # --- User Loader for Flask-Login ---
 @login_manager.user_loader
 def load_user(user_id_str):
-    return User.get_by_id(user_id_str)
+    return User.get_by_id_cached(user_id_str)
 
 # --- Initialize AI Models and Data Catalog on Startup ---
 with app.app_context():
     # Ensure the upload folder exists
     upload_folder_path = os.path.join(current_app.root_path, app.config['UPLOAD_FOLDER'])
     os.makedirs(upload_folder_path, exist_ok=True)
-    
-    app.logger.info("Initializing AI models and services...")
-    load_vit_model()
-    load_spacy_model()
-    load_and_preprocess_catalog()
-    app.logger.info("AI services initialization complete.")
+
+# Which warmup steps have succeeded, reported by /readyz
+warmup_status = {"api_clients": False, "vit_model": False, "spacy_model": False, "catalog": False}
+warmup_complete = threading.Event()
+
+def warm_up_ai_services():
+    """Loads the API clients, models and product catalog, then keeps the homepage recommendations warm."""
+    started_at = time.perf_counter()
+    with app.app_context():
+        app.logger.info("Initializing AI models and services...")
+        try:
+            init_api_clients()
+            warmup_status["api_clients"] = True
+            load_vit_model()
+            warmup_status["vit_model"] = is_vit_model_loaded()
+            load_spacy_model()
+            warmup_status["spacy_model"] = is_spacy_model_loaded()
+            load_and_preprocess_catalog()
+            warmup_status["catalog"] = bool(get_catalog_products())
+        except Exception as e:
+            app.logger.error(f"AI services initialization failed: {e}")
+        app.logger.info(f"AI services initialization complete in {time.perf_counter() - started_at:.1f}s.")
+    warmup_status["seconds"] = round(time.perf_counter() - started_at, 2)
+    warmup_complete.set()
+    recommendation_cache.keep_warm(*_text_recommendation_job(HOMEPAGE_PROMPT, HOMEPAGE_TOP_K))
+
+def ai_services_ready():
+    return warmup_complete.is_set() and warmup_status["vit_model"] and warmup_status["spacy_model"] and warmup_status["catalog"]
+
+def requires_ai_services(view):
+    """Answers 503 (with Retry-After) while the models and catalog are still loading in lazy startup mode."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not warmup_complete.is_set():
+            response = jsonify({"error": "AI services are still starting up. Please retry shortly."})
+            response.status_code = 503
+            response.headers["Retry-After"] = "5"
+            return response
+        return view(*args, **kwargs)
+    return wrapper
 
 # --- Helper Function ---
 def allowed_file(filename):
@@ -74,85 +177,190 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 # --- Core Recommendation Logic ---
-def generate_final_recommendations(query_image_path=None, text_prompt="", top_k=12):
-    current_catalog_with_embeddings = get_catalog_products()
-    if not current_catalog_with_embeddings:
-        app.logger.error("Product catalog is empty. Cannot generate recommendations.")
-        return [], "Error: Product catalog unavailable.", {}
-
-    openai_description = "N/A"
-    gemini_refinement = {}
-    visual_recommendations = []
-
-    # 1. Visual Search (if an image is provided)
-    if query_image_path:
-        if openai_client:
-            openai_description = get_image_description_openai(query_image_path, openai_client)
-        
-        query_embedding = extract_vit_features(query_image_path)
-        if query_embedding is not None:
-            # Prepare catalog embeddings for comparison
-            products_with_embeddings = [p for p in current_catalog_with_embeddings if p.get("embedding") is not None]
-            if products_with_embeddings:
-                db_embeddings = np.array([p["embedding"] for p in products_with_embeddings])
-                similarities = cosine_similarity(query_embedding.reshape(1, -1), db_embeddings)[0]
-                
-                # Get top N visually similar items
-                sorted_indices = np.argsort(similarities)[::-1]
-                for i in sorted_indices[:top_k * 2]: # Get more initial candidates
-                    product = products_with_embeddings[i].copy()
-                    product["visual_score"] = float(similarities[i])
-                    visual_recommendations.append(product)
-    
-    # 2. Text and Language Model Processing
-    spacy_keywords = extract_keywords_spacy(text_prompt) if text_prompt else []
-    
-    if text_prompt or openai_description != "N/A":
-        gemini_refinement = get_refined_search_gemini(openai_description, text_prompt)
+# (catalog positions, similarity scores) when there is no image or visual search fails
+NO_VISUAL_RESULTS = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+
+def build_recommendation_stages(query_image=None, text_prompt="", top_k=12, image_fingerprint=None):
+    """
+    Describes the recommendation pipeline as a dependency graph of stages.
+    `query_image` is an image file path or an in-memory DecodedImage.
+    The OpenAI description, ViT embedding and spaCy keywords are independent; only Gemini waits for the description.
+    """
+    timeouts = app.config['PIPELINE_STAGE_TIMEOUTS']
+
+    def describe_image():
+        if not openai_client:
+            return "N/A"
+        # Uploads with a fingerprint reuse the description of earlier identical uploads
+        if image_fingerprint:
+            return get_image_description_cached(image_fingerprint, query_image, openai_client)
+        return get_image_description_openai(query_image, openai_client)
+
+    def embed_image():
+        if image_fingerprint:
+            return extract_vit_features_cached(image_fingerprint, query_image)
+        return extract_vit_features_microbatched(query_image)
+
+    def visual_search(embedding):
+        # Get top N visually similar items from the precomputed embedding matrix (more initial candidates than top_k)
+        return search_similar_products(embedding, top_k * 2)
+
+    def extract_keywords():
+        return extract_keywords_spacy(text_prompt) if text_prompt else []
+
+    def refine_query(description="N/A"):
+        if text_prompt or description != "N/A":
+            return get_refined_search_gemini(description, text_prompt)
+        return {}
+
+    stages = [PipelineStage("keywords", extract_keywords, timeout=timeouts["keywords"], default=[])]
+    if not query_image:
+        stages.append(PipelineStage("refinement", refine_query, timeout=timeouts["refinement"], default=REFINEMENT_UNAVAILABLE, remote=True))
+        return stages
+    return stages + [
+        PipelineStage("description", describe_image, timeout=timeouts["description"], default="N/A", remote=True),
+        PipelineStage("embedding", embed_image, timeout=timeouts["embedding"], default=None),
+        PipelineStage("visual_search", visual_search, depends_on=["embedding"], timeout=timeouts["visual_search"], default=NO_VISUAL_RESULTS),
+        PipelineStage("refinement", refine_query, depends_on=["description"], timeout=timeouts["refinement"],
+                      default=REFINEMENT_UNAVAILABLE, remote=True),
+    ]
+
+def score_recommendations(visual_positions, visual_scores, spacy_keywords, gemini_refinement, top_k=12):
+    """Combines visual similarity and keyword matches into the final ranked list of product dicts."""
+    current_catalog = get_catalog_products()
 
-    # 3. Combine and Score all products
-    # Start with visual recommendations if they exist, otherwise use the whole catalog
-    candidate_products = visual_recommendations if visual_recommendations else [p.copy() for p in current_catalog_with_embeddings]
-    
     all_search_keywords = set(spacy_keywords)
     if isinstance(gemini_refinement, dict):
         all_search_keywords.update(gemini_refinement.get("key_attributes", []))
         all_search_keywords.update(gemini_refinement.get("refined_search_query", "").lower().split())
 
-    scored_recommendations = []
-    for product in candidate_products:
-        score = product.get("visual_score", 0.0) * 10.0 # Weight visual similarity highly
-        
-        # Combine product metadata into a searchable text block
-        product_text_corpus = (f"{product.get('name','')} {product.get('description','')} {product.get('type','')} "
-                               f"{product.get('category','')} {' '.join(product.get('color_tags',[]))}").lower()
-        
-        # Add points for each matching keyword
-        text_match_count = sum(1 for kw in all_search_keywords if kw in product_text_corpus)
-        score += text_match_count * 2.0
-
-        product["final_score"] = score
-        scored_recommendations.append(product)
-
-    # Sort by the final combined score
-    scored_recommendations.sort(key=lambda x: x.get("final_score", 0), reverse=True)
-    
-    final_recs_list = scored_recommendations[:top_k]
-    
-    # Clean up final list for JSON response
-    for rec in final_recs_list:
-        if "embedding" in rec: del rec["embedding"]
-        if "visual_score" in rec: del rec["visual_score"]
+    # Products matching at least one keyword, with the number of keywords each one matches
+    matched_positions, match_counts = count_keyword_matches(all_search_keywords)
+
+    if visual_positions.size:
+        # Score the visual candidates: visual similarity is weighted highly, plus points for each matching keyword
+        text_match_counts = np.zeros(visual_positions.size)
+        if matched_positions.size:
+            lookup = np.minimum(np.searchsorted(matched_positions, visual_positions), matched_positions.size - 1)
+            found = matched_positions[lookup] == visual_positions
+            text_match_counts[found] = match_counts[lookup[found]]
+        scores = visual_scores.astype(np.float64) * 10.0 + text_match_counts * 2.0
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        selected_positions, selected_scores = visual_positions[order], scores[order]
+    else:
+        # Without visual candidates the whole catalog competes, but only keyword matches can score above zero.
+        # Rank matches by count (catalog order breaks ties), then pad with unmatched products in catalog order.
+        order = np.lexsort((matched_positions, -match_counts))[:top_k]
+        selected_positions, selected_scores = list(matched_positions[order]), list(match_counts[order] * 2.0)
+        matched = set(selected_positions)
+        for position in range(len(current_catalog)):
+            if len(selected_positions) >= top_k:
+                break
+            if position not in matched:
+                selected_positions.append(position)
+                selected_scores.append(0.0)
+
+    # Only the final recommendations are copied out of the catalog for the JSON response
+    final_recs_list = []
+    for position, score in zip(selected_positions, selected_scores):
+        rec = current_catalog[int(position)].copy()
+        rec["final_score"] = float(score)
+        final_recs_list.append(rec)
+
+    return final_recs_list
+
+def generate_final_recommendations(query_image=None, text_prompt="", top_k=12, image_fingerprint=None, on_visual_results=None):
+    """
+    Runs the recommendation pipeline and returns (recommendations, OpenAI description, Gemini refinement, stage timings in ms).
+    If the visual search and keywords finish before the Gemini refinement, `on_visual_results(recommendations, elapsed ms)`
+    is called with a preliminary ranking that ignores the refinement.
+    """
+    if not get_catalog_products():
+        app.logger.error("Product catalog is empty. Cannot generate recommendations.")
+        return [], "Error: Product catalog unavailable.", {}, {}
+
+    started_at = time.perf_counter()
+    stages = build_recommendation_stages(query_image, text_prompt, top_k, image_fingerprint)
+
+    def report_visual_results(stage_name, results):
+        if stage_name not in ("visual_search", "keywords") or "refinement" in results:
+            return
+        if "visual_search" in results and "keywords" in results and results["visual_search"][0].size:
+            visual_positions, visual_scores = results["visual_search"]
+            preliminary_recs = score_recommendations(visual_positions, visual_scores, results["keywords"], {}, top_k)
+            on_visual_results(preliminary_recs, round((time.perf_counter() - started_at) * 1000, 2))
+
+    results, stage_timings, stage_statuses = run_pipeline(stages, on_stage_complete=report_visual_results if on_visual_results else None)
+
+    scoring_started_at = time.perf_counter()
+    visual_positions, visual_scores = results.get("visual_search", NO_VISUAL_RESULTS)
+    final_recs_list = score_recommendations(visual_positions, visual_scores, results["keywords"], results["refinement"], top_k)
+    stage_timings["scoring"] = round((time.perf_counter() - scoring_started_at) * 1000, 2)
+    stage_timings["total"] = round((time.perf_counter() - started_at) * 1000, 2)
+
+    for stage_name, elapsed_ms in stage_timings.items():
+        PIPELINE_STAGE_SECONDS.observe(elapsed_ms / 1000, stage=stage_name)
+    for stage_name, status in stage_statuses.items():
+        PIPELINE_STAGE_OUTCOMES.inc(stage=stage_name, status=status)
+
+    return final_recs_list, results.get("description", "N/A"), results["refinement"], stage_timings
+
+def normalize_prompt(text_prompt):
+    """Lowercases a prompt and collapses whitespace so equivalent prompts share a cache entry."""
+    return " ".join((text_prompt or "").lower().split())
+
+def _text_recommendation_job(text_prompt, top_k):
+    """Returns the (cache key, compute callable) pair for a text-only recommendation request."""
+    normalized_prompt = normalize_prompt(text_prompt)
+    cache_key = (normalized_prompt, top_k, get_catalog_version())
+    def compute():
+        with app.app_context():
+            return generate_final_recommendations(text_prompt=normalized_prompt, top_k=top_k)
+    return cache_key, compute
+
+def get_cached_text_recommendations(text_prompt, top_k=12):
+    """Text-only recommendations through the result cache. Stale entries are served while refreshed in the background."""
+    return recommendation_cache.get_or_compute(*_text_recommendation_job(text_prompt, top_k))
+
+# Compute the homepage recommendations in the background and keep them refreshed, so GET / never waits on them
+if app.config['LAZY_MODEL_LOADING']:
+    threading.Thread(target=warm_up_ai_services, name="ai-warmup", daemon=True).start()
+else:
+    warm_up_ai_services()
+
+# --- Health Routes ---
+@app.route('/healthz')
+def healthz_route():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz')
+def readyz_route():
+    """Readiness: the models and product catalog are loaded."""
+    ready = ai_services_ready()
+    return jsonify({
+        "ready": ready,
+        "warmup_complete": warmup_complete.is_set(),
+        "components": {name: warmup_status[name] for name in ("api_clients", "vit_model", "spacy_model", "catalog")},
+        "warmup_seconds": warmup_status.get("seconds"),
+    }), 200 if ready else 503
 
-    return final_recs_list, openai_description, gemini_refinement
+@app.route('/metrics')
+def metrics_route():
+    """Counters and latency histograms of this worker process, in the Prometheus text format."""
+    return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 # --- Main Application Routes ---
 @app.route('/')
 def index_route():
-    recs, _, _ = generate_final_recommendations(text_prompt="popular trending fashion", top_k=8)
+    # While warming up, serve the page straight away without the homepage recommendations
+    recs = []
+    if warmup_complete.is_set():
+        recs, _, _, _ = get_cached_text_recommendations(HOMEPAGE_PROMPT, top_k=HOMEPAGE_TOP_K)
     return render_template('index.html', initial_recommendations=json.dumps(recs))
 
 @app.route('/upload_image', methods=['POST'])
+@requires_ai_services
 def upload_image_route():
     if 'imageFile' not in request.files:
         return jsonify({"error": "No image file part"}), 400
@@ -160,38 +368,162 @@ def upload_image_route():
     if file.filename == '' or not allowed_file(file.filename):
         return jsonify({"error": "No selected file or file type not allowed"}), 400
 
-    filename = secure_filename(f"{uuid.uuid4()}_{file.filename}")
-    # --- Corrected Code ---
-    filepath = os.path.join(current_app.root_path, app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    # Decode the upload once in memory; the embedding and the OpenAI description are both built from it
+    image_bytes = file.read()
+    try:
+        decoded_image = DecodedImage(image_bytes)
+    except Exception as e:
+        app.logger.warning(f"Could not decode uploaded image: {e}")
+        return jsonify({"error": "Uploaded file is not a readable image"}), 400
+    image_fingerprint = fingerprint_upload(decoded_image)
+
+    # The upload is only written to disk when a server-side preview is wanted (the UI previews it locally)
+    image_url_for_preview = None
+    persist_preview = request.form.get('persist_preview', '').lower() in ('1', 'true', 'yes')
+    if persist_preview or app.config['PERSIST_UPLOAD_PREVIEWS']:
+        # Stored under the content hash, so re-uploads of the same photo reuse one file
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        filename = secure_filename(f"{compute_sha256(image_bytes)}.{extension}")
+        filepath = os.path.join(current_app.root_path, app.config['UPLOAD_FOLDER'], filename)
+        if not os.path.exists(filepath):
+            # Written under a temporary name and renamed into place, so concurrent requests never serve (and browsers
+            # never cache as immutable) a partly written preview; the last rename wins
+            tmp_path = f"{filepath}.tmp-{os.getpid()}-{threading.get_ident()}"
+            with open(tmp_path, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, filepath)
+        image_url_for_preview = url_for('send_uploaded_file', filename=filename)
     
     prompt_text = request.form.get('prompt', '')
-    
-    recs, openai_desc, gemini_refine = generate_final_recommendations(
-        query_image_path=filepath, text_prompt=prompt_text
+
+    stream_format = request.form.get('stream', '').lower()
+    if stream_format in STREAM_FORMATS:
+        events = stream_upload_recommendations(decoded_image, prompt_text, image_fingerprint, image_url_for_preview)
+        return stream_events_response(events, stream_format)
+
+    recs, openai_desc, gemini_refine, stage_timings = generate_final_recommendations(
+        query_image=decoded_image, text_prompt=prompt_text, image_fingerprint=image_fingerprint
     )
     
-    image_url_for_preview = url_for('send_uploaded_file', filename=filename)
-    
     return jsonify({
         "message": "Image processed successfully",
         "image_preview_url": image_url_for_preview,
         "recommendations": recs,
         "openai_description": openai_desc,
-        "gemini_refinement": gemini_refine
+        "gemini_refinement": gemini_refine,
+        "stage_timings_ms": stage_timings
     })
 
+# --- Streaming recommendations ---
+# /upload_image with stream=ndjson (one JSON object per line) or stream=sse (Server-Sent Events) sends each stage as it is ready:
+#   {"stage": "visual", ...}  preliminary ranking from the visual search and prompt keywords, sent before the LLM refinement
+#   {"stage": "final", ...}   the same fields as the non-streaming response
+#   {"stage": "error", ...}   if the pipeline failed
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def stream_upload_recommendations(decoded_image, prompt_text, image_fingerprint, image_url_for_preview):
+    """Yields the stage events for an upload. The pipeline runs on its own thread and hands events over through a queue."""
+    events = queue.Queue()
+
+    def on_visual_results(recs, elapsed_ms):
+        events.put({"stage": "visual", "image_preview_url": image_url_for_preview,
+                    "recommendations": recs, "elapsed_ms": elapsed_ms})
+
+    def run():
+        with app.app_context():
+            try:
+                recs, openai_desc, gemini_refine, stage_timings = generate_final_recommendations(
+                    query_image=decoded_image, text_prompt=prompt_text, image_fingerprint=image_fingerprint,
+                    on_visual_results=on_visual_results
+                )
+                events.put({
+                    "stage": "final",
+                    "message": "Image processed successfully",
+                    "image_preview_url": image_url_for_preview,
+                    "recommendations": recs,
+                    "openai_description": openai_desc,
+                    "gemini_refinement": gemini_refine,
+                    "stage_timings_ms": stage_timings
+                })
+            except Exception as e:
+                app.logger.error(f"Streaming recommendation pipeline failed: {e}")
+                events.put({"stage": "error", "error": "Failed to generate recommendations"})
+
+    # If the client disconnects the thread still finishes, filling the upload caches for a retry
+    threading.Thread(target=run, name="upload-stream", daemon=True).start()
+    while True:
+        event = events.get()
+        yield event
+        if event["stage"] != "visual":
+            return
+
+def stream_events_response(events, stream_format):
+    def encode():
+        for event in events:
+            payload = app.json.dumps(event)
+            if stream_format == "sse":
+                yield f"event: {event['stage']}\ndata: {payload}\n\n"
+            else:
+                yield payload + "\n"
+    # Tell proxies such as nginx not to buffer, so each stage reaches the browser as soon as it is sent
+    return Response(encode(), mimetype=STREAM_FORMATS[stream_format],
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route(f"/{app.config['UPLOAD_FOLDER']}/<path:filename>")
 def send_uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # The filename is the upload's SHA-256, so it doubles as a content-hash ETag and the file can be cached as immutable
+    if not allowed_file(filename):
+        abort(404) # e.g. a preview still being written under its temporary name
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, etag=os.path.splitext(filename)[0],
+                                   max_age=app.config['UPLOAD_PREVIEW_MAX_AGE'])
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route(f"{IMAGE_DERIVATIVE_URL_PREFIX}/<size>/<path:filename>")
+def send_image_derivative(size, filename):
+    """Serves a resized product image (e.g. /images/w320/1163.webp), generating and caching it on first request."""
+    resolved = resolve_derivative_request(current_app.root_path, size, filename)
+    if resolved is None:
+        abort(404)
+    source_path, width, fmt = resolved
+    try:
+        content_hash = source_content_hash(source_path)
+        derivative_path = ensure_derivative(current_app.root_path, source_path, content_hash, width, fmt)
+    except Exception as e:
+        app.logger.warning(f"Could not create image derivative {size}/{filename}: {e}")
+        abort(404)
+
+    # URLs carrying the image's current content hash never change; others (old links, hand-written URLs) revalidate
+    versioned = request.args.get('v') == content_hash[:URL_VERSION_LENGTH]
+    response = send_file(derivative_path, mimetype=derivative_mimetype(fmt), etag=derivative_etag(content_hash, width, fmt),
+                         max_age=IMAGE_IMMUTABLE_MAX_AGE if versioned else IMAGE_REVALIDATE_MAX_AGE)
+    response.cache_control.immutable = versioned
+    return response
 
 @app.route('/get_recommendations', methods=['POST'])
+@requires_ai_services
 def get_recommendations_route():
     data = request.json
     prompt_text = data.get('prompt', '')
-    recs, _, gemini_refine = generate_final_recommendations(text_prompt=prompt_text)
+    recs, _, gemini_refine, _ = get_cached_text_recommendations(prompt_text)
     return jsonify({"recommendations": recs, "gemini_refinement": gemini_refine})
 
+@app.route('/api/cache_stats')
+def cache_stats_api_route():
+    description_cache, embedding_cache = get_upload_caches()
+    return jsonify({
+        "recommendations": recommendation_cache.stats(),
+        "gemini": get_gemini_cache().stats(),
+        "upload_descriptions": description_cache.stats(),
+        "upload_embeddings": embedding_cache.stats(),
+        "vit_microbatching": get_vit_batcher().stats() if VIT_MICROBATCH_ENABLED else None,
+        "spacy_keywords": spacy_keyword_cache.stats(),
+        "users": user_cache.stats(),
+        "image_source_hashes": source_hash_cache.stats(),
+    })
+
 # --- Authentication Routes ---
 @app.route('/api/signup', methods=['POST'])
 def signup_api_route():
@@ -235,6 +567,7 @@ def login_api_route():
 @app.route('/api/logout', methods=['POST'])
 @login_required
 def logout_api_route():
+    User.invalidate_cache(current_user.id)
     logout_user()
     return jsonify({"message": "Logout successful"}), 200
 
@@ -242,18 +575,9 @@ def logout_api_route():
 def current_user_status_api_route():
     if current_user.is_authenticated:
         # We now need full product details for cart/wishlist to display them
-        all_catalog = get_catalog_products()
-        
-        wishlist_ids = current_user.get_wishlist_ids()
-        wishlist_details = [p for p in all_catalog if str(p.get('id')) in wishlist_ids]
-
-        cart_items_raw = current_user.get_cart_items()
-        cart_details = []
-        for item_raw in cart_items_raw:
-            product = next((p.copy() for p in all_catalog if str(p.get('id')) == str(item_raw['product_id'])), None)
-            if product:
-                product['quantity'] = item_raw['quantity']
-                cart_details.append(product)
+        wishlist_ids, cart_items = current_user.get_wishlist_and_cart()
+        wishlist_details = get_wishlist_details(wishlist_ids)
+        cart_details = get_cart_details(cart_items)
 
         return jsonify({
             "logged_in": True,
@@ -266,6 +590,88 @@ def current_user_status_api_route():
     return jsonify({"logged_in": False})
 
 # --- User Data API Routes (Wishlist, Cart) ---
+def get_wishlist_details(wishlist_ids):
+    """Catalog products for a list of wishlist product ids."""
+    return get_products(wishlist_ids)
+
+def get_cart_details(cart_items):
+    """Catalog products (copies, with their quantity) for a list of cart items."""
+    cart_details = []
+    for item in cart_items:
+        product = get_product(item['product_id'])
+        if product:
+            product = product.copy()
+            product['quantity'] = item['quantity']
+            cart_details.append(product)
+    return cart_details
+
+def parse_batch_product_ids(values):
+    """Validates a list of product ids from a batch request. Returns (ids, error message)."""
+    if not isinstance(values, list):
+        return None, "expected a list of product ids"
+    if any(not isinstance(value, (str, int)) or isinstance(value, bool) or str(value) == "" for value in values):
+        return None, "product ids must be non-empty strings or integers"
+    return [str(value) for value in values], None
+
+def parse_cart_changes(values):
+    """Validates [{"productId", "quantity" | "delta"}, ...] from a batch request. Returns (changes, error message)."""
+    if not isinstance(values, list):
+        return None, "changes must be a list"
+    changes = []
+    for value in values:
+        if not isinstance(value, dict):
+            return None, "each change must be an object"
+        product_ids, error = parse_batch_product_ids([value.get('productId')])
+        if error:
+            return None, error
+        quantity, delta = value.get('quantity'), value.get('delta')
+        if (quantity is None) == (delta is None):
+            return None, "each change needs exactly one of quantity or delta"
+        amount = quantity if quantity is not None else delta
+        if not isinstance(amount, int) or isinstance(amount, bool) or (quantity is not None and quantity < 0):
+            return None, "quantity must be a non-negative integer and delta an integer"
+        changes.append({"product_id": product_ids[0], "quantity": quantity, "delta": delta})
+    return changes, None
+
+@app.route('/api/wishlist/batch', methods=['POST'])
+@login_required
+def wishlist_batch_api_route():
+    """Adds and removes several wishlist products in one transaction: {"add": [ids], "remove": [ids]}."""
+    data = request.get_json(silent=True) or {}
+    add_ids, error = parse_batch_product_ids(data.get('add', []))
+    remove_ids, remove_error = parse_batch_product_ids(data.get('remove', []))
+    error = error or remove_error
+    if not error and len(add_ids) + len(remove_ids) > app.config['USER_DATA_BATCH_MAX_ITEMS']:
+        error = f"at most {app.config['USER_DATA_BATCH_MAX_ITEMS']} products per batch"
+    if error:
+        return jsonify({"error": f"Invalid wishlist batch: {error}"}), 400
+
+    wishlist_ids = current_user.apply_wishlist_changes(add_ids, remove_ids)
+    if wishlist_ids is None:
+        return jsonify({"error": "Could not update wishlist"}), 500
+    return jsonify({"message": "Wishlist updated", "wishlist_ids": wishlist_ids,
+                    "wishlist_details": get_wishlist_details(wishlist_ids)}), 200
+
+@app.route('/api/cart/batch', methods=['POST'])
+@login_required
+def cart_batch_api_route():
+    """
+    Applies several cart changes in one transaction: {"changes": [{"productId", "quantity" | "delta"}], "replace": false}.
+    "quantity" sets a product's quantity (0 removes it), "delta" adds to it; "replace": true makes the cart exactly `changes`.
+    """
+    data = request.get_json(silent=True) or {}
+    changes, error = parse_cart_changes(data.get('changes', []))
+    if not error and len(changes) > app.config['USER_DATA_BATCH_MAX_ITEMS']:
+        error = f"at most {app.config['USER_DATA_BATCH_MAX_ITEMS']} products per batch"
+    if error:
+        return jsonify({"error": f"Invalid cart batch: {error}"}), 400
+
+    cart_items = current_user.apply_cart_changes(changes, replace=bool(data.get('replace')))
+    if cart_items is None:
+        return jsonify({"error": "Could not update cart"}), 500
+    return jsonify({"message": "Cart updated", "cart_items_data": cart_items,
+                    "cart_details": get_cart_details(cart_items)}), 200
+
 @app.route('/api/wishlist', methods=['POST', 'DELETE'])
 @login_required
 def wishlist_api_route():
@@ -289,7 +695,7 @@ def cart_api_route():
     if not product_id: return jsonify({"error": "productId required"}), 400
 
     if request.method == 'POST':
-        # This simple model just adds one item. The JS handles the logic of not adding duplicates.
+        # Adding a product that is already in the cart increases its quantity
         current_user.add_to_cart_db(product_id, 1)
         return jsonify({"message": "Added to cart", "cart_items_data": current_user.get_cart_items()}), 200
     elif request.method == 'DELETE':
@@ -0,0 +1,298 @@
+# backend_flask/caching.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after `ttl_seconds`."""
+
+    def __init__(self, max_entries=256, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (value, stored_at, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_entry(self, key):
+        """Returns (value, age_seconds) for a live entry, or None. Counts a hit or a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], now - entry[1]
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl_seconds=None):
+        now = time.monotonic()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._entries[key] = (value, now, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+class RefreshingCache(TTLCache):
+    """
+    TTLCache that refreshes entries in the background instead of letting requests wait.
+    Entries older than `refresh_after_seconds` are still served, and recomputed on a worker thread.
+    Keys registered with keep_warm() are recomputed on a timer so they never expire.
+    Concurrent misses for the same key share one computation.
+    Results for which `should_cache(value)` is False are returned but not stored.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=600, refresh_after_seconds=300, max_workers=2, should_cache=None):
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.refresh_after_seconds = refresh_after_seconds
+        self.should_cache = should_cache or (lambda value: True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cache-refresh")
+        self._in_flight = {} # key -> Future of the running computation
+        self._warm_keys = {} # key -> compute callable
+        self._warm_timer = None
+        self.refreshes = 0
+        self.compute_errors = 0
+
+    def _compute(self, key, compute, future):
+        try:
+            value = compute()
+            if self.should_cache(value):
+                self.set(key, value)
+            future.set_result(value)
+        except Exception as e:
+            self.compute_errors += 1
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _start(self, key, compute, background):
+        """Starts computing `key` unless it is already running. Returns the computation's Future."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._in_flight[key] = future
+        if background:
+            self.refreshes += 1
+            self._executor.submit(self._compute, key, compute, future)
+        else:
+            self._compute(key, compute, future)
+        return future
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value for `key`, computing it with `compute()` on a miss."""
+        entry = self.get_entry(key)
+        if entry is not None:
+            value, age = entry
+            if age >= self.refresh_after_seconds:
+                self._start(key, compute, background=True)
+            return value
+        return self._start(key, compute, background=False).result()
+
+    def prefetch(self, key, compute):
+        """Computes `key` on a worker thread so later requests find it cached."""
+        return self._start(key, compute, background=True)
+
+    def keep_warm(self, key, compute):
+        """Prefetches `key` now and refreshes it every `refresh_after_seconds` from then on."""
+        with self._lock:
+            self._warm_keys[key] = compute
+            start_timer = self._warm_timer is None
+            if start_timer:
+                self._warm_timer = self._new_warm_timer()
+        self.prefetch(key, compute)
+        if start_timer:
+            self._warm_timer.start()
+
+    def _new_warm_timer(self):
+        timer = threading.Timer(self.refresh_after_seconds, self._refresh_warm_keys)
+        timer.daemon = True
+        return timer
+
+    def _refresh_warm_keys(self):
+        with self._lock:
+            warm_keys = list(self._warm_keys.items())
+        for key, compute in warm_keys:
+            self.prefetch(key, compute)
+        self._warm_timer = self._new_warm_timer()
+        self._warm_timer.start()
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({"refreshes": self.refreshes, "compute_errors": self.compute_errors, "in_flight": len(self._in_flight)})
+        return stats
+
+class SQLiteCache:
+    """
+    Durable key/value cache in a local SQLite file, shared by every worker process that opens the same path.
+    Values go through `serialize`/`deserialize` (JSON by default). Entries expire after `ttl_seconds`,
+    and the oldest entries of the namespace are pruned once it grows past `max_entries`.
+    """
+    PRUNE_EVERY_N_WRITES = 100
+
+    def __init__(self, db_path, namespace, ttl_seconds=7 * 24 * 3600, max_entries=10000,
+                 serialize=json.dumps, deserialize=json.loads):
+        self.db_path = db_path
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self._local = threading.local() # one connection per thread (and per process, since they are created lazily)
+        self._writes_since_prune = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            # WAL lets readers in other workers proceed while one worker writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    cache_key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, cache_key)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_created ON cache_entries (namespace, created_at)")
+            conn.commit()
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM cache_entries WHERE namespace = ? AND cache_key = ? AND expires_at > ?",
+                (self.namespace, key, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return default
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self.deserialize(row[0])
+
+    def set(self, key, value, ttl_seconds=None):
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, cache_key, value, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, self.serialize(value), now, expires_at)
+                )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= self.PRUNE_EVERY_N_WRITES:
+                self.prune()
+        except sqlite3.Error:
+            self.errors += 1
+
+    def delete(self, key):
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND cache_key = ?", (self.namespace, key))
+        except sqlite3.Error:
+            self.errors += 1
+
+    def prune(self):
+        """Deletes expired entries, then the oldest ones beyond max_entries."""
+        self._writes_since_prune = 0
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time()))
+            conn.execute("""
+                DELETE FROM cache_entries WHERE namespace = ? AND cache_key IN (
+                    SELECT cache_key FROM cache_entries WHERE namespace = ?
+                    ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.namespace, self.namespace, self.max_entries))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+        }
+
+class TieredCache:
+    """An in-process TTLCache in front of a durable SQLiteCache. Store hits are promoted into memory."""
+
+    def __init__(self, memory, store):
+        self.memory = memory
+        self.store = store
+
+    def get(self, key, default=None):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self.store.get(key)
+        if value is None:
+            return default
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        self.store.set(key, value)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        self.store.delete(key)
+
+    def stats(self):
+        return {"memory": self.memory.stats(), "store": self.store.stats()}
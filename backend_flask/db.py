@@ -1,33 +1,127 @@
 # backend_flask/db.py
 import sqlite3
 import os
+import threading
 from flask import current_app, g
+from .metrics import METRICS_ENABLED, DB_QUERY_SECONDS
 
 DATABASE_FILENAME = 'shopsmarter.sqlite3' # Name of your SQLite database file
 
+# --- Connection settings ---
+# How long a writer waits for another connection's write lock before raising "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Page cache per connection, in KiB (passed to SQLite as a negative cache_size)
+SQLITE_CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", "16384"))
+
+# One connection per thread (and per process, since they are created lazily), reused across requests
+_local = threading.local()
+
+# --- Schema migrations ---
+# Applied in order to databases whose PRAGMA user_version is below their version number.
+# schema.sql creates version 0; add new entries at the end and never edit applied ones.
+MIGRATIONS = [
+    (1, [
+        # Merge duplicate cart rows into the oldest one before cart items become unique per user and product
+        """UPDATE user_cart SET quantity = (
+               SELECT SUM(COALESCE(dup.quantity, 1)) FROM user_cart AS dup
+               WHERE dup.user_id = user_cart.user_id AND dup.product_id = user_cart.product_id)
+           WHERE id IN (SELECT MIN(id) FROM user_cart GROUP BY user_id, product_id HAVING COUNT(*) > 1)""",
+        "DELETE FROM user_cart WHERE id NOT IN (SELECT MIN(id) FROM user_cart GROUP BY user_id, product_id)",
+        # Also serves lookups by user_id alone (leftmost column)
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_cart_user_product ON user_cart (user_id, product_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id)",
+    ]),
+]
+
+def _sql_operation(sql):
+    """The statement's leading keyword (SELECT, INSERT, ...), used as a low-cardinality metric label."""
+    words = sql.lstrip().split(None, 1)
+    return words[0].upper() if words else ""
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records each statement's execution time in DB_QUERY_SECONDS."""
+
+    def execute(self, sql, parameters=()):
+        with DB_QUERY_SECONDS.time(operation=_sql_operation(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with DB_QUERY_SECONDS.time(operation=_sql_operation(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose statements (through execute* or its cursors) are timed."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        with DB_QUERY_SECONDS.time(operation="SCRIPT"):
+            return super().executescript(sql_script)
+
 def get_db_path():
     return os.path.join(current_app.root_path, DATABASE_FILENAME)
 
+def _connect(db_path):
+    conn = sqlite3.connect(
+        db_path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+        factory=TimedConnection if METRICS_ENABLED else sqlite3.Connection
+    )
+    conn.row_factory = sqlite3.Row # Access columns by name
+    # WAL lets readers proceed while a writer commits; NORMAL sync is durable enough with WAL and much cheaper
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
 def get_db():
     if 'db' not in g:
-        try:
-            db_path = get_db_path()
-            g.db = sqlite3.connect(
-                db_path,
-                detect_types=sqlite3.PARSE_DECLTYPES
-            )
-            g.db.row_factory = sqlite3.Row # Access columns by name
-            current_app.logger.info(f"SQLite connection successful to: {db_path}")
-        except sqlite3.Error as e:
-            current_app.logger.error(f"Failed to connect to SQLite: {e}")
-            g.db = None
+        db_path = get_db_path()
+        conn = getattr(_local, "conn", None)
+        if conn is None or getattr(_local, "pid", None) != os.getpid() or getattr(_local, "path", None) != db_path:
+            try:
+                conn = _connect(db_path)
+            except sqlite3.Error as e:
+                current_app.logger.error(f"Failed to connect to SQLite: {e}")
+                conn = None
+            _local.conn, _local.pid, _local.path = conn, os.getpid(), db_path
+        g.db = conn
     return g.db
 
 def close_db(e=None):
+    # The connection stays open for this thread's next request; only discard work left uncommitted
     db_conn = g.pop('db', None)
-    if db_conn is not None:
-        db_conn.close()
-        current_app.logger.info("SQLite connection closed.")
+    if db_conn is not None and db_conn.in_transaction:
+        db_conn.rollback()
+
+def migrate_db(db_conn):
+    """Applies pending MIGRATIONS, each in its own transaction. Safe to run from several workers at once."""
+    for version, statements in MIGRATIONS:
+        # BEGIN IMMEDIATE takes the write lock, so only one process applies a given migration
+        db_conn.execute("BEGIN IMMEDIATE")
+        try:
+            current_version = db_conn.execute("PRAGMA user_version").fetchone()[0]
+            if current_version >= version:
+                db_conn.rollback()
+                continue
+            for statement in statements:
+                db_conn.execute(statement)
+            db_conn.execute(f"PRAGMA user_version = {version}")
+            db_conn.commit()
+            current_app.logger.info(f"Applied database migration {version}.")
+        except sqlite3.Error:
+            db_conn.rollback()
+            raise
 
 def init_db_command_logic():
     """Clear existing data and create new tables."""
@@ -40,6 +134,8 @@ def init_db_command_logic():
     try:
         with open(schema_path, 'r') as f:
             db_conn.executescript(f.read())
+        # The tables were recreated at version 0, so every migration applies again
+        db_conn.execute("PRAGMA user_version = 0")
         db_conn.commit() # Commit after executing script
         current_app.logger.info("Initialized the SQLite database with schema.")
     except FileNotFoundError:
@@ -58,4 +154,10 @@ def init_app(app):
             current_app.logger.info(f"Database file not found at {db_path}. Initializing schema...")
             # We need to get a db connection to initialize
             get_db()
-            init_db_command_logic()
\ No newline at end of file
+            init_db_command_logic()
+        db_conn = get_db()
+        if db_conn is not None:
+            try:
+                migrate_db(db_conn)
+            except sqlite3.Error as e:
+                current_app.logger.error(f"Database migration failed: {e}")
@@ -0,0 +1,231 @@
+# backend_flask/image_derivatives.py
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from werkzeug.security import safe_join
+
+from .caching import TTLCache
+from .ai_core.embedding_store import compute_image_content_hash
+
+# Resized WebP and JPEG copies ("derivatives") of the product images, so the UI downloads an image sized for where it is
+# shown instead of the full-size original. They are generated on first request (or ahead of time by
+# build_catalog_artifact.py) and kept on disk under the source image's content hash, so they never go stale.
+# Product records list their derivative URLs with that hash as the version (?v=...), which makes them immutable.
+IMAGE_DERIVATIVE_URL_PREFIX = "/images"
+# Directory of the images derivatives are made from, relative to the backend_flask folder
+PRODUCT_IMAGES_DIR = os.path.join("static", "product_images_db")
+IMAGE_DERIVATIVE_CACHE_DIR = os.getenv("IMAGE_DERIVATIVE_CACHE_DIR", "image_derivatives")
+# Widths (pixels) offered for each image: list thumbnails, grid cards at 1x and 2x, and the product modal
+IMAGE_DERIVATIVE_WIDTHS = tuple(sorted(int(width) for width in os.getenv("IMAGE_DERIVATIVE_WIDTHS", "120,320,640,1080").split(",")))
+# format -> (PIL format, MIME type, encoder options)
+IMAGE_DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+# Bump whenever the resizing or encoder settings change, so cached files and ETags change with them
+IMAGE_DERIVATIVE_VERSION = 1
+# Versioned URLs are cached for a year; requests without the current version revalidate against the ETag hourly
+IMAGE_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+IMAGE_REVALIDATE_MAX_AGE = 3600
+SOURCE_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# Hex digits of the content hash used as the URL version
+URL_VERSION_LENGTH = 16
+
+# (path, size, mtime) -> content hash, so serving a derivative does not re-read its source image
+source_hash_cache = TTLCache(max_entries=int(os.getenv("IMAGE_SOURCE_HASH_CACHE_ENTRIES", "65536")), ttl_seconds=24 * 3600)
+# Content hash -> displayed width of the source image, saved beside the cached derivatives so catalog builds only open
+# images they have not seen before. Entries never go stale: the hash identifies the image's bytes.
+SOURCE_WIDTHS_FILENAME = "source_widths.json"
+source_widths = {}
+# root_path -> number of source_widths entries its file holds; source_widths only grows, so more means unsaved widths
+_source_widths_saved_counts = {}
+
+def derivative_settings():
+    """Settings that change derivative URLs; catalogs built with other settings are rebuilt."""
+    return {"widths": list(IMAGE_DERIVATIVE_WIDTHS), "formats": sorted(IMAGE_DERIVATIVE_FORMATS), "version": IMAGE_DERIVATIVE_VERSION}
+
+def source_content_hash(source_path):
+    stat = os.stat(source_path)
+    key = (source_path, stat.st_size, stat.st_mtime_ns)
+    content_hash = source_hash_cache.get(key)
+    if content_hash is None:
+        content_hash = compute_image_content_hash(source_path)
+        source_hash_cache.set(key, content_hash)
+    return content_hash
+
+def _source_widths_path(root_path):
+    return os.path.join(root_path, IMAGE_DERIVATIVE_CACHE_DIR, SOURCE_WIDTHS_FILENAME)
+
+def load_source_widths(root_path):
+    """Merges the widths saved under root_path into source_widths (once per root_path)."""
+    if root_path in _source_widths_saved_counts:
+        return
+    saved = {}
+    try:
+        with open(_source_widths_path(root_path), "r") as f:
+            saved = {str(content_hash): int(width) for content_hash, width in json.load(f).items()}
+    except (OSError, ValueError, AttributeError, TypeError):
+        pass
+    source_widths.update(saved)
+    _source_widths_saved_counts[root_path] = len(saved)
+
+def save_source_widths(root_path):
+    """Writes source_widths under root_path if it holds widths the saved file lacks."""
+    widths = dict(source_widths)
+    if len(widths) <= _source_widths_saved_counts.get(root_path, -1):
+        return
+    path = _source_widths_path(root_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "w") as f:
+        json.dump(widths, f)
+    os.replace(tmp_path, path)
+    _source_widths_saved_counts[root_path] = len(widths)
+
+def source_width(source_path, content_hash=None):
+    """Displayed width of an image, from source_widths when its content hash is known, otherwise from its header."""
+    if content_hash is not None and content_hash in source_widths:
+        return source_widths[content_hash]
+    with Image.open(source_path) as img:
+        # EXIF orientations 5-8 rotate the image by 90 degrees when it is displayed
+        width = img.height if img.getexif().get(0x0112, 1) > 4 else img.width
+    if content_hash is not None:
+        source_widths[content_hash] = width
+    return width
+
+def offered_widths(source_path, content_hash=None):
+    """
+    {actual width: requested width} for an image. Derivatives are never upscaled, so each actual width is offered once,
+    under the smallest configured width that produces it. Reads only the image header, and not even that when the
+    width of `content_hash` is already known.
+    """
+    source_width_px = source_width(source_path, content_hash)
+    offered = {}
+    for width in IMAGE_DERIVATIVE_WIDTHS:
+        offered.setdefault(min(width, source_width_px), width)
+    return offered
+
+def product_image_derivatives(rel_image_path, abs_image_path, content_hash):
+    """
+    Derivative URLs for a product image, as {format: [{"width", "url"}, ...]} ordered by width, or None if the image
+    is not under PRODUCT_IMAGES_DIR or cannot be read. Widths larger than the image itself are left out.
+    """
+    rel_to_images = os.path.relpath(os.path.normpath(rel_image_path), PRODUCT_IMAGES_DIR)
+    stem, extension = os.path.splitext(rel_to_images)
+    if rel_to_images.startswith(os.pardir) or extension.lower() not in SOURCE_IMAGE_EXTENSIONS:
+        return None
+    try:
+        offered = offered_widths(abs_image_path, content_hash)
+    except Exception:
+        return None
+    stem = stem.replace(os.sep, "/")
+    version = content_hash[:URL_VERSION_LENGTH]
+    return {
+        fmt: [{"width": actual_width, "url": f"{IMAGE_DERIVATIVE_URL_PREFIX}/w{width}/{stem}.{fmt}?v={version}"}
+              for actual_width, width in sorted(offered.items())]
+        for fmt in IMAGE_DERIVATIVE_FORMATS
+    }
+
+def resolve_derivative_request(root_path, size, filename):
+    """Maps a derivative URL's `w<width>` and `<stem>.<format>` to (source image path, width, format), or None."""
+    if not size.startswith("w") or not size[1:].isdigit() or int(size[1:]) not in IMAGE_DERIVATIVE_WIDTHS:
+        return None
+    stem, _, fmt = filename.rpartition(".")
+    if fmt not in IMAGE_DERIVATIVE_FORMATS or not stem:
+        return None
+    images_dir = os.path.join(root_path, PRODUCT_IMAGES_DIR)
+    for extension in SOURCE_IMAGE_EXTENSIONS:
+        source_path = safe_join(images_dir, stem + extension)
+        if source_path is not None and os.path.isfile(source_path):
+            return source_path, int(size[1:]), fmt
+    return None
+
+def derivative_etag(content_hash, width, fmt):
+    return f"{content_hash[:32]}-w{width}-v{IMAGE_DERIVATIVE_VERSION}.{fmt}"
+
+def derivative_mimetype(fmt):
+    return IMAGE_DERIVATIVE_FORMATS[fmt][1]
+
+def ensure_derivative(root_path, source_path, content_hash, width, fmt):
+    """Returns the path of the cached derivative, generating it first if needed. Raises if the source cannot be decoded."""
+    cache_dir = os.path.join(root_path, IMAGE_DERIVATIVE_CACHE_DIR, content_hash[:2])
+    path = os.path.join(cache_dir, derivative_etag(content_hash, width, fmt))
+    if os.path.exists(path):
+        return path
+
+    pil_format, _, options = IMAGE_DERIVATIVE_FORMATS[fmt]
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Concurrent requests for the same derivative each write their own file; the last rename wins
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        img.save(tmp_path, format=pil_format, **options)
+    os.replace(tmp_path, path)
+    return path
+
+def product_image_paths(root_path):
+    """Sorted paths of every source image under PRODUCT_IMAGES_DIR."""
+    images_dir = os.path.join(root_path, PRODUCT_IMAGES_DIR)
+    return sorted(os.path.join(directory, name) for directory, _, names in os.walk(images_dir)
+                  for name in names if os.path.splitext(name)[1].lower() in SOURCE_IMAGE_EXTENSIONS)
+
+# --- Product image stamps ---
+# Catalogs built ahead of time (snapshots, artifacts) embed each image and link its derivatives by content hash, so
+# they record which images they were built from and are rebuilt when an image file is added, removed or replaced.
+def _images_digest(root_path, lines):
+    hasher = hashlib.blake2b(digest_size=16)
+    for source_path, line in lines:
+        hasher.update(os.path.relpath(source_path, root_path).encode("utf-8", "surrogateescape") + b"\0" + line.encode() + b"\n")
+    return hasher.hexdigest()
+
+def product_images_stamp(root_path):
+    """Cheap identity of the product images (each file's path, size and modification time), checked without reading them."""
+    stats = [(source_path, os.stat(source_path)) for source_path in product_image_paths(root_path)]
+    return {"count": len(stats), "files": _images_digest(root_path, ((path, f"{stat.st_size}:{stat.st_mtime_ns}") for path, stat in stats))}
+
+def product_images_content_digest(root_path):
+    """Digest of every product image's path and content hash; hashes of files unchanged since the catalog was built are cached."""
+    return _images_digest(root_path, ((path, source_content_hash(path)) for path in product_image_paths(root_path)))
+
+def product_images_meta(root_path):
+    return dict(product_images_stamp(root_path), content=product_images_content_digest(root_path))
+
+def product_images_match(recorded, root_path):
+    """
+    True if `recorded` (from product_images_meta) describes the product images currently on disk: the same files with
+    the same sizes and modification times, or failing that the same contents.
+    """
+    if not recorded:
+        return False
+    stamp = product_images_stamp(root_path)
+    if stamp["count"] != recorded.get("count"):
+        return False
+    if stamp["files"] == recorded.get("files"):
+        return True
+    # Same files but touched (e.g. copied to a new host): compare contents before throwing the catalog away
+    return product_images_content_digest(root_path) == recorded.get("content")
+
+def pregenerate_derivatives(root_path, num_workers=None):
+    """Generates the derivatives product records link to for every image in PRODUCT_IMAGES_DIR, on a thread pool. Returns (images, failures)."""
+    source_paths = product_image_paths(root_path)
+    load_source_widths(root_path)
+
+    def generate(source_path):
+        try:
+            content_hash = source_content_hash(source_path)
+            for width in offered_widths(source_path, content_hash).values():
+                for fmt in IMAGE_DERIVATIVE_FORMATS:
+                    ensure_derivative(root_path, source_path, content_hash, width, fmt)
+            return True
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(max_workers=num_workers or min(32, (os.cpu_count() or 1) * 2)) as executor:
+        failures = sum(1 for ok in executor.map(generate, source_paths) if not ok)
+    save_source_widths(root_path)
+    return len(source_paths), failures
@@ -0,0 +1,161 @@
+# backend_flask/metrics.py
+import bisect
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# In-process counters, gauges and histograms, rendered in the Prometheus text format at /metrics.
+# Each gunicorn worker keeps its own values; Prometheus sums them when every worker is scraped (or via a sidecar).
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+# Fraction of timed calls that are recorded (1.0 = all). With sampling, histogram counts and sums cover only
+# the sampled calls; counters are never sampled.
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1.0"))
+METRICS_PREFIX = "shopsmarter_"
+# Latency buckets in seconds, from sub-millisecond lookups to slow remote API calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _escape_label_value(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [(name, value) for name, value in zip(labelnames, key)] + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {} # label values tuple -> value (or histogram state)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. calls or errors."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self, items):
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. the number of catalog products."""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[_label_key(self.labelnames, labels)] = value
+
+class Histogram(_Metric):
+    """Distribution of observed values (seconds, by default) in cumulative buckets, with their count and sum."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(self.labelnames, labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts; the last slot is the +Inf bucket
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bucket] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Times the block and observes its duration, for a METRICS_SAMPLE_RATE share of calls."""
+        if not METRICS_ENABLED or (METRICS_SAMPLE_RATE < 1.0 and random.random() >= METRICS_SAMPLE_RATE):
+            yield
+            return
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def timed(self, **labels):
+        """Decorator form of time()."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (bucket_counts, total) in items:
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(upper_bound))])} {cumulative}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+        return lines
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- Shared metrics ---
+# Label values are kept to small fixed sets (stage names, services, SQL verbs, route rules) to bound cardinality.
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency by route.", ["method", "route", "status"])
+PIPELINE_STAGE_SECONDS = Histogram("pipeline_stage_duration_seconds", "Recommendation pipeline stage latency.", ["stage"])
+PIPELINE_STAGE_OUTCOMES = Counter("pipeline_stage", "Recommendation pipeline stage results.", ["stage", "status"])
+MODEL_INFERENCE_SECONDS = Histogram("model_inference_duration_seconds", "Local model inference latency.", ["model", "mode"])
+MODEL_INFERENCE_ITEMS = Counter("model_inference_items", "Images or texts processed by local models.", ["model"])
+MODEL_LOAD_SECONDS = Histogram("model_load_duration_seconds", "Time to load a local model.", ["model"], buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+EXTERNAL_API_SECONDS = Histogram("external_api_duration_seconds", "Remote AI API call latency.", ["service"])
+EXTERNAL_API_ERRORS = Counter("external_api_errors", "Remote AI API calls that failed.", ["service"])
+CATALOG_OPERATION_SECONDS = Histogram("catalog_operation_duration_seconds", "Product catalog search and load latency.", ["operation"])
+CATALOG_PRODUCTS = Gauge("catalog_products", "Products in the loaded catalog.")
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "SQLite statement execution latency (until the first row).", ["operation"])
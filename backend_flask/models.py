@@ -1,9 +1,18 @@
 # backend_flask/models.py
+import os
 import sqlite3
 from flask_login import UserMixin
 from flask import current_app
 import json # For preferences JSON
 from . import db # Import the db module we created
+from .caching import TTLCache
+
+# --- Per-process cache of user rows, used by Flask-Login's user_loader on every authenticated request ---
+# Entries are re-read after USER_CACHE_TTL_SECONDS, which bounds staleness across worker processes;
+# code that changes a user row must call User.invalidate_cache(user_id).
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "4096"))
+user_cache = TTLCache(max_entries=USER_CACHE_MAX_ENTRIES, ttl_seconds=USER_CACHE_TTL_SECONDS)
 
 class User(UserMixin):
     def __init__(self, username, id=None, email=None, password_hash=None):
@@ -45,6 +54,30 @@ class User(UserMixin):
             current_app.logger.error(f"Error fetching user by ID {user_id}: {e}")
         return None
 
+    @staticmethod
+    def get_by_id_cached(user_id):
+        """get_by_id, served from the per-process user cache when possible. Returns a new User each call."""
+        try:
+            cache_key = int(user_id)
+        except (ValueError, TypeError):
+            return User.get_by_id(user_id) # logs the invalid id
+        fields = user_cache.get(cache_key)
+        if fields is not None:
+            return User(**fields)
+        user = User.get_by_id(cache_key)
+        if user is not None:
+            user_cache.set(cache_key, {"id": user.id, "username": user.username,
+                                       "email": user.email, "password_hash": user.password_hash})
+        return user
+
+    @staticmethod
+    def invalidate_cache(user_id):
+        """Drops a user from this process's cache, e.g. after their row changes or they log out."""
+        try:
+            user_cache.delete(int(user_id))
+        except (ValueError, TypeError):
+            pass
+
     # --- Methods for user data (wishlist, cart, etc.) ---
     # We are including these now, but will use them in later commits.
 
@@ -99,6 +132,38 @@ class User(UserMixin):
             current_app.logger.error(f"Error removing from wishlist for user {self.id}, product {product_id}: {e}")
             return False
 
+    def get_wishlist_and_cart(self):
+        """Returns (wishlist ids, cart items) from a single query, in the same shapes as get_wishlist_ids and get_cart_items."""
+        database = db.get_db()
+        if not database or not self.id: return [], []
+        rows = database.execute("""
+            SELECT 'wishlist' AS source, product_id, NULL AS quantity FROM user_wishlist WHERE user_id = ?
+            UNION ALL
+            SELECT 'cart' AS source, product_id, quantity FROM user_cart WHERE user_id = ?
+        """, (self.id, self.id)).fetchall()
+        wishlist_ids = [row["product_id"] for row in rows if row["source"] == "wishlist"]
+        cart_items = [{"product_id": row["product_id"], "quantity": row["quantity"]} for row in rows if row["source"] == "cart"]
+        return wishlist_ids, cart_items
+
+    def apply_wishlist_changes(self, add_ids=(), remove_ids=()):
+        """
+        Adds and removes several wishlist products in one transaction.
+        Returns the resulting wishlist ids, read in the same transaction, or None on error.
+        """
+        database = db.get_db()
+        if not database or not self.id: return None
+        try:
+            with database: # commits on success, rolls back on error
+                database.executemany("INSERT OR IGNORE INTO user_wishlist (user_id, product_id) VALUES (?, ?)",
+                                     [(self.id, str(product_id)) for product_id in add_ids])
+                database.executemany("DELETE FROM user_wishlist WHERE user_id = ? AND product_id = ?",
+                                     [(self.id, str(product_id)) for product_id in remove_ids])
+                rows = database.execute("SELECT product_id FROM user_wishlist WHERE user_id = ?", (self.id,)).fetchall()
+            return [row["product_id"] for row in rows]
+        except sqlite3.Error as e:
+            current_app.logger.error(f"Error applying wishlist changes for user {self.id}: {e}")
+            return None
+
     def get_cart_items(self):
         database = db.get_db()
         if not database or not self.id: return []
@@ -106,13 +171,49 @@ class User(UserMixin):
         cursor.execute("SELECT product_id, quantity FROM user_cart WHERE user_id = ?", (self.id,))
         return [{"product_id": row["product_id"], "quantity": row["quantity"]} for row in cursor.fetchall()]
 
+    def apply_cart_changes(self, changes, replace=False):
+        """
+        Applies several cart changes in one transaction. Each change is a dict with "product_id" and either
+        "quantity" (set the quantity) or "delta" (add to it); products whose quantity drops to 0 or below are removed.
+        With replace=True, products not mentioned in `changes` are removed, so the cart becomes exactly `changes`.
+        Returns the resulting cart items, read in the same transaction, or None on error.
+        """
+        database = db.get_db()
+        if not database or not self.id: return None
+        set_rows = [(self.id, str(c["product_id"]), c["quantity"]) for c in changes if c.get("quantity") is not None]
+        delta_rows = [(self.id, str(c["product_id"]), c["delta"]) for c in changes if c.get("quantity") is None and c.get("delta") is not None]
+        try:
+            with database: # commits on success, rolls back on error
+                if replace:
+                    keep_ids = [str(c["product_id"]) for c in changes]
+                    placeholders = ",".join("?" * len(keep_ids))
+                    database.execute(f"DELETE FROM user_cart WHERE user_id = ? AND product_id NOT IN ({placeholders})",
+                                     (self.id, *keep_ids))
+                database.executemany("""
+                    INSERT INTO user_cart (user_id, product_id, quantity) VALUES (?, ?, ?)
+                    ON CONFLICT(user_id, product_id) DO UPDATE SET quantity = excluded.quantity
+                """, set_rows)
+                database.executemany("""
+                    INSERT INTO user_cart (user_id, product_id, quantity) VALUES (?, ?, ?)
+                    ON CONFLICT(user_id, product_id) DO UPDATE SET quantity = COALESCE(user_cart.quantity, 1) + excluded.quantity
+                """, delta_rows)
+                database.execute("DELETE FROM user_cart WHERE user_id = ? AND quantity <= 0", (self.id,))
+                rows = database.execute("SELECT product_id, quantity FROM user_cart WHERE user_id = ?", (self.id,)).fetchall()
+            return [{"product_id": row["product_id"], "quantity": row["quantity"]} for row in rows]
+        except sqlite3.Error as e:
+            current_app.logger.error(f"Error applying cart changes for user {self.id}: {e}")
+            return None
+
     def add_to_cart_db(self, product_id, quantity=1):
-        # This simple logic adds a new row. A more robust version would update quantity if the item exists.
+        # Adding a product that is already in the cart increases its quantity
         database = db.get_db()
         if not database or not self.id: return False
         try:
             cursor = database.cursor()
-            cursor.execute("INSERT INTO user_cart (user_id, product_id, quantity) VALUES (?, ?, ?)", (self.id, str(product_id), quantity))
+            cursor.execute("""
+                INSERT INTO user_cart (user_id, product_id, quantity) VALUES (?, ?, ?)
+                ON CONFLICT(user_id, product_id) DO UPDATE SET quantity = COALESCE(user_cart.quantity, 1) + excluded.quantity
+            """, (self.id, str(product_id), quantity))
             database.commit()
             return True
         except sqlite3.Error as e:
@@ -1,4 +1,5 @@
 -- backend_flask/schema.sql
+-- Schema version 0. Later changes are versioned migrations in db.py (MIGRATIONS), tracked with PRAGMA user_version.
 
 DROP TABLE IF EXISTS users;
 DROP TABLE IF EXISTS user_wishlist;
@@ -39,9 +40,8 @@ CREATE TABLE user_cart (
     added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users (id)
     -- A product can only appear once in the cart; quantity is updated.
-    -- To enforce this, we make the combination of user and product unique.
-    -- This design is simpler for this project.
-    -- UNIQUE(user_id, product_id)
+    -- This is enforced by the unique index on (user_id, product_id) added by migration 1 in db.py,
+    -- which also brings existing databases (that may hold duplicate rows) up to date.
 );
 
 CREATE TABLE orders (
@@ -53,6 +53,7 @@ const proceedToCheckoutBtn = document.getElementById('proceedToCheckoutBtn');
 const productModalOverlay = document.getElementById('productModalOverlay');
 const productModalCloseBtn = document.getElementById('productModalCloseBtn');
 const modalMainImage = document.getElementById('modalMainImage');
+const modalMainImageWebp = document.getElementById('modalMainImageWebp');
 const modalThumbnails = document.getElementById('modalThumbnails');
 const modalProductName = document.getElementById('modalProductName');
 const modalProductPrice = document.getElementById('modalProductPrice');
@@ -106,6 +107,56 @@ async function fetchApi(endpoint, options = {}) {
     }
 }
 
+// Reads an NDJSON stream of {stage, ...} events, calling onEvent for each. Returns the last event, or null on error.
+async function fetchStreamingApi(endpoint, options, onEvent) {
+    showLoading(true);
+    let lastEvent = null;
+    try {
+        const response = await fetch(`${API_BASE_URL}${endpoint}`, options);
+        if (!response.ok || !response.body) {
+            const errorData = await response.json().catch(() => ({}));
+            console.error(`API Error (${response.status}) for ${endpoint}:`, errorData);
+            alert(`Error: ${errorData.error || response.statusText || 'Unknown server error'}`);
+            return null;
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+            const lines = buffered.split('\n');
+            buffered = done ? '' : lines.pop();
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                lastEvent = JSON.parse(line);
+                if (lastEvent.stage === 'error') {
+                    alert(`Error: ${lastEvent.error}`);
+                    return null;
+                }
+                onEvent(lastEvent);
+            }
+            if (done) break;
+        }
+        return lastEvent;
+    } catch (error) {
+        console.error(`Network/parsing error for ${endpoint}:`, error);
+        alert('Application error. Please check console.');
+        return null;
+    } finally {
+        showLoading(false);
+    }
+}
+
+// Image searches stream a visual-only ranking first, then the final one once the AI refinement is in
+function onRecommendationStage(event) {
+    if (event.stage !== 'visual') return;
+    // Show the first results but keep the inputs disabled until the stream ends
+    if(loadingText) loadingText.style.display = 'none';
+    displayRecommendations(event.recommendations, true);
+    displayAiInsights('Analyzing image...', 'Refining results...');
+}
+
 // --- Authentication ---
 function updateUserAuthDisplay() { 
     if (!userAuthSection) return;
@@ -156,26 +207,40 @@ async function fetchUserCart(showLoader = true) {
     return data && Array.isArray(data.cart) ? data.cart : [];
 }
 
-async function toggleWishlist(productId) {
-    if (!loggedInUser) { alert("Login to manage wishlist."); if(loginModal)loginModal.style.display='block'; return; }
-    const method = wishlistItems.some(item => item.id === productId) ? 'DELETE' : 'POST';
-    const res = await fetchApi('/api/wishlist', { method, headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ productId }) });
-    if (res && res.wishlist_ids !== undefined) { 
-        wishlistItems = await fetchUserWishlist(false); 
+// Batch updates: one request applies every change and returns the resulting list with product details
+async function updateWishlist(addIds = [], removeIds = []) {
+    const res = await fetchApi('/api/wishlist/batch', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ add: addIds, remove: removeIds }) });
+    if (res && Array.isArray(res.wishlist_details)) {
+        wishlistItems = res.wishlist_details;
         updateWishlistDisplay();
-        refreshCurrentRecommendationsDisplay(); 
+        refreshCurrentRecommendationsDisplay();
+        return true;
     } else if (res && res.error) { alert(`Wishlist Error: ${res.error}`); }
+    return false;
 }
-async function toggleCart(productId) {
-    if (!loggedInUser) { alert("Login to manage cart."); if(loginModal)loginModal.style.display='block'; return; }
-    const method = cartItems.some(item => item.id === productId) ? 'DELETE' : 'POST';
-    const res = await fetchApi('/api/cart', { method, headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ productId }) });
-    if (res && res.cart_items_data !== undefined) { 
-        cartItems = await fetchUserCart(false); 
+// changes: [{ productId, quantity }] to set quantities (0 removes) or [{ productId, delta }] to adjust them.
+// With replace = true the server cart becomes exactly `changes`, syncing a whole cart in one round-trip.
+async function updateCart(changes, replace = false) {
+    const res = await fetchApi('/api/cart/batch', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ changes, replace }) });
+    if (res && Array.isArray(res.cart_details)) {
+        cartItems = res.cart_details;
         updateCartDisplay();
-        refreshCurrentRecommendationsDisplay(); 
-        if (method === 'POST' && detailedProductToShow && detailedProductToShow.id === productId) closeModal();
+        refreshCurrentRecommendationsDisplay();
+        return true;
     } else if (res && res.error) { alert(`Cart Error: ${res.error}`); }
+    return false;
+}
+
+async function toggleWishlist(productId) {
+    if (!loggedInUser) { alert("Login to manage wishlist."); if(loginModal)loginModal.style.display='block'; return; }
+    const isInWishlist = wishlistItems.some(item => item.id === productId);
+    await updateWishlist(isInWishlist ? [] : [productId], isInWishlist ? [productId] : []);
+}
+async function toggleCart(productId) {
+    if (!loggedInUser) { alert("Login to manage cart."); if(loginModal)loginModal.style.display='block'; return; }
+    const isInCart = cartItems.some(item => item.id === productId);
+    const updated = await updateCart([{ productId, quantity: isInCart ? 0 : 1 }]);
+    if (updated && !isInCart && detailedProductToShow && detailedProductToShow.id === productId) closeModal();
 }
 async function updateUserPreference(action, value) {
     if (!loggedInUser) return;
@@ -183,6 +248,19 @@ async function updateUserPreference(action, value) {
 }
 
 // --- Recommendations & AI Display ---
+// Rendered widths of product images, for choosing among their resized derivatives (see style.css)
+const CARD_IMAGE_SIZES = '(max-width: 400px) 100vw, (max-width: 600px) 50vw, 250px';
+const LIST_IMAGE_SIZES = '60px';
+const MODAL_IMAGE_SIZES = '(max-width: 768px) 90vw, 500px';
+function derivativeSrcset(variants) { return (variants || []).map(v => `${v.url} ${v.width}w`).join(', '); }
+function pickDerivative(variants, minWidth) { return variants.find(v => v.width >= minWidth) || variants[variants.length - 1]; }
+function productImageHTML(product, sizes, fallbackWidth, className = '', alt = product.name || 'Product') {
+    // Products listing image derivatives get a <picture> with WebP and JPEG srcsets, so the browser fetches the size it displays
+    const derivatives = product.imageDerivatives; const classAttr = className ? ` class="${className}"` : '';
+    if (!derivatives || !derivatives.jpeg || !derivatives.jpeg.length) return `<img src="${product.imageUrl || '#'}" alt="${alt}"${classAttr} loading="lazy">`;
+    const webpSource = derivatives.webp && derivatives.webp.length ? `<source type="image/webp" srcset="${derivativeSrcset(derivatives.webp)}" sizes="${sizes}">` : '';
+    return `<picture class="product-picture">${webpSource}<img src="${pickDerivative(derivatives.jpeg, fallbackWidth).url}" srcset="${derivativeSrcset(derivatives.jpeg)}" sizes="${sizes}" alt="${alt}"${classAttr} loading="lazy" decoding="async"></picture>`;
+}
 function renderProductCard(product) { 
     const isInCart = cartItems.some(item => item.id === product.id);
     const isInWishlist = wishlistItems.some(item => item.id === product.id);
@@ -191,7 +269,7 @@ function renderProductCard(product) {
     let cartBadgeHTML = isInCart ? `<div class="card-cart-status-badge" title="In Cart">🛒</div>` : '';
     let reasonHTML = product.recommendationReason ? `<p class="recommendation-reason">${product.recommendationReason}</p>` : '';
     const whyIconHTML = product.detailedReasons && product.detailedReasons.length > 0 ? `<span class="why-recommendation-icon" title="Details" style="cursor:help;">ℹ️</span>` : '';
-    card.innerHTML = `<div class="card-actions-overlay">${cartBadgeHTML}<button class="card-wishlist-btn" data-product-id="${product.id}" title="${isInWishlist ? 'Remove from' : 'Add to'} Wishlist" aria-label="${isInWishlist ? 'Remove from' : 'Add to'} Wishlist">${wishlistHeartIcon}</button></div><div class="product-card-image-wrapper"><img src="${product.imageUrl || '#'}" alt="${product.name || 'Product'}"></div><div class="product-info"><div class="product-name-wrapper"><span class="product-name">${product.name || 'N/A'}</span>${whyIconHTML}</div><p class="product-price">${product.price || '$?.??'}</p>${product.type ? `<span class="product-type">${product.type}</span>` : ''}${reasonHTML}</div>`;
+    card.innerHTML = `<div class="card-actions-overlay">${cartBadgeHTML}<button class="card-wishlist-btn" data-product-id="${product.id}" title="${isInWishlist ? 'Remove from' : 'Add to'} Wishlist" aria-label="${isInWishlist ? 'Remove from' : 'Add to'} Wishlist">${wishlistHeartIcon}</button></div><div class="product-card-image-wrapper">${productImageHTML(product, CARD_IMAGE_SIZES, 320)}</div><div class="product-info"><div class="product-name-wrapper"><span class="product-name">${product.name || 'N/A'}</span>${whyIconHTML}</div><p class="product-price">${product.price || '$?.??'}</p>${product.type ? `<span class="product-type">${product.type}</span>` : ''}${reasonHTML}</div>`;
     card.addEventListener('click', (e) => { if (!e.target.closest('.card-wishlist-btn')) handleProductCardClick(product.id); });
     card.querySelector('.card-wishlist-btn').addEventListener('click', (e) => { e.stopPropagation(); toggleWishlist(product.id); });
     return card;
@@ -273,7 +351,8 @@ async function fetchAndDisplayRecommendations(prompt = '', imageFileContext = nu
         formData = new FormData();
         formData.append('imageFile', imageFileContext);
         if (currentTextPromptValue) formData.append('prompt', currentTextPromptValue);
-        data = await fetchApi('/upload_image', { method: 'POST', body: formData });
+        formData.append('stream', 'ndjson');
+        data = await fetchStreamingApi('/upload_image', { method: 'POST', body: formData }, onRecommendationStage);
         if (data && data.image_preview_url) currentImagePreviewUrl = data.image_preview_url;
 
     } else if (!isNewImageUpload && currentUploadedFileObject) { // Scenario 2: Refining with prompt, using existing image
@@ -281,7 +360,8 @@ async function fetchAndDisplayRecommendations(prompt = '', imageFileContext = nu
         formData = new FormData();
         formData.append('imageFile', currentUploadedFileObject); // Re-send the current file
         formData.append('prompt', currentTextPromptValue);
-        data = await fetchApi('/upload_image', { method: 'POST', body: formData });
+        formData.append('stream', 'ndjson');
+        data = await fetchStreamingApi('/upload_image', { method: 'POST', body: formData }, onRecommendationStage);
         // Preview URL should remain the same or be updated by backend if it re-serves it
 
     } else { // Scenario 3: Text-only search
@@ -335,7 +415,7 @@ function updateWishlistDisplay() { /* ... same, but calls refreshCurrentRecommen
     wishlistItemsList.innerHTML = ''; emptyWishlistMessage.style.display = wishlistItems.length === 0 ? 'block' : 'none';
     wishlistItems.forEach(item => { 
         const li = document.createElement('li'); li.className = 'wishlist-item';
-        li.innerHTML = `<img src="${item.imageUrl||'#'}" alt="${item.name||''}" class="wishlist-item-image"><div class="wishlist-item-details" data-product-id="${item.id}"><span class="wishlist-item-name">${item.name||'N/A'}</span><span class="wishlist-item-price">${item.price||'N/A'}</span></div><button class="wishlist-item-remove-btn btn-icon-subtle danger" data-product-id="${item.id}" title="Remove ${item.name||''}" aria-label="Remove ${item.name||''}"><span class="icon-placeholder-small">🗑️</span></button>`;
+        li.innerHTML = `${productImageHTML(item, LIST_IMAGE_SIZES, 120, 'wishlist-item-image', item.name||'')}<div class="wishlist-item-details" data-product-id="${item.id}"><span class="wishlist-item-name">${item.name||'N/A'}</span><span class="wishlist-item-price">${item.price||'N/A'}</span></div><button class="wishlist-item-remove-btn btn-icon-subtle danger" data-product-id="${item.id}" title="Remove ${item.name||''}" aria-label="Remove ${item.name||''}"><span class="icon-placeholder-small">🗑️</span></button>`;
         const detailsDiv = li.querySelector('.wishlist-item-details'); li.querySelector('.wishlist-item-image').addEventListener('click', () => handleProductCardClick(item.id)); if(detailsDiv) detailsDiv.addEventListener('click', () => handleProductCardClick(item.id)); li.querySelector('.wishlist-item-remove-btn').addEventListener('click', (e) => { e.stopPropagation(); toggleWishlist(item.id); });
         wishlistItemsList.appendChild(li);
     });
@@ -350,7 +430,7 @@ function updateCartDisplay() { /* ... same, but calls refreshCurrentRecommendati
     cartItems.forEach(item => { 
         const priceVal = parseFloat((item.price || '$0').replace('$', '')); if (!isNaN(priceVal)) currentTotal += (priceVal * (item.quantity || 1));
         const li = document.createElement('li'); li.className = 'cart-item';
-        li.innerHTML = `<img src="${item.imageUrl||'#'}" alt="${item.name||''}" class="cart-item-image"><div class="cart-item-details" data-product-id="${item.id}"><span class="cart-item-name">${item.name||'N/A'}</span><span class="cart-item-price">${item.price||'N/A'} (Qty: ${item.quantity || 1})</span></div><button class="cart-item-remove-btn btn-icon-subtle danger" data-product-id="${item.id}" title="Remove ${item.name||''}" aria-label="Remove ${item.name||''}"><span class="icon-placeholder-small">🗑️</span></button>`;
+        li.innerHTML = `${productImageHTML(item, LIST_IMAGE_SIZES, 120, 'cart-item-image', item.name||'')}<div class="cart-item-details" data-product-id="${item.id}"><span class="cart-item-name">${item.name||'N/A'}</span><span class="cart-item-price">${item.price||'N/A'} (Qty: ${item.quantity || 1})</span></div><button class="cart-item-remove-btn btn-icon-subtle danger" data-product-id="${item.id}" title="Remove ${item.name||''}" aria-label="Remove ${item.name||''}"><span class="icon-placeholder-small">🗑️</span></button>`;
         const detailsDiv = li.querySelector('.cart-item-details'); li.querySelector('.cart-item-image').addEventListener('click', () => handleProductCardClick(item.id)); if(detailsDiv) detailsDiv.addEventListener('click', () => handleProductCardClick(item.id)); li.querySelector('.cart-item-remove-btn').addEventListener('click', (e) => { e.stopPropagation(); toggleCart(item.id); });
         cartItemsList.appendChild(li);
     });
@@ -365,14 +445,20 @@ function updateModalButtons(productId) { /* ... same ... */
     modalWishlistBtnText.textContent = isInWishlist ? 'In Wishlist' : 'Add to Wishlist'; modalToggleWishlistBtn.querySelector('.icon-placeholder-small').textContent = isInWishlist ? '💖' : '🤍'; modalToggleWishlistBtn.classList.toggle('active', isInWishlist);
     modalCartBtnText.textContent = isInCart ? 'In Cart' : 'Add to Cart'; modalToggleCartBtn.classList.remove('add-to-cart-btn','remove-from-cart-btn'); modalToggleCartBtn.classList.add(isInCart ? 'remove-from-cart-btn' : 'add-to-cart-btn'); modalToggleCartBtn.querySelector('.icon-placeholder-small').textContent = isInCart ? '🛒' : '➕';
 }
+function showModalImage(url, derivatives) {
+    // With derivatives the browser picks a resized WebP/JPEG from the srcsets; other images are shown as is
+    const jpeg = derivatives && derivatives.jpeg && derivatives.jpeg.length ? derivatives.jpeg : null;
+    if(modalMainImageWebp) { modalMainImageWebp.srcset = jpeg ? derivativeSrcset(derivatives.webp) : ''; modalMainImageWebp.sizes = MODAL_IMAGE_SIZES; }
+    if(modalMainImage) { modalMainImage.srcset = jpeg ? derivativeSrcset(jpeg) : ''; modalMainImage.sizes = MODAL_IMAGE_SIZES; modalMainImage.src = jpeg ? pickDerivative(jpeg, 640).url : url; }
+}
 function handleProductCardClick(productId) { /* ... same, including preference logging ... */
     const product = findProductById(productId); if (!product) return; detailedProductToShow = product;
     if (loggedInUser) { if (product.category) updateUserPreference("interacted_category", product.category); if (product.color_tags && product.color_tags.length > 0) updateUserPreference("liked_color", product.color_tags[0]); }
-    if(modalMainImage) modalMainImage.src = (product.images && product.images.length > 0 ? product.images[0] : product.imageUrl) || '#';
+    showModalImage((product.images && product.images.length > 0 ? product.images[0] : product.imageUrl) || '#', product.imageDerivatives);
     if(modalProductName) modalProductName.textContent = product.name || 'N/A'; if(modalProductPrice) modalProductPrice.textContent = product.price || '$?.??'; if(modalProductDescription) modalProductDescription.textContent = product.description || "N/A";
     if(modalProductAttributes) { modalProductAttributes.innerHTML = ''; if (product.sizes && product.sizes.length) modalProductAttributes.innerHTML += `<p><strong>Sizes:</strong> ${product.sizes.join(', ')}</p>`; if (product.colors && product.colors.length) modalProductAttributes.innerHTML += `<p><strong>Colors:</strong> ${product.colors.join(', ')}</p>`; if (product.material) modalProductAttributes.innerHTML += `<p><strong>Material:</strong> ${product.material}</p>`; }
     if(modalRecommendationReason && modalReasonText && modalDetailedReasonsList) { if (product.recommendationReason || (product.detailedReasons && product.detailedReasons.length)) { modalRecommendationReason.style.display = 'block'; modalReasonText.textContent = product.recommendationReason || ""; modalDetailedReasonsList.innerHTML = ''; if (product.detailedReasons && product.detailedReasons.length) product.detailedReasons.forEach(r => {const li=document.createElement('li');li.textContent=r;modalDetailedReasonsList.appendChild(li);}); } else { modalRecommendationReason.style.display = 'none'; } }
-    if(modalThumbnails) { modalThumbnails.innerHTML = ''; if (product.images && product.images.length > 1) product.images.forEach((url, i) => { const t=document.createElement('img');t.src=url;t.alt=`Thumb ${i+1}`;t.className=i===0?'active-thumbnail':'';t.onclick=()=>{if(modalMainImage)modalMainImage.src=url;modalThumbnails.querySelectorAll('img').forEach(th=>th.classList.remove('active-thumbnail'));t.classList.add('active-thumbnail');};modalThumbnails.appendChild(t); });}
+    if(modalThumbnails) { modalThumbnails.innerHTML = ''; if (product.images && product.images.length > 1) product.images.forEach((url, i) => { const t=document.createElement('img');t.src=url;t.alt=`Thumb ${i+1}`;t.className=i===0?'active-thumbnail':'';t.onclick=()=>{showModalImage(url, i===0 ? product.imageDerivatives : null);modalThumbnails.querySelectorAll('img').forEach(th=>th.classList.remove('active-thumbnail'));t.classList.add('active-thumbnail');};modalThumbnails.appendChild(t); });}
     updateModalButtons(productId); if(productModalOverlay) productModalOverlay.style.display = 'flex';
 }
 function closeModal() { if(productModalOverlay) productModalOverlay.style.display = 'none'; detailedProductToShow = null; refreshCurrentRecommendationsDisplay(); /* Added to refresh card icons */ }
@@ -381,7 +467,7 @@ async function handleCheckout() { /* ... same ... */
     if (!loggedInUser) { alert("Login to checkout."); if(loginModal) loginModal.style.display='block'; return; }
     if (cartItems.length === 0) { alert("Cart is empty."); return; }
     const res = await fetchApi('/api/mock_checkout_process', { method: 'POST' });
-    if (res && res.message) { alert(res.message + (res.orderId ? `\nID: ${res.orderId}` : "")); cartItems = await fetchUserCart(false); updateCartDisplay(); } 
+    if (res && res.message) { alert(res.message + (res.orderId ? `\nID: ${res.orderId}` : "")); cartItems = []; updateCartDisplay(); } 
     else if (res && res.error) { alert(`Checkout Error: ${res.error}`); } else { alert("Checkout failed."); }
 }
 function populateExamplePrompts() { /* ... same ... */ 
@@ -0,0 +1,80 @@
+# benchmarks/bench_keywords.py
+"""
+Measures spaCy keyword extraction throughput (texts/second) over catalog descriptions:
+the full en_core_web_sm pipeline one text at a time (how keywords were extracted before),
+the trimmed pipeline one text at a time, the trimmed pipeline through nlp.pipe (which also processes
+duplicate texts only once), and cache hits.
+Also checks that the trimmed pipeline returns the same keywords as the full one.
+
+Run from the project root (with the backend venv active):
+    python -m benchmarks.bench_keywords --num-texts 2000 --batch-size 256
+"""
+import argparse
+import json
+import os
+import time
+from flask import Flask
+
+from backend_flask.ai_core import language_models
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend_flask")
+DEFAULT_CATALOG = os.path.join(BACKEND_DIR, "curated_product_catalog.json")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark spaCy keyword extraction.")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG, help="Catalog JSON whose descriptions are used as texts.")
+    parser.add_argument("--num-texts", type=int, default=2000, help="Number of texts per measurement.")
+    parser.add_argument("--batch-size", type=int, default=None, help="nlp.pipe batch size (default: SPACY_PIPE_BATCH_SIZE).")
+    parser.add_argument("--n-process", type=int, default=1, help="nlp.pipe worker processes.")
+    return parser.parse_args()
+
+def report(mode, texts, elapsed):
+    print(f"{mode:<22}{elapsed:>10.2f}{len(texts) / elapsed:>12.1f}")
+
+def main():
+    args = parse_args()
+    with open(args.catalog, "r") as f:
+        products = json.load(f)
+    texts = [f"{p.get('name', '')}. {p.get('description', '')}" for p in products][:args.num_texts]
+    if not texts:
+        print(f"No products found in {args.catalog}")
+        return
+
+    import spacy
+    app = Flask("backend_flask", root_path=BACKEND_DIR)
+    with app.app_context():
+        language_models.load_spacy_model()
+        if not language_models.is_spacy_model_loaded():
+            print("spaCy model could not be loaded.")
+            return
+        full_nlp = spacy.load(language_models.SPACY_MODEL_NAME)
+        trimmed_nlp = language_models.nlp_spacy
+        print(f"Extracting keywords from {len(texts)} texts")
+        print(f"full pipeline:    {', '.join(full_nlp.pipe_names)}")
+        print(f"trimmed pipeline: {', '.join(trimmed_nlp.pipe_names)}")
+        print(f"{'mode':<22}{'seconds':>10}{'texts/s':>12}")
+
+        start = time.perf_counter()
+        full_keywords = [set(language_models._keywords_from_doc(full_nlp(language_models._normalize_keyword_text(t)))) for t in texts]
+        report("full, per text", texts, time.perf_counter() - start)
+
+        language_models.spacy_keyword_cache.clear()
+        start = time.perf_counter()
+        for text in texts:
+            language_models._keywords_from_doc(trimmed_nlp(language_models._normalize_keyword_text(text)))
+        report("trimmed, per text", texts, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        batch_keywords = language_models.extract_keywords_spacy_batch(texts, batch_size=args.batch_size, n_process=args.n_process)
+        report("trimmed, nlp.pipe", texts, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for text in texts:
+            language_models.extract_keywords_spacy(text)
+        report("cached", texts, time.perf_counter() - start)
+
+        mismatches = sum(set(batch) != full for batch, full in zip(batch_keywords, full_keywords))
+        print(f"texts whose keywords differ from the full pipeline: {mismatches}/{len(texts)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# benchmarks/bench_pipeline.py
+"""
+Offline benchmark of the recommendation pipeline, catalog loading and the main routes on synthetic catalogs.
+OpenAI and Gemini are replaced by deterministic local stand-ins (with optional simulated latency) and, by default,
+the ViT by a tiny random-weight model, so no API keys or model downloads are needed.
+
+For each catalog size it reports latency percentiles (p50/p90/p99) and throughput for:
+  catalog loading (cold: embeddings computed, warm: embeddings and indexes reused),
+  generate_final_recommendations per pipeline stage (image and text queries, cold and cached),
+  /upload_image (also time to the first streamed stage), /get_recommendations and the cart/wishlist routes.
+Results are written as JSON (by default to benchmarks/results/pipeline-<commit>.json); pass an earlier
+results file to --compare to print the change in median latency.
+
+The user database and the LLM/upload caches are redirected into --work-dir, so the app's real data is untouched.
+Run from the project root (with the backend venv active):
+    python -m benchmarks.bench_pipeline --sizes 2000,100000,1000000 --iterations 50
+    python -m benchmarks.bench_pipeline --sizes 2000 --openai-latency-ms 2500 --gemini-latency-ms 1200 --compare old.json
+"""
+import argparse
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from flask import Flask
+
+from benchmarks import offline_stand_ins as stand_ins
+from backend_flask import image_derivatives
+from backend_flask.ai_core import product_catalog, vision_models, language_models
+from backend_flask.ai_core.upload_cache import fingerprint_upload
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+DEFAULT_WORK_DIR = os.path.join(BENCHMARKS_DIR, ".work")
+DEFAULT_RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+RESULTS_FORMAT_VERSION = 1
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the recommendation pipeline and routes.")
+    parser.add_argument("--sizes", default="2000,100000", help="Comma-separated synthetic catalog sizes (e.g. 2000,100000,1000000).")
+    parser.add_argument("--iterations", type=int, default=50, help="Measured calls per benchmark.")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured calls before each benchmark.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Client threads for the recommendation routes.")
+    parser.add_argument("--vit", choices=["tiny", "real"], default="tiny", help="Tiny random-weight ViT or the real model.")
+    parser.add_argument("--tiny-vit-dim", type=int, default=64, help="Embedding size of the tiny ViT.")
+    parser.add_argument("--unique-images", type=int, default=256, help="Distinct product images shared by the synthetic catalog.")
+    parser.add_argument("--openai-latency-ms", type=float, default=0.0, help="Simulated latency of the OpenAI stand-in.")
+    parser.add_argument("--gemini-latency-ms", type=float, default=0.0, help="Simulated latency of the Gemini stand-in.")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="Where synthetic catalogs, caches and the user DB live.")
+    parser.add_argument("--output", default=None, help="Results JSON path (default: benchmarks/results/pipeline-<commit>.json).")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare median latencies against.")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+# --- Measurement ---
+def summarize(latencies_ms, wall_seconds=None):
+    latencies = np.asarray(latencies_ms, dtype=np.float64)
+    if latencies.size == 0:
+        return {"count": 0}
+    summary = {
+        "count": int(latencies.size),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p90_ms": round(float(np.percentile(latencies, 90)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "max_ms": round(float(latencies.max()), 3),
+    }
+    if wall_seconds:
+        summary["throughput_per_s"] = round(latencies.size / wall_seconds, 2)
+    return summary
+
+def measure(call, iterations, warmup=0, concurrency=1):
+    """
+    Runs call(i) for i in range(iterations) after `warmup` unmeasured calls (with negative i).
+    Returns (latency summary with throughput, list of return values).
+    """
+    for i in range(warmup):
+        call(-1 - i)
+
+    def timed(i):
+        started_at = time.perf_counter()
+        value = call(i)
+        return (time.perf_counter() - started_at) * 1000, value
+
+    started_at = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(timed, range(iterations)))
+    else:
+        outcomes = [timed(i) for i in range(iterations)]
+    wall_seconds = time.perf_counter() - started_at
+    return summarize([latency for latency, _ in outcomes], wall_seconds), [value for _, value in outcomes]
+
+def summarize_stages(stage_timings):
+    """Percentiles per pipeline stage from a list of stage_timings_ms dicts."""
+    names = sorted({name for timings in stage_timings for name in timings})
+    return {name: summarize([timings[name] for timings in stage_timings if name in timings]) for name in names}
+
+# --- Setup ---
+def load_catalog(catalog_dir, cold):
+    """
+    Loads the synthetic catalog in catalog_dir; cold removes stored embeddings, indexes, snapshots, catalog artifacts and
+    saved image widths first. Returns seconds.
+    """
+    base_path, _ = os.path.splitext(os.path.join(catalog_dir, product_catalog.DB_METADATA_FILE))
+    if cold:
+        for pattern in (".embeddings.*", ".index.*", ".snapshot*", ".columnar*"):
+            for path in glob.glob(f"{base_path}{pattern}"):
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+        widths_path = os.path.join(catalog_dir, image_derivatives.IMAGE_DERIVATIVE_CACHE_DIR, image_derivatives.SOURCE_WIDTHS_FILENAME)
+        if os.path.exists(widths_path):
+            os.remove(widths_path)
+    stand_ins.reset_catalog_state()
+    catalog_app = Flask("backend_flask", root_path=catalog_dir)
+    with catalog_app.app_context():
+        started_at = time.perf_counter()
+        product_catalog.load_and_preprocess_catalog()
+        return round(time.perf_counter() - started_at, 3)
+
+def query_image(seed):
+    return vision_models.DecodedImage(stand_ins.make_image_bytes(seed, size=224))
+
+def query_prompt(i, rng_seed):
+    rng = stand_ins._seeded("prompt", rng_seed, i)
+    return f"{rng.choice(stand_ins.COLORS)} {rng.choice(stand_ins.TYPES)} for a {rng.choice(stand_ins.STYLES)} {rng.choice(stand_ins.SEASONS)} look {i}"
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+# --- Benchmarks ---
+def bench_pipeline(webapp, args, size):
+    """generate_final_recommendations called directly, with per-stage timings."""
+    results = {}
+    seed_base = 10**9 + size
+
+    def image_query(i, repeat=False):
+        image = query_image(seed_base if repeat else seed_base + 1 + i + args.warmup)
+        with webapp.app.app_context():
+            _, _, _, timings = webapp.generate_final_recommendations(
+                query_image=image, text_prompt=query_prompt(0 if repeat else i, size), image_fingerprint=fingerprint_upload(image))
+        return timings
+
+    def text_query(i, repeat=False):
+        with webapp.app.app_context():
+            _, _, _, timings = webapp.generate_final_recommendations(text_prompt=query_prompt(0 if repeat else i + 10**6, size))
+        return timings
+
+    for name, call in (("image_cold", image_query), ("image_cached", lambda i: image_query(i, repeat=True)),
+                       ("text_cold", text_query), ("text_cached", lambda i: text_query(i, repeat=True))):
+        summary, timings = measure(call, args.iterations, args.warmup)
+        results[name] = dict(summary, stages=summarize_stages(timings))
+    return results
+
+def bench_routes(webapp, args, size):
+    results = {}
+    seed_base = 2 * 10**9 + size
+    clients = [webapp.app.test_client() for _ in range(max(1, args.concurrency))]
+
+    def client_for(i):
+        return clients[i % len(clients)]
+
+    def upload(i, repeat=False, stream=False):
+        image_bytes = stand_ins.make_image_bytes(seed_base if repeat else seed_base + 1 + i + args.warmup, size=224)
+        form = {"imageFile": (io.BytesIO(image_bytes), "query.jpg"), "prompt": query_prompt(i, size)}
+        if stream:
+            form["stream"] = "ndjson"
+            started_at = time.perf_counter()
+            response = client_for(i).post("/upload_image", data=form, content_type="multipart/form-data", buffered=False)
+            chunks = iter(response.response)
+            next(chunks, None)
+            first_event_ms = (time.perf_counter() - started_at) * 1000
+            for _ in chunks:
+                pass
+            response.close()
+            return first_event_ms
+        response = client_for(i).post("/upload_image", data=form, content_type="multipart/form-data")
+        assert response.status_code == 200, response.get_json()
+        return None
+
+    def recommend(i, repeat=False):
+        response = client_for(i).post("/get_recommendations", json={"prompt": query_prompt(0 if repeat else i + 2 * 10**6, size)})
+        assert response.status_code == 200, response.get_json()
+
+    concurrency = args.concurrency
+    results["upload_image_cold"], _ = measure(upload, args.iterations, args.warmup, concurrency)
+    results["upload_image_cached"], _ = measure(lambda i: upload(i, repeat=True), args.iterations, args.warmup, concurrency)
+    summary, first_events = measure(lambda i: upload(i, stream=True), args.iterations, args.warmup, concurrency)
+    results["upload_image_stream"] = dict(summary, first_event=summarize(first_events))
+    results["get_recommendations_cold"], _ = measure(recommend, args.iterations, args.warmup, concurrency)
+    results["get_recommendations_cached"], _ = measure(lambda i: recommend(i, repeat=True), args.iterations, args.warmup, concurrency)
+
+    # Cart and wishlist routes for one signed-in user, sequentially (they share the session cookie)
+    client = webapp.app.test_client()
+    username = f"bench{size}_{int(time.time() * 1000)}"
+    response = client.post("/api/signup", json={"username": username, "email": f"{username}@example.com", "password": "benchmark-password"})
+    assert response.status_code == 201, response.get_json()
+    products = product_catalog.get_catalog_products()
+    product_ids = [str(products[position]["id"]) for position in np.linspace(0, len(products) - 1, num=min(200, len(products)), dtype=int)]
+
+    def pick(i, count):
+        return [product_ids[(i * count + offset) % len(product_ids)] for offset in range(count)]
+
+    def post_ok(path, payload):
+        response = client.post(path, json=payload)
+        assert response.status_code == 200, (path, response.get_json())
+
+    results["cart_add"], _ = measure(lambda i: post_ok("/api/cart", {"productId": pick(i, 1)[0]}), args.iterations, args.warmup)
+    results["cart_batch_10"], _ = measure(
+        lambda i: post_ok("/api/cart/batch", {"changes": [{"productId": pid, "delta": 1} for pid in pick(i, 10)]}),
+        args.iterations, args.warmup)
+    results["wishlist_batch_10"], _ = measure(
+        lambda i: post_ok("/api/wishlist/batch", {"add": pick(i, 10), "remove": pick(i + 1, 5)}), args.iterations, args.warmup)
+    results["current_user_status"], _ = measure(
+        lambda i: client.get("/api/current_user_status").status_code, args.iterations, args.warmup)
+    return results
+
+# --- Reporting ---
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"{'benchmark':<34}{'n':>6}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'per s':>10}")
+    for name, summary in rows:
+        if not summary.get("count"):
+            continue
+        throughput = summary.get("throughput_per_s")
+        print(f"{name:<34}{summary['count']:>6}{summary['p50_ms']:>11.2f}{summary['p90_ms']:>11.2f}{summary['p99_ms']:>11.2f}"
+              f"{throughput if throughput is not None else '-':>10}")
+
+def flatten(size_results):
+    """(name, summary) pairs for every measurement of one catalog size, including per-stage and nested summaries."""
+    rows = []
+    for group in ("pipeline", "routes"):
+        for name, summary in size_results[group].items():
+            rows.append((f"{group}.{name}", summary))
+            for stage, stage_summary in summary.get("stages", {}).items():
+                rows.append((f"{group}.{name}.{stage}", stage_summary))
+            if "first_event" in summary:
+                rows.append((f"{group}.{name}.first_event", summary["first_event"]))
+    return rows
+
+def print_comparison(baseline, current):
+    print(f"\nMedian latency vs {baseline.get('commit') or 'baseline'} (negative is faster)")
+    for size, size_results in current["sizes"].items():
+        if size not in baseline.get("sizes", {}):
+            continue
+        before = dict(flatten(baseline["sizes"][size]))
+        for name, summary in flatten(size_results):
+            old = before.get(name, {}).get("p50_ms")
+            if old and summary.get("p50_ms") is not None:
+                print(f"{size:>8} {name:<44}{old:>10.2f} -> {summary['p50_ms']:>10.2f} ms{(summary['p50_ms'] / old - 1) * 100:>+9.1f}%")
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    work_dir = os.path.abspath(os.path.join(args.work_dir, args.vit))
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Everything the app would otherwise reach out for is replaced before it is imported
+    stand_ins.redirect_state_files(work_dir)
+    stand_ins.install_gemini_stand_in(args.gemini_latency_ms / 1000)
+    if args.vit == "tiny":
+        stand_ins.install_tiny_vit(args.tiny_vit_dim, seed=args.seed)
+    catalog_dirs = {}
+    for size in sizes:
+        print(f"Preparing synthetic catalog with {size} products...")
+        catalog_dirs[size] = os.path.join(work_dir, f"catalog_{size}")
+        stand_ins.write_synthetic_catalog(catalog_dirs[size], size, unique_images=args.unique_images, seed=args.seed)
+    # The app's startup warmup must find a catalog already loaded, so it never touches the real one
+    load_catalog(catalog_dirs[sizes[0]], cold=False)
+
+    import backend_flask.app as webapp
+    webapp.warmup_complete.wait()
+    webapp.openai_client = stand_ins.StandInOpenAIClient(args.openai_latency_ms / 1000)
+
+    commit, dirty = git_commit()
+    report = {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "benchmark": "pipeline",
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "settings": dict(vars(args), vector_index_kind=product_catalog.VECTOR_INDEX_KIND,
+                         shared_catalog_snapshot=product_catalog.SHARED_CATALOG_SNAPSHOT),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "device": vision_models.get_device(),
+            "spacy_model_loaded": language_models.is_spacy_model_loaded(),
+        },
+        "sizes": {},
+    }
+    if not language_models.is_spacy_model_loaded():
+        print("Note: spaCy model not installed; the keywords stage returns no keywords.")
+
+    for size in sizes:
+        print(f"\n=== {size} products ===")
+        size_results = {"catalog_load_s": {"cold": load_catalog(catalog_dirs[size], cold=True),
+                                           "warm": load_catalog(catalog_dirs[size], cold=False)}}
+        print(f"catalog load: cold {size_results['catalog_load_s']['cold']:.2f}s, warm {size_results['catalog_load_s']['warm']:.2f}s")
+        size_results["pipeline"] = bench_pipeline(webapp, args, size)
+        size_results["routes"] = bench_routes(webapp, args, size)
+        print_table(f"{size} products", flatten(size_results))
+        report["sizes"][str(size)] = size_results
+
+    output_path = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"pipeline-{commit or 'unknown'}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {output_path}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
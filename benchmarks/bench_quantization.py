@@ -0,0 +1,66 @@
+# benchmarks/bench_quantization.py
+"""
+Reports memory use, recall@k and per-query latency of the compact embedding storage modes
+(float16, per-vector int8, product quantization) against exact float32 search.
+
+By default a synthetic clustered catalog is generated; --embeddings can point at the catalog's
+.embeddings.npy store instead. Run from the project root:
+    python -m benchmarks.bench_quantization --num-vectors 200000 --pq-subspaces 48,96,192
+"""
+import argparse
+import time
+import numpy as np
+
+from backend_flask.ai_core.vector_index import build_vector_index
+from benchmarks.bench_vector_index import normalize, synthetic_embeddings, time_queries
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark compact embedding storage against float32 search.")
+    parser.add_argument("--embeddings", default=None, help="Optional .npy matrix of real embeddings to index.")
+    parser.add_argument("--num-vectors", type=int, default=200000, help="Synthetic catalog size.")
+    parser.add_argument("--dim", type=int, default=768, help="Synthetic embedding dimension (ViT-base is 768).")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=24, help="Candidates per query (app uses top_k * 2 = 24).")
+    parser.add_argument("--pq-subspaces", default="48,96,192", help="Comma-separated PQ sizes (bytes per vector) to sweep.")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    if args.embeddings:
+        matrix = normalize(np.load(args.embeddings).astype(np.float32)).astype(np.float32)
+    else:
+        matrix = synthetic_embeddings(rng, args.num_vectors, args.dim)
+    query_rows = rng.choice(matrix.shape[0], size=min(args.num_queries, matrix.shape[0]), replace=False)
+    queries = normalize(matrix[query_rows] + 0.3 * rng.standard_normal((len(query_rows), matrix.shape[1]), dtype=np.float32)).astype(np.float32)
+    print(f"Catalog: {matrix.shape[0]} x {matrix.shape[1]}, {len(queries)} queries, top_k={args.top_k}")
+
+    exact = build_vector_index("exact", matrix)
+    exact_results, exact_latencies = time_queries(exact, queries, args.top_k)
+    exact_bytes = exact.memory_bytes()
+
+    configs = [("float16", {}), ("int8", {})]
+    configs += [("pq", {"n_subspaces": int(m)}) for m in args.pq_subspaces.split(",") if m.strip()]
+
+    print(f"{'storage':<10}{'bytes/vec':>10}{'total MiB':>11}{'vs f32':>8}{'build s':>9}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    print(f"{'float32':<10}{exact_bytes / len(exact):>10.0f}{exact_bytes / 2**20:>11.1f}{1.0:>8.1f}{0.0:>9.1f}{1.0:>10.3f}"
+          f"{np.percentile(exact_latencies, 50):>9.2f}{np.percentile(exact_latencies, 95):>9.2f}")
+    for kind, params in configs:
+        start = time.perf_counter()
+        try:
+            index = build_vector_index(kind, matrix, seed=args.seed, **params)
+        except ValueError as e:
+            print(f"{kind:<10}skipped: {e}")
+            continue
+        build_seconds = time.perf_counter() - start
+        results, latencies = time_queries(index, queries, args.top_k)
+        recall = np.mean([len(np.intersect1d(r, e)) / max(1, len(e)) for r, e in zip(results, exact_results)])
+        label = f"pq{params['n_subspaces']}" if kind == "pq" else kind
+        index_bytes = index.memory_bytes()
+        print(f"{label:<10}{index_bytes / len(index):>10.1f}{index_bytes / 2**20:>11.1f}{exact_bytes / index_bytes:>8.1f}"
+              f"{build_seconds:>9.1f}{recall:>10.3f}{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 95):>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/bench_startup.py
+"""
+Measures app startup in eager and lazy (LAZY_MODEL_LOADING=1) modes, each in a fresh interpreter:
+time to import backend_flask.app, time to the first /healthz response, time until /readyz reports ready,
+and which heavy libraries were already imported when the import returned
+(in lazy mode the warmup thread may have started importing some of them by then).
+
+Run from the project root:
+    python -m benchmarks.bench_startup --repeats 3
+For a per-module breakdown of import cost use: python -X importtime -c "import backend_flask.app"
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+HEAVY_MODULES = ("torch", "transformers", "spacy", "openai", "google.generativeai")
+
+CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from backend_flask.app import app
+imported = time.perf_counter()
+heavy = [name for name in {heavy_modules!r} if name in sys.modules]
+client = app.test_client()
+healthz_status = client.get("/healthz").status_code
+first_response = time.perf_counter()
+ready = None
+while time.perf_counter() - started < {ready_timeout}:
+    if client.get("/readyz").status_code == 200:
+        ready = time.perf_counter() - started
+        break
+    time.sleep(0.05)
+print(json.dumps({{"import_s": imported - started, "healthz_s": first_response - started,
+                   "healthz_status": healthz_status, "ready_s": ready, "heavy_at_import": heavy}}))
+"""
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark app import time and time-to-ready.")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh interpreters started per mode.")
+    parser.add_argument("--ready-timeout", type=float, default=600.0, help="Seconds to wait for /readyz.")
+    parser.add_argument("--modes", default="eager,lazy", help="Comma-separated startup modes to measure.")
+    return parser.parse_args()
+
+def run_once(lazy, ready_timeout):
+    env = dict(os.environ, LAZY_MODEL_LOADING="1" if lazy else "0")
+    script = CHILD_SCRIPT.format(heavy_modules=HEAVY_MODULES, ready_timeout=ready_timeout)
+    completed = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True)
+    # The app logs to stderr; the measurements are the last line on stdout
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main():
+    args = parse_args()
+    print(f"{'mode':<7}{'import s':>10}{'healthz s':>11}{'ready s':>10}  heavy modules loaded at import")
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        runs = [run_once(mode == "lazy", args.ready_timeout) for _ in range(args.repeats)]
+        ready_times = [run["ready_s"] for run in runs if run["ready_s"] is not None]
+        ready = f"{np.median(ready_times):>10.2f}" if ready_times else f"{'never':>10}"
+        print(f"{mode:<7}{np.median([r['import_s'] for r in runs]):>10.2f}{np.median([r['healthz_s'] for r in runs]):>11.2f}"
+              f"{ready}  {', '.join(runs[-1]['heavy_at_import']) or '-'}")
+
+if __name__ == "__main__":
+    main()
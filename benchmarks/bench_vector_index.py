@@ -0,0 +1,77 @@
+# benchmarks/bench_vector_index.py
+"""
+Compares approximate vector indexes against exact search: recall@k and per-query latency.
+
+By default a synthetic clustered catalog is generated; --embeddings can point at the catalog's
+.embeddings.npy store instead. Run from the project root:
+    python -m benchmarks.bench_vector_index --num-vectors 200000 --nprobe 1,2,4,8,16,32,64
+"""
+import argparse
+import time
+import numpy as np
+
+from backend_flask.ai_core.vector_index import build_vector_index
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall vs latency against exact search.")
+    parser.add_argument("--embeddings", default=None, help="Optional .npy matrix of real embeddings to index.")
+    parser.add_argument("--num-vectors", type=int, default=200000, help="Synthetic catalog size.")
+    parser.add_argument("--dim", type=int, default=768, help="Synthetic embedding dimension (ViT-base is 768).")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=24, help="Candidates per query (app uses top_k * 2 = 24).")
+    parser.add_argument("--n-lists", type=int, default=None, help="IVF lists (default: 4 * sqrt(N)).")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64", help="Comma-separated nprobe values to sweep.")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def normalize(matrix):
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+def synthetic_embeddings(rng, n, dim, n_clusters=1000):
+    """Clustered vectors roughly shaped like image embeddings: many products share a visual 'style'."""
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, n_clusters, size=n)]
+    vectors += 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+    return normalize(vectors).astype(np.float32)
+
+def time_queries(index, queries, top_k, **params):
+    """Returns (results, latencies in ms) for running every query through the index."""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = index.search(query, top_k, **params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(rows)
+    return results, np.array(latencies)
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    if args.embeddings:
+        matrix = normalize(np.load(args.embeddings).astype(np.float32)).astype(np.float32)
+    else:
+        matrix = synthetic_embeddings(rng, args.num_vectors, args.dim)
+    # Queries are perturbed catalog vectors, like a shopper photo of a product we stock
+    query_rows = rng.choice(matrix.shape[0], size=min(args.num_queries, matrix.shape[0]), replace=False)
+    queries = normalize(matrix[query_rows] + 0.3 * rng.standard_normal((len(query_rows), matrix.shape[1]), dtype=np.float32)).astype(np.float32)
+    print(f"Catalog: {matrix.shape[0]} x {matrix.shape[1]}, {len(queries)} queries, top_k={args.top_k}")
+
+    exact = build_vector_index("exact", matrix)
+    exact_results, exact_latencies = time_queries(exact, queries, args.top_k)
+
+    start = time.perf_counter()
+    ivf = build_vector_index("ivf", matrix, n_lists=args.n_lists, seed=args.seed)
+    print(f"IVF build: {time.perf_counter() - start:.1f}s, {ivf.n_lists} lists")
+
+    print(f"{'index':<8}{'nprobe':>8}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'speedup':>10}")
+    exact_p50 = np.percentile(exact_latencies, 50)
+    print(f"{'exact':<8}{'-':>8}{1.0:>10.3f}{exact_p50:>10.2f}{np.percentile(exact_latencies, 95):>10.2f}{1.0:>10.1f}")
+    for nprobe in [int(n) for n in args.nprobe.split(",") if n.strip()]:
+        results, latencies = time_queries(ivf, queries, args.top_k, nprobe=nprobe)
+        recall = np.mean([len(np.intersect1d(r, e)) / max(1, len(e)) for r, e in zip(results, exact_results)])
+        p50 = np.percentile(latencies, 50)
+        print(f"{'ivf':<8}{nprobe:>8}{recall:>10.3f}{p50:>10.2f}{np.percentile(latencies, 95):>10.2f}{exact_p50 / p50:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_vit_batch.py
+"""
+Measures ViT feature extraction throughput (images/second) for different batch sizes.
+
+Run from the project root (with the backend venv active):
+    python -m benchmarks.bench_vit_batch --num-images 256 --batch-sizes 1,2,4,8,16,32,64
+"""
+import argparse
+import glob
+import os
+import time
+from flask import Flask
+
+from backend_flask.ai_core import vision_models
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend_flask")
+DEFAULT_IMAGE_DIR = os.path.join(BACKEND_DIR, "static", "product_images_db")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark batched ViT feature extraction.")
+    parser.add_argument("--image-dir", default=DEFAULT_IMAGE_DIR, help="Directory of .jpg images to embed.")
+    parser.add_argument("--num-images", type=int, default=256, help="Number of images per measurement.")
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16,32,64", help="Comma-separated batch sizes.")
+    parser.add_argument("--workers", type=int, default=None, help="Preprocessing threads (default: VIT_PREPROCESS_WORKERS).")
+    parser.add_argument("--include-single", action="store_true", help="Also time the one-image-per-call extract_vit_features loop.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    image_paths = sorted(glob.glob(os.path.join(args.image_dir, "*.jpg")))[:args.num_images]
+    if not image_paths:
+        print(f"No images found in {args.image_dir}")
+        return
+
+    app = Flask("backend_flask", root_path=BACKEND_DIR)
+    with app.app_context():
+        vision_models.load_vit_model()
+        if vision_models.model_vit is None:
+            print("ViT model could not be loaded.")
+            return
+
+        # Warm up kernels and caches so the first measurement is not penalised
+        vision_models.extract_vit_features_batch(image_paths[:4], batch_size=4, num_workers=args.workers)
+
+        print(f"Embedding {len(image_paths)} images on {vision_models.get_device()}")
+        print(f"{'mode':<12}{'batch':>8}{'seconds':>12}{'images/s':>12}")
+
+        if args.include_single:
+            start = time.perf_counter()
+            for path in image_paths:
+                vision_models.extract_vit_features(path)
+            elapsed = time.perf_counter() - start
+            print(f"{'single':<12}{1:>8}{elapsed:>12.2f}{len(image_paths) / elapsed:>12.1f}")
+
+        for batch_size in [int(b) for b in args.batch_sizes.split(",") if b.strip()]:
+            start = time.perf_counter()
+            vision_models.extract_vit_features_batch(image_paths, batch_size=batch_size, num_workers=args.workers)
+            elapsed = time.perf_counter() - start
+            print(f"{'batched':<12}{batch_size:>8}{elapsed:>12.2f}{len(image_paths) / elapsed:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# benchmarks/offline_stand_ins.py
+"""
+Deterministic local stand-ins for the OpenAI and Gemini clients, a tiny random-weight ViT and synthetic catalogs,
+so the recommendation pipeline and routes can be benchmarked without API keys, model downloads or the Kaggle data.
+
+Everything here patches module globals of the running process only; nothing is written outside the work directory.
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import time
+import types
+from types import SimpleNamespace
+import numpy as np
+from PIL import Image
+
+from backend_flask import db, image_derivatives
+from backend_flask.ai_core import language_models, product_catalog, upload_cache, vision_models
+
+COLORS = ["black", "white", "navy", "blue", "red", "green", "grey", "beige", "brown", "pink", "purple", "yellow", "olive", "maroon"]
+TYPES = ["shirt", "tshirt", "jeans", "trousers", "dress", "skirt", "jacket", "sweater", "shorts", "kurta", "sneakers", "boots", "sandals", "watch", "handbag", "cap"]
+CATEGORIES = ["apparel", "footwear", "accessories"]
+GENDERS = ["men", "women", "boys", "girls", "unisex"]
+STYLES = ["casual", "formal", "sports", "ethnic", "party", "smart casual"]
+SEASONS = ["summer", "winter", "fall", "spring"]
+MATERIALS = ["cotton", "denim", "leather", "linen", "wool", "silk", "polyester"]
+
+def _seeded(*parts):
+    """A random.Random seeded from the given values, so outputs depend only on their inputs."""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+# --- OpenAI ---
+class StandInOpenAIClient:
+    """Answers chat.completions.create like GPT-4o describing an image, derived from a hash of the image data."""
+
+    def __init__(self, latency_s=0.0):
+        self.latency_s = latency_s
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        self.calls += 1
+        image_url = next(part["image_url"]["url"] for message in messages for part in message["content"]
+                         if part.get("type") == "image_url")
+        rng = _seeded("openai", model, image_url)
+        description = (f"A {rng.choice(COLORS)} {rng.choice(MATERIALS)} {rng.choice(TYPES)} for {rng.choice(GENDERS)} "
+                       f"in a {rng.choice(STYLES)} style, with a {rng.choice(COLORS)} trim. Suitable for {rng.choice(SEASONS)}.")
+        _sleep(self.latency_s)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=description))])
+
+# --- Gemini ---
+class StandInGenerativeModel:
+    """Replaces google.generativeai.GenerativeModel; generate_content returns refinement JSON derived from the prompt."""
+    latency_s = 0.0
+    calls = 0
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, **kwargs):
+        StandInGenerativeModel.calls += 1
+        words = [word.strip('".,:;()').lower() for word in prompt.split()]
+        vocabulary = set(COLORS + TYPES + STYLES + SEASONS + MATERIALS)
+        found = list(dict.fromkeys(word for word in words if word in vocabulary))
+        rng = _seeded("gemini", self.model_name, prompt)
+        while len(found) < 4:
+            found.append(rng.choice(COLORS + TYPES))
+        attributes = [f"{found[i]} {found[i + 1]}" for i in range(0, min(len(found), 8) - 1, 2)]
+        answer = {"refined_search_query": " ".join(found[:6]), "key_attributes": attributes}
+        _sleep(StandInGenerativeModel.latency_s)
+        return SimpleNamespace(text="```json\n" + json.dumps(answer) + "\n```")
+
+def install_gemini_stand_in(latency_s=0.0):
+    """Points google.generativeai.GenerativeModel at the stand-in (creating the module if the SDK is not installed)."""
+    try:
+        import google.generativeai as genai
+    except ImportError:
+        genai = types.ModuleType("google.generativeai")
+        genai.configure = lambda **kwargs: None
+        google_pkg = sys.modules.get("google") or types.ModuleType("google")
+        sys.modules.setdefault("google", google_pkg)
+        sys.modules["google.generativeai"] = genai
+        google_pkg.generativeai = genai
+    genai.GenerativeModel = StandInGenerativeModel
+    StandInGenerativeModel.latency_s = latency_s
+    # get_refined_search_gemini skips the call entirely without a key
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+
+# --- ViT ---
+def install_tiny_vit(hidden_size=64, seed=0):
+    """Loads a 2-layer ViT with random weights in place of the real model (same 224px input, `hidden_size`-dim output)."""
+    import torch
+    from transformers import ViTConfig, ViTImageProcessor, ViTModel
+    torch.manual_seed(seed)
+    config = ViTConfig(hidden_size=hidden_size, num_hidden_layers=2, num_attention_heads=2,
+                       intermediate_size=hidden_size * 2, image_size=224, patch_size=16)
+    vision_models.image_processor_vit = ViTImageProcessor()
+    vision_models.model_vit = ViTModel(config).to(vision_models.get_device()).eval()
+
+# --- Data ---
+def make_image_bytes(seed, size=48):
+    """A small random JPEG whose colours depend on `seed`."""
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 256, size=3)
+    pixels = np.clip(base + rng.integers(-40, 40, size=(size, size, 3)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+def write_synthetic_catalog(catalog_dir, num_products, unique_images=256, seed=0):
+    """
+    Writes curated_product_catalog.json with `num_products` products (in the prepare_dataset.py format)
+    and `unique_images` shared product images under catalog_dir. Existing catalogs of the same shape are kept.
+    """
+    catalog_path = os.path.join(catalog_dir, product_catalog.DB_METADATA_FILE)
+    stamp_path = os.path.join(catalog_dir, "synthetic.json")
+    stamp = {"num_products": num_products, "unique_images": unique_images, "seed": seed}
+    if os.path.exists(catalog_path) and _read_json(stamp_path) == stamp:
+        return catalog_path
+
+    image_dir = os.path.join(catalog_dir, "static", "product_images_db")
+    os.makedirs(image_dir, exist_ok=True)
+    for image_number in range(unique_images):
+        with open(os.path.join(image_dir, f"{image_number}.jpg"), "wb") as f:
+            f.write(make_image_bytes(seed * 1_000_003 + image_number))
+
+    rng = random.Random(seed)
+    products = []
+    for product_number in range(num_products):
+        color, product_type, gender = rng.choice(COLORS), rng.choice(TYPES), rng.choice(GENDERS)
+        style, season = rng.choice(STYLES), rng.choice(SEASONS)
+        image_path = f"static/product_images_db/{product_number % unique_images}.jpg"
+        products.append({
+            "id": str(100000 + product_number),
+            "name": f"{color.title()} {rng.choice(MATERIALS).title()} {product_type.title()}",
+            "price": f"${rng.randint(10, 250)}.{rng.choice(['00', '49', '99'])}",
+            "description": f"A {gender.title()} {product_type.title()} in {color.title()}. Suitable for {style.title()} during the {season.title()}.",
+            "type": product_type.title(),
+            "category": rng.choice(CATEGORIES).title(),
+            "style": style.title(),
+            "color_tags": [color],
+            "image_path_for_ai": image_path,
+            "images": [f"/{image_path}"],
+        })
+    with open(catalog_path, "w") as f:
+        json.dump(products, f)
+    with open(stamp_path, "w") as f:
+        json.dump(stamp, f)
+    return catalog_path
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def reset_catalog_state():
+    """Forgets the loaded catalog so load_and_preprocess_catalog builds the next one from scratch."""
+    product_catalog.AI_PRODUCT_CATALOG = []
+    product_catalog.CATALOG_EMBEDDING_MATRIX = None
+    product_catalog.CATALOG_EMBEDDING_POSITIONS = None
+    product_catalog.CATALOG_EMBEDDING_IDS = None
+    product_catalog.CATALOG_VECTOR_INDEX = None
+    product_catalog.CATALOG_KEYWORD_INDEX = None
+    product_catalog.CATALOG_POSITIONS_BY_ID = {}
+    product_catalog.CATALOG_VERSION = None
+    # A restarted process would also have to hash the catalog images again
+    image_derivatives.source_hash_cache.clear()
+    image_derivatives.source_widths.clear()
+    image_derivatives._source_widths_saved_counts.clear()
+
+def redirect_state_files(work_dir):
+    """Points the user database and the on-disk LLM/upload caches at work_dir, away from the app's real files."""
+    db.DATABASE_FILENAME = os.path.join(work_dir, "benchmark_users.sqlite3")
+    language_models.LLM_CACHE_DB_FILENAME = os.path.join(work_dir, "benchmark_llm_cache.sqlite3")
+    upload_cache.UPLOAD_CACHE_DB_FILENAME = os.path.join(work_dir, "benchmark_upload_cache.sqlite3")
+    for filename in (db.DATABASE_FILENAME, language_models.LLM_CACHE_DB_FILENAME, upload_cache.UPLOAD_CACHE_DB_FILENAME):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(filename + suffix):
+                os.remove(filename + suffix)
+
+def _sleep(seconds):
+    if seconds > 0:
+        time.sleep(seconds)
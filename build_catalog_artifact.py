@@ -0,0 +1,44 @@
+# build_catalog_artifact.py
+import argparse
+import logging
+import os
+import time
+from flask import Flask
+
+from backend_flask.ai_core.product_catalog import precompute_catalog_artifact
+from backend_flask.image_derivatives import pregenerate_derivatives
+
+# --- Configuration ---
+# Paths relative to where this script is run from (project root), like prepare_dataset.py
+BACKEND_FLASK_DIR = "backend_flask"
+# --- End Configuration ---
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Precompute catalog ViT embeddings and resized product images, and write the columnar catalog artifact loaded by the backend at startup.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="Processes extracting embeddings, each with its own model copy (default: one per core).")
+    parser.add_argument("--skip-image-derivatives", action="store_true",
+                        help="Don't pre-generate resized product images; the backend then creates them on first request.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    started_at = time.perf_counter()
+    print("--- Building Catalog Artifact ---")
+    # A bare app gives the catalog code its logger and root_path without loading the web app, its models or database
+    app = Flask(BACKEND_FLASK_DIR, root_path=os.path.abspath(BACKEND_FLASK_DIR))
+    app.logger.setLevel(logging.INFO)
+    with app.app_context():
+        artifact_dir = precompute_catalog_artifact(num_processes=args.processes)
+    if artifact_dir is None:
+        print("--- Catalog Artifact Build Failed ---")
+        return
+    if not args.skip_image_derivatives:
+        print("Generating resized product images...")
+        image_count, failures = pregenerate_derivatives(app.root_path)
+        print(f"Resized {image_count - failures}/{image_count} product images.")
+    print(f"--- Catalog Artifact Written to {artifact_dir} in {time.perf_counter() - started_at:.1f}s ---")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,20 @@
 # prepare_dataset.py
-import pandas as pd
+import argparse
+import errno
 import json
 import os
 import shutil
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 from tqdm import tqdm # For progress bar, install with: pip install tqdm
 
+try:
+    import fcntl
+except ImportError: # Windows: no reflinks, hard links and copies still work
+    fcntl = None
+
 # --- Configuration ---
 # Paths relative to where this script is run from (project root)
 KAGGLE_DATA_DIR = "kaggle_dataset_raw"
@@ -18,7 +28,14 @@ CURATED_CATALOG_JSON_OUTPUT_PATH = os.path.join(BACKEND_FLASK_DIR, "curated_prod
 CURATED_IMAGES_DB_DIR_RELATIVE_TO_STATIC = "product_images_db"
 CURATED_IMAGES_DB_DIR_ABSOLUTE = os.path.join(BACKEND_FLASK_DIR, "static", CURATED_IMAGES_DB_DIR_RELATIVE_TO_STATIC)
 
-MAX_PRODUCTS_TO_CURATE = 2000  # Adjust as needed for performance
+# Default catalog size for the demo; pass --max-products 0 to curate the whole dataset
+MAX_PRODUCTS_TO_CURATE = 2000
+# Threads used to link or copy images
+COPY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# How images get into the static folder: "auto" tries a hard link, then a reflink (copy-on-write clone), then a copy
+LINK_MODES = ("auto", "hardlink", "reflink", "copy")
+# Linux ioctl that clones a file's extents on filesystems such as Btrfs and XFS
+FICLONE = 0x40049409
 
 # --- End Configuration ---
 
@@ -27,82 +44,166 @@ def ensure_dir_exists(dir_path):
         os.makedirs(dir_path)
         print(f"Created directory: {dir_path}")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the curated product catalog from the Kaggle fashion dataset.")
+    parser.add_argument("--max-products", type=int, default=MAX_PRODUCTS_TO_CURATE,
+                        help=f"Products to curate (default {MAX_PRODUCTS_TO_CURATE}; 0 for the whole dataset).")
+    parser.add_argument("--workers", type=int, default=COPY_WORKERS, help="Threads used to link or copy images.")
+    parser.add_argument("--link-mode", choices=LINK_MODES, default="auto", help="How images are placed in the static folder.")
+    return parser.parse_args()
+
+# --- Product records ---
+def column_as_str(df, name, default):
+    """The column as strings (missing values become "nan", as str() did per row), or `default` if the column is absent."""
+    if name in df.columns:
+        return df[name].map(str)
+    return pd.Series(default, index=df.index, dtype=object)
+
+def build_product_records(df):
+    """Builds the catalog entries for every row of `df` at once."""
+    ids = df['id']
+    image_path_for_ai = "static/" + CURATED_IMAGES_DB_DIR_RELATIVE_TO_STATIC + "/" + ids + ".jpg"
+    gender, article_type = column_as_str(df, 'gender', ''), column_as_str(df, 'articleType', '')
+    base_colour, usage = column_as_str(df, 'baseColour', ''), column_as_str(df, 'usage', 'casual wear')
+    season = column_as_str(df, 'season', 'all seasons')
+    colours = df['baseColour'] if 'baseColour' in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+    records = pd.DataFrame({
+        "id": ids,
+        "name": df['productDisplayName'].map(str) if 'productDisplayName' in df.columns else "Item " + ids,
+        # A plausible-looking price for the demo, stable across runs (crc32, unlike hash(), is not salted per process)
+        "price": "$" + ids.map(lambda product_id: str((zlib.crc32(product_id.encode()) % 180) + 19)) + ".99",
+        "description": "A " + gender + " " + article_type + " in " + base_colour + ". Suitable for " + usage + " during the " + season + ".",
+        "type": column_as_str(df, 'articleType', 'Unknown'),
+        "category": column_as_str(df, 'masterCategory', 'Unknown'),
+        "style": column_as_str(df, 'usage', 'N/A'),
+        "color_tags": [[str(colour).lower()] if pd.notna(colour) else [] for colour in colours],
+        "image_path_for_ai": image_path_for_ai, # e.g., "static/product_images_db/1163.jpg"
+        "images": [[f"/{path}"] for path in image_path_for_ai], # e.g., ["/static/product_images_db/1163.jpg"]
+        "embedding": None, # Placeholder for ViT embedding
+    })
+    return records.to_dict(orient="records")
+
+# --- Image placement ---
+def _reflink(source, destination):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported on this platform")
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destination)
+            raise
+    shutil.copystat(source, destination)
+
+def is_up_to_date(source, destination):
+    """True if destination is the same file, or a copy with the same size and modification time."""
+    try:
+        dst_stat = os.stat(destination)
+    except FileNotFoundError:
+        return False
+    src_stat = os.stat(source)
+    if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+        return True
+    return src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+def place_image(source, destination, link_mode):
+    """Links or copies one image unless an identical one is already there. Returns how it was placed."""
+    if is_up_to_date(source, destination):
+        return "unchanged"
+    if os.path.lexists(destination):
+        os.remove(destination)
+    attempts = {"auto": ("hardlink", "reflink", "copy")}.get(link_mode, (link_mode,))
+    for method in attempts:
+        try:
+            if method == "hardlink":
+                os.link(source, destination)
+            elif method == "reflink":
+                _reflink(source, destination)
+            else:
+                shutil.copy2(source, destination)
+            return method
+        except OSError:
+            # Cross-device links, unsupported reflinks, ...: fall through to the next method in "auto" mode
+            if method == attempts[-1]:
+                raise
+    return None
+
+def place_images(product_ids, workers, link_mode):
+    """Places every product's image in the static folder on a thread pool. Returns {method: count}."""
+    def place(product_id):
+        filename = f"{product_id}.jpg"
+        return place_image(os.path.join(KAGGLE_IMAGES_DIR, filename), os.path.join(CURATED_IMAGES_DB_DIR_ABSOLUTE, filename), link_mode)
+
+    counts = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for method in tqdm(executor.map(place, product_ids), total=len(product_ids), desc="Placing images"):
+            counts[method] = counts.get(method, 0) + 1
+    return counts
+
+def write_if_changed(path, content):
+    """Writes `content` atomically unless the file already holds it, so unchanged catalogs keep their mtime
+    (the backend's embedding store and catalog snapshots are keyed on it). Returns True if the file was written."""
+    try:
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
 def main():
+    args = parse_args()
+    started_at = time.perf_counter()
     print("--- Starting Dataset Preparation ---")
 
     # 1. Ensure output directories exist
     ensure_dir_exists(CURATED_IMAGES_DB_DIR_ABSOLUTE)
-    
+
     # 2. Check for and read styles.csv
     if not os.path.exists(STYLES_CSV_FILE):
         print(f"ERROR: {STYLES_CSV_FILE} not found. Please place it in {KAGGLE_DATA_DIR}/")
         return
-    
+
     print(f"Reading {STYLES_CSV_FILE}...")
     try:
-        # Use error_bad_lines=False for newer pandas versions if on_bad_lines is deprecated
         df = pd.read_csv(STYLES_CSV_FILE, on_bad_lines='skip')
         print(f"Successfully read {len(df)} rows from styles.csv.")
     except Exception as e:
         print(f"Error reading {STYLES_CSV_FILE}: {e}")
         return
 
-    # 3. Curate products and copy their images
-    print(f"Curating up to {MAX_PRODUCTS_TO_CURATE} products and copying images...")
-    curated_products_list = []
-    added_product_ids = set()
-
-    # Use tqdm for a nice progress bar
-    for _, row in tqdm(df.iterrows(), total=min(len(df), MAX_PRODUCTS_TO_CURATE), desc="Processing products"):
-        if len(curated_products_list) >= MAX_PRODUCTS_TO_CURATE:
-            break
-
-        product_id_csv = str(row['id'])
-        if product_id_csv in added_product_ids:
-            continue
-
-        original_image_filename = f"{product_id_csv}.jpg"
-        path_to_original_image = os.path.join(KAGGLE_IMAGES_DIR, original_image_filename)
-
-        if os.path.exists(path_to_original_image):
-            # Copy image to the backend's static directory
-            shutil.copy2(path_to_original_image, CURATED_IMAGES_DB_DIR_ABSOLUTE)
-
-            # Define paths for the JSON catalog. These must be web-accessible.
-            # Path for AI processing (relative to backend_flask root)
-            image_path_for_ai = os.path.join("static", CURATED_IMAGES_DB_DIR_RELATIVE_TO_STATIC, original_image_filename).replace("\\", "/")
-            # Path for frontend display (URL path)
-            web_image_path = f"/{image_path_for_ai}"
-
-            # Create a structured product entry
-            product_entry = {
-                "id": product_id_csv,
-                "name": str(row.get('productDisplayName', f"Item {product_id_csv}")),
-                # Generate a plausible-looking random price for the demo
-                "price": f"${(abs(hash(product_id_csv)) % 180) + 19}.99",
-                "description": f"A {row.get('gender', '')} {row.get('articleType', '')} in {row.get('baseColour', '')}. Suitable for {row.get('usage', 'casual wear')} during the {row.get('season', 'all seasons')}.",
-                "type": str(row.get('articleType', 'Unknown')),
-                "category": str(row.get('masterCategory', 'Unknown')),
-                "style": str(row.get('usage', 'N/A')),
-                "color_tags": [str(row.get('baseColour', '')).lower()] if pd.notna(row.get('baseColour')) else [],
-                "image_path_for_ai": image_path_for_ai, # e.g., "static/product_images_db/1163.jpg"
-                "images": [web_image_path], # e.g., ["/static/product_images_db/1163.jpg"]
-                "embedding": None # Placeholder for ViT embedding
-            }
-            curated_products_list.append(product_entry)
-            added_product_ids.add(product_id_csv)
-            
-    # 4. Save the curated catalog to a JSON file
+    # 3. Keep the first row per id whose image exists (one directory listing instead of a stat per product)
+    df['id'] = df['id'].map(str)
+    df = df.drop_duplicates(subset='id', keep='first')
+    available_ids = {entry.name[:-len(".jpg")] for entry in os.scandir(KAGGLE_IMAGES_DIR) if entry.name.endswith(".jpg")}
+    df = df[df['id'].isin(available_ids)]
+    if args.max_products > 0:
+        df = df.head(args.max_products)
+    print(f"Curating {len(df)} products with images...")
+    curated_products_list = build_product_records(df)
+
+    # 4. Link or copy their images; images already in place are skipped
+    placement_counts = place_images(df['id'].tolist(), args.workers, args.link_mode)
+    print("Images: " + ", ".join(f"{count} {method}" for method, count in sorted(placement_counts.items())))
+
+    # 5. Save the curated catalog to a JSON file
     print(f"Saving {len(curated_products_list)} curated products to {CURATED_CATALOG_JSON_OUTPUT_PATH}...")
     try:
-        with open(CURATED_CATALOG_JSON_OUTPUT_PATH, 'w') as f:
-            json.dump(curated_products_list, f, indent=2)
-        print("Curated product catalog saved successfully.")
+        if write_if_changed(CURATED_CATALOG_JSON_OUTPUT_PATH, json.dumps(curated_products_list, indent=2)):
+            print("Curated product catalog saved successfully.")
+        else:
+            print("Curated product catalog is unchanged.")
     except Exception as e:
         print(f"Error saving curated catalog JSON: {e}")
         return
-    
-    print(f"--- Dataset Preparation Complete ---")
+
+    print(f"--- Dataset Preparation Complete in {time.perf_counter() - started_at:.1f}s ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,45 @@
+import os
+from PIL import Image
+
+from backend_flask import image_derivatives
+from backend_flask.image_derivatives import PRODUCT_IMAGES_DIR, product_images_meta, product_images_match
+
+def _write_image(path, colour):
+    Image.new("RGB", (8, 8), colour).save(path, format="JPEG")
+
+def test_product_images_match_detects_replaced_images(tmp_path):
+    images_dir = tmp_path / PRODUCT_IMAGES_DIR
+    images_dir.mkdir(parents=True)
+    _write_image(images_dir / "1.jpg", "red")
+    _write_image(images_dir / "2.jpg", "blue")
+    recorded = product_images_meta(str(tmp_path))
+    assert product_images_match(recorded, str(tmp_path))
+
+    # Touched but identical (e.g. copied to another host): still matches by content
+    os.utime(images_dir / "1.jpg", ns=(1, 1))
+    assert product_images_match(recorded, str(tmp_path))
+
+    _write_image(images_dir / "2.jpg", "green")
+    assert not product_images_match(recorded, str(tmp_path))
+
+    recorded = product_images_meta(str(tmp_path))
+    _write_image(images_dir / "3.jpg", "white")
+    assert not product_images_match(recorded, str(tmp_path))
+    assert not product_images_match(None, str(tmp_path))
+
+def test_offered_widths_are_saved_by_content_hash(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_derivatives, "source_widths", {})
+    monkeypatch.setattr(image_derivatives, "_source_widths_saved_counts", {})
+    source_path = tmp_path / "1.jpg"
+    Image.new("RGB", (400, 100)).save(source_path, format="JPEG")
+    content_hash = image_derivatives.source_content_hash(str(source_path))
+    offered = image_derivatives.offered_widths(str(source_path), content_hash)
+    assert offered == {120: 120, 320: 320, 400: 640}
+    image_derivatives.save_source_widths(str(tmp_path))
+
+    # A restarted process knows the width from the saved file and does not open the image again
+    monkeypatch.setattr(image_derivatives, "source_widths", {})
+    monkeypatch.setattr(image_derivatives, "_source_widths_saved_counts", {})
+    image_derivatives.load_source_widths(str(tmp_path))
+    source_path.unlink()
+    assert image_derivatives.offered_widths(str(source_path), content_hash) == offered
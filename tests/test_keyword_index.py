@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from backend_flask.ai_core.keyword_index import KeywordIndex, product_text_corpus
+
+PRODUCTS = [
+    {"name": "Red Summer Dress", "description": "A women dress in red.", "type": "Dresses", "category": "Apparel", "color_tags": ["red"]},
+    {"name": "Blue Denim Jacket", "description": "A men jacket in blue.", "type": "Jackets", "category": "Apparel", "color_tags": ["blue"]},
+    {"name": "Redwood Sandals", "description": "A unisex sandal in brown.", "type": "", "category": "Footwear", "color_tags": []},
+    {"name": "Plain Tee", "description": "", "type": "Tshirts", "category": "Apparel"},
+    {"name": "Tab\tSeparated  Name", "description": "A women bag in nan.", "type": "Handbags", "category": "Accessories", "color_tags": ["nan"]},
+    {},
+]
+KEYWORDS = ["", " ", "  ", "\t", "red", "Red", " red", "red ", "ed dr", "dress in red", "in", "a", "nan", "apparel",
+            "separated  name", "tab\tseparated", "sandal in brown", "denim jacket", "jacket in blue.", "missing", "x y"]
+
+def _expected_positions(products, keyword):
+    return np.array([position for position, product in enumerate(products) if keyword in product_text_corpus(product)], dtype=np.int64)
+
+@pytest.fixture(params=["built", "loaded"])
+def keyword_index(request, tmp_path):
+    index = KeywordIndex.build(PRODUCTS)
+    if request.param == "loaded":
+        index.save(str(tmp_path / "keywords"))
+        index = KeywordIndex.load(str(tmp_path / "keywords"), PRODUCTS, mmap_mode="r")
+    return index
+
+@pytest.mark.parametrize("keyword", KEYWORDS)
+def test_match_positions_equals_substring_matching(keyword_index, keyword):
+    assert keyword_index.match_positions(keyword).tolist() == _expected_positions(PRODUCTS, keyword).tolist()
+
+def test_match_counts_equals_substring_matching(keyword_index):
+    counts = np.zeros(len(PRODUCTS), dtype=np.int64)
+    for keyword in KEYWORDS:
+        counts[_expected_positions(PRODUCTS, keyword)] += 1
+    positions, match_counts = keyword_index.match_counts(KEYWORDS + [None])
+    assert positions.tolist() == np.flatnonzero(counts).tolist()
+    assert match_counts.tolist() == counts[counts > 0].tolist()
+
+def test_whitespace_keyword_does_not_match_every_product(keyword_index):
+    assert 0 < keyword_index.match_positions("  ").size < len(PRODUCTS)
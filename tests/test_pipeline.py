@@ -0,0 +1,37 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+
+from backend_flask.ai_core import pipeline
+from backend_flask.ai_core.pipeline import PipelineStage, run_pipeline
+
+def test_hung_remote_stages_do_not_starve_local_stages(monkeypatch):
+    monkeypatch.setattr(pipeline, "remote_stage_executor", ThreadPoolExecutor(max_workers=2))
+    monkeypatch.setattr(pipeline, "local_stage_executor", ThreadPoolExecutor(max_workers=2))
+    release = threading.Event()
+    app = Flask(__name__)
+    try:
+        # Fill the remote pool with calls that outlive their stage timeout
+        with app.app_context():
+            for _ in range(2):
+                _, _, statuses = run_pipeline([PipelineStage("refinement", release.wait, timeout=0.05, default={}, remote=True)])
+                assert statuses["refinement"] == "timeout"
+            results, _, statuses = run_pipeline([PipelineStage("embedding", lambda: [1.0], timeout=1)])
+        assert statuses["embedding"] == "ok"
+        assert results["embedding"] == [1.0]
+    finally:
+        release.set()
+
+def test_stage_timeout_starts_when_the_stage_runs(monkeypatch):
+    monkeypatch.setattr(pipeline, "local_stage_executor", ThreadPoolExecutor(max_workers=1))
+    stages = [
+        PipelineStage("slow", lambda: time.sleep(0.3) or "slow", timeout=1),
+        # Queued behind "slow" for longer than its own timeout, but fast once it runs
+        PipelineStage("queued", lambda: "queued", timeout=0.2),
+    ]
+    with Flask(__name__).app_context():
+        results, timings, statuses = run_pipeline(stages)
+    assert statuses == {"slow": "ok", "queued": "ok"}
+    assert results["queued"] == "queued"
+    assert timings["queued"] >= 200
@@ -0,0 +1,36 @@
+import time
+from flask import Flask
+
+from backend_flask.ai_core.language_models import get_refined_search_gemini, is_reusable_refinement, REFINEMENT_UNAVAILABLE
+from backend_flask.ai_core.pipeline import PipelineStage, run_pipeline
+
+def _run_refinement(func, timeout=5):
+    stages = [PipelineStage("refinement", func, timeout=timeout, default=REFINEMENT_UNAVAILABLE)]
+    with Flask(__name__).app_context():
+        results, _, statuses = run_pipeline(stages)
+    return results["refinement"], statuses["refinement"]
+
+def _fail():
+    raise RuntimeError("Gemini unavailable")
+
+def test_timed_out_or_failed_refinement_is_not_reused():
+    refinement, status = _run_refinement(lambda: time.sleep(1) or {"key_attributes": ["red"]}, timeout=0.05)
+    assert status == "timeout"
+    assert not is_reusable_refinement(refinement)
+
+    refinement, status = _run_refinement(_fail)
+    assert status == "error"
+    assert not is_reusable_refinement(refinement)
+
+def test_refinement_without_api_key_is_reused(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    refinement, status = _run_refinement(lambda: get_refined_search_gemini("N/A", "red summer dress"))
+    assert status == "ok"
+    assert "error" in refinement
+    assert is_reusable_refinement(refinement)
+
+def test_well_formed_refinement_is_reused():
+    assert is_reusable_refinement({})
+    assert is_reusable_refinement({"refined_search_query": "red dress", "key_attributes": ["red"]})
+    assert not is_reusable_refinement({"raw_text": "...", "error": "Gemini response was not valid JSON."})
+    assert not is_reusable_refinement("N/A")
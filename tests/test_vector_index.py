@@ -0,0 +1,57 @@
+import numpy as np
+from flask import Flask
+
+from backend_flask.ai_core import product_catalog
+
+def _normalized(rng, n, dim):
+    matrix = rng.standard_normal((n, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+def _count_builds(monkeypatch):
+    builds = []
+    build_vector_index = product_catalog.build_vector_index
+    def counting_build(*args, **kwargs):
+        builds.append(args[0])
+        return build_vector_index(*args, **kwargs)
+    monkeypatch.setattr(product_catalog, "build_vector_index", counting_build)
+    return builds
+
+def test_saved_ivf_index_uses_current_nprobe(tmp_path, monkeypatch):
+    matrix = _normalized(np.random.default_rng(0), 2000, 32)
+    catalog_file_path = str(tmp_path / product_catalog.DB_METADATA_FILE)
+    app = Flask("backend_flask", root_path=str(tmp_path))
+
+    monkeypatch.setattr(product_catalog, "VECTOR_INDEX_KIND", "ivf")
+    monkeypatch.setattr(product_catalog, "VECTOR_INDEX_NPROBE", 16)
+    builds = _count_builds(monkeypatch)
+    with app.app_context():
+        built = product_catalog._load_or_build_vector_index(catalog_file_path, matrix)
+    assert built.nprobe == 16
+
+    # Restart with another nprobe: the saved index is reused but searched with the new value
+    monkeypatch.setattr(product_catalog, "VECTOR_INDEX_NPROBE", 2)
+    with app.app_context():
+        reloaded = product_catalog._load_or_build_vector_index(catalog_file_path, matrix)
+    assert builds == ["ivf"]
+    assert reloaded.nprobe == 2
+    assert np.array_equal(reloaded.centroids, built.centroids)
+
+    query = matrix[0]
+    rows, _ = reloaded.search(query, 10)
+    expected_rows, _ = built.search(query, 10, nprobe=2)
+    assert np.array_equal(rows, expected_rows)
+
+def test_saved_index_is_matched_by_recorded_embeddings_digest(tmp_path, monkeypatch):
+    matrix = _normalized(np.random.default_rng(1), 1000, 32)
+    catalog_file_path = str(tmp_path / product_catalog.DB_METADATA_FILE)
+    app = Flask("backend_flask", root_path=str(tmp_path))
+    monkeypatch.setattr(product_catalog, "VECTOR_INDEX_KIND", "ivf")
+    monkeypatch.setattr(product_catalog, "EMBEDDING_DIGEST_BLOCK_ROWS", 300)
+    builds = _count_builds(monkeypatch)
+
+    with app.app_context():
+        built = product_catalog._load_or_build_vector_index(catalog_file_path, matrix)
+        # Artifacts record the digest when written; the saved index is found without hashing the matrix again
+        reloaded = product_catalog._load_or_build_vector_index(catalog_file_path, matrix, product_catalog._embeddings_digest(matrix))
+    assert builds == ["ivf"]
+    assert np.array_equal(reloaded.centroids, built.centroids)